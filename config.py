@@ -32,6 +32,8 @@ class Config:
         "ALLOWED_EXTENSIONS", "pdf,png,jpg,jpeg"
     ).split(",")
     MAX_BATCH_SIZE: int = 50
+    MAX_PROCESSING_WORKERS: int = int(os.getenv("MAX_PROCESSING_WORKERS", "4"))
+    MAX_OCR_CONCURRENCY: int = int(os.getenv("MAX_OCR_CONCURRENCY", "2"))
 
     # Google Gemini API
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
@@ -49,6 +51,11 @@ class Config:
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(
         os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
     )
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))  # lower in development
+
+    # Compute VAT splits with Decimal instead of integer cents; only differs
+    # for inputs with more than two decimals
+    STRICT_DECIMAL: bool = os.getenv("STRICT_DECIMAL", "False").lower() == "true"
 
     # Dutch VAT rates
     VAT_RATES = {
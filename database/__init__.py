@@ -1,6 +1,6 @@
 """Database package initialization."""
 
 from .models import Base, Receipt, ExtractedData, User
-from .connection import get_db, engine, SessionLocal
+from .connection import get_db, db_session, transaction, engine, SessionLocal
 
-__all__ = ["Base", "Receipt", "ExtractedData", "User", "get_db", "engine", "SessionLocal"]
\ No newline at end of file
+__all__ = ["Base", "Receipt", "ExtractedData", "User", "get_db", "db_session", "transaction", "engine", "SessionLocal"]
\ No newline at end of file
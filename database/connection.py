@@ -3,22 +3,25 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
-from typing import Generator
+from contextlib import contextmanager
+from typing import Generator, Iterator
 import logging
 
 from config import Config
-from .models import Base
+from .models import Base, ix_receipts_user_date, ix_extracted_category_total
 
 logger = logging.getLogger(__name__)
 
 # Create database engine
 if "sqlite" in Config.DATABASE_URL:
-    # For SQLite (development/testing)
+    # For SQLite (development/testing). A file database gets a regular pool so
+    # batch worker threads don't share one connection; in-memory needs StaticPool.
+    sqlite_kwargs = {"poolclass": StaticPool} if ":memory:" in Config.DATABASE_URL else {}
     engine = create_engine(
         Config.DATABASE_URL,
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-        echo=Config.DEBUG
+        echo=Config.DEBUG,
+        **sqlite_kwargs
     )
 else:
     # For PostgreSQL (production)
@@ -30,6 +33,10 @@ else:
         echo=Config.DEBUG
     )
 
+# Indexes added after their tables' first release; create_all skips tables
+# that already exist, so init_db creates these separately
+_ADDED_INDEXES = (ix_receipts_user_date, ix_extracted_category_total)
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -46,10 +53,48 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+@contextmanager
+def db_session() -> Iterator[Session]:
+    """
+    Check a database session out of the pool for a with-block.
+
+    The session is rolled back if the block raises and is always closed,
+    returning its connection to the pool.
+
+    Yields:
+        Database session
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@contextmanager
+def transaction() -> Iterator[Session]:
+    """
+    Run a with-block as a single unit of work.
+
+    Pass the yielded session to the database_utils helpers (db=...) so their
+    writes share one transaction; it is committed when the block exits and
+    rolled back if it raises.
+
+    Yields:
+        Database session
+    """
+    with db_session() as db:
+        yield db
+        db.commit()
+
 def init_db():
     """Initialize database by creating all tables."""
     try:
         Base.metadata.create_all(bind=engine)
+        for index in _ADDED_INDEXES:
+            index.create(bind=engine, checkfirst=True)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
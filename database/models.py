@@ -5,7 +5,7 @@ from decimal import Decimal
 from typing import Optional
 from sqlalchemy import (
     Column, Integer, String, DateTime, Date, ForeignKey,
-    Text, Numeric, Boolean, JSON, Float
+    Text, Numeric, Boolean, JSON, Float, Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -98,6 +98,9 @@ class Receipt(Base):
     extracted_data = relationship("ExtractedData", back_populates="receipt", uselist=False, cascade="all, delete-orphan")
     audit_logs = relationship("AuditLog", back_populates="receipt", cascade="all, delete-orphan")
 
+# Covers the receipt search/listing filters and their newest-first ordering
+ix_receipts_user_date = Index('ix_receipts_user_date', Receipt.user_id, Receipt.is_deleted, Receipt.upload_date.desc())
+
 class ExtractedData(Base):
     """Extracted data from receipts."""
 
@@ -158,6 +161,9 @@ class ExtractedData(Base):
     # Relationships
     receipt = relationship("Receipt", back_populates="extracted_data")
 
+# Covers the category and amount range filters of the receipt search
+ix_extracted_category_total = Index('ix_extracted_category_total', ExtractedData.expense_category, ExtractedData.total_incl_vat)
+
 class AuditLog(Base):
     """Audit log for tracking all changes to receipts and extracted data."""
 
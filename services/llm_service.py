@@ -2,6 +2,8 @@
 
 import logging
 import json
+import hashlib
+import threading
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 import google.generativeai as genai
@@ -9,8 +11,15 @@ from PIL import Image
 import PyPDF2
 import time
 from google.api_core import exceptions as google_exceptions
+from cachetools import TTLCache
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Fall back to PyPDF2 text extraction
+    pdfium = None
 
 from config import Config
+from utils.batcher import Batcher
 from utils.database_utils import get_category_tax_rules, ensure_user_settings_exists
 from services.exchange_rate_service import get_exchange_rate_service
 from datetime import datetime, date
@@ -18,14 +27,120 @@ from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
+# Bump when the category prompt or list changes to invalidate cached answers
+CATEGORY_CACHE_VERSION = '1'
+
+# Process-wide cache of LLM answers for recurring receipts (e.g. same vendor)
+_LLM_CACHE = TTLCache(maxsize=10000, ttl=86400)
+_LLM_CACHE_LOCK = threading.Lock()
+
+def _category_cache_key(structured_data: Dict) -> str:
+    """Build the cache key for a category lookup from vendor and amount bucket."""
+    try:
+        amount_bucket = round(float(structured_data.get('total_amount') or 0) / 10)
+    except (TypeError, ValueError):
+        amount_bucket = None
+
+    payload = json.dumps({
+        'vendor': (structured_data.get('vendor_name') or '').lower().strip(),
+        'amount_bucket': amount_bucket,
+        'cat_version': CATEGORY_CACHE_VERSION
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cached_llm_call(key: str, fn, *args, **kwargs):
+    """
+    Return the cached result for key, calling fn to fill the cache on a miss.
+
+    Args:
+        key: Cache key for the request
+        fn: Callable producing the result
+
+    Returns:
+        Cached or freshly computed result
+    """
+    with _LLM_CACHE_LOCK:
+        if key in _LLM_CACHE:
+            return _LLM_CACHE[key]
+
+    result = fn(*args, **kwargs)
+
+    if result is not None:
+        with _LLM_CACHE_LOCK:
+            _LLM_CACHE[key] = result
+    return result
+
+# Seconds to wait for a batched category answer. _call_with_retry may make
+# 51 attempts 5 s apart; allow each attempt up to a minute on top of that.
+CATEGORY_TIMEOUT_SECONDS = 51 * (5 + 60)
+
+# Category batchers per Gemini model name, shared by all LLMService instances
+# so concurrent receipts are combined into one call
+_category_batchers: Dict[str, Batcher] = {}
+_category_batchers_lock = threading.Lock()
+
+def _get_category_batcher(service: "LLMService") -> Batcher:
+    """
+    Return the category batcher for the service's model, creating it on first use.
+
+    The batcher calls the first instance's _request_categories. Every
+    instance of a model is interchangeable: the API key is configured
+    process-wide by genai.configure.
+    """
+    with _category_batchers_lock:
+        batcher = _category_batchers.get(service.MODEL_NAME)
+        if batcher is None:
+            batcher = _category_batchers[service.MODEL_NAME] = Batcher(
+                service._request_categories,
+                max_batch=16,
+                max_wait_ms=50,
+                queue_size=64
+            )
+    return batcher
+
 class LLMService:
-    """Service for 3-step Gemini processing: Image→Text→Structured Data→Category."""
+    """
+    Service for 3-step Gemini processing: Image→Text→Structured Data→Category.
+
+    Prompts keep their static instructions first and the receipt-specific
+    content last. Gemini caches repeated prompt prefixes implicitly, so
+    the shared prefix must stay byte-identical between calls: do not
+    interpolate per-receipt values (dates, amounts, names) above the
+    receipt section.
+    """
+
+    CATEGORIES = [
+        "Beroepskosten",
+        "Kantoorkosten",
+        "Reis- en verblijfkosten",
+        "Representatiekosten - Type 1 (Supermarket)",
+        "Representatiekosten - Type 2 (Horeca)",
+        "Vervoerskosten",
+        "Zakelijke opleidingskosten"
+    ]
+
+    CATEGORY_GUIDELINES = """Available Categories:
+{categories}
+
+Category Guidelines:
+1. Beroepskosten: Professional tools, equipment, software, electronics for work
+2. Kantoorkosten: Office supplies, stationery, small office items
+3. Reis- en verblijfkosten: Travel expenses, accommodation, hotels
+4. Representatiekosten - Type 1 (Supermarket): Food/drinks from supermarkets (Albert Heijn, Jumbo, Lidl, etc.)
+5. Representatiekosten - Type 2 (Horeca): Restaurant, cafe, bar expenses
+6. Vervoerskosten: Fuel, parking, public transport, taxi
+7. Zakelijke opleidingskosten: Training courses, books, educational materials""".format(
+        categories='\n'.join(f"  {i+1}. {cat}" for i, cat in enumerate(CATEGORIES))
+    )
+
+    # Gemini model used for every step; category batchers are keyed on it
+    MODEL_NAME = 'gemini-2.5-flash-lite'
 
     def __init__(self):
         """Initialize the LLM service."""
         if Config.GEMINI_API_KEY:
             genai.configure(api_key=Config.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+            self.model = genai.GenerativeModel(self.MODEL_NAME)
         else:
             logger.warning("Gemini API key not configured")
             self.model = None
@@ -110,17 +225,21 @@ class LLMService:
                 image = Image.open(file_path)
                 raw_text = self._extract_raw_text(image)
 
-            # STEP 2: Raw Text to Structured Data
-            logger.info("Step 2: Converting raw text to structured data with Gemini")
-            structured_data = self._text_to_structured_data(raw_text)
+            # STEP 2: Raw Text to Structured Data (the category is asked in the same call)
+            logger.info("Step 2: Converting raw text to structured data and category with Gemini")
+            structured_data = self._text_to_structured_data(raw_text, with_category=True)
+            merged_category = structured_data.pop('category', None)
 
             # STEP 2.5: Handle Currency Conversion (if needed)
             logger.info("Step 2.5: Checking for foreign currency and converting to EUR")
             structured_data = self._handle_currency_conversion(structured_data)
 
-            # STEP 3: Extract Category
-            logger.info("Step 3: Extracting category from structured data with Gemini")
-            category = self._extract_category(structured_data)
+            # STEP 3: Extract Category (separate call only if step 2 gave no valid one)
+            if merged_category in self.CATEGORIES:
+                category = merged_category
+            else:
+                logger.info("Step 3: Extracting category from structured data with Gemini")
+                category = self._extract_category(structured_data)
             structured_data['category'] = category
 
             # STEP 4: Apply rule-based BTW/IB percentages
@@ -177,24 +296,29 @@ Return only the raw text, line by line as it appears on the receipt.
         response = self._call_with_retry(self.model.generate_content, [prompt, image])
         return response.text
 
-    def _text_to_structured_data(self, raw_text: str) -> Dict:
+    def _text_to_structured_data(self, raw_text: str, with_category: bool = False) -> Dict:
         """
         STEP 2: Convert raw text to structured data using Gemini.
 
         Args:
             raw_text: Raw text from receipt
+            with_category: Also ask for the expense category (STEP 3) in the
+                same call, returned under the 'category' key
 
         Returns:
             Structured data dictionary
         """
-        prompt = f"""
-Analyze this receipt text and extract structured information.
+        category_field = ''
+        category_rules = ''
+        if with_category:
+            category_field = '\n    "category": "Expense category, exactly as listed below",'
+            category_rules = f"\n\n{self.CATEGORY_GUIDELINES}\n"
 
-Receipt text:
-{raw_text}
+        prompt = f"""
+Analyze the receipt text at the end of this prompt and extract structured information.
 
 Extract and return the following information in JSON format:
-{{
+{{{category_field}
     "vendor_name": "Store/company name",
     "vendor_address": "Full address (include country if visible)",
     "date": "Transaction date in YYYY-MM-DD format",
@@ -235,8 +359,11 @@ IMPORTANT RULES:
 - VAT rates vary by country - extract the rate shown on the receipt
 - Date format must be YYYY-MM-DD
 - If unsure about a value, set confidence lower
-
+{category_rules}
 Return ONLY valid JSON, no additional text.
+
+Receipt text:
+{raw_text}
 """
         response = self._call_with_retry(self.model.generate_content, prompt)
         return self._parse_json_response(response.text)
@@ -387,55 +514,109 @@ Return ONLY valid JSON, no additional text.
         """
         STEP 3: Extract expense category using Gemini.
 
+        Results are cached per vendor and amount bucket, so recurring
+        vendors skip the Gemini round-trip.
+
         Args:
             structured_data: Structured receipt data
 
         Returns:
             Category name from predefined list
         """
-        categories = [
-            "Beroepskosten",
-            "Kantoorkosten",
-            "Reis- en verblijfkosten",
-            "Representatiekosten - Type 1 (Supermarket)",
-            "Representatiekosten - Type 2 (Horeca)",
-            "Vervoerskosten",
-            "Zakelijke opleidingskosten"
-        ]
-
-        categories_str = '\n'.join(f"  {i+1}. {cat}" for i, cat in enumerate(categories))
+        if not structured_data.get('vendor_name'):
+            category = self._request_category(structured_data)
+        else:
+            category = cached_llm_call(
+                _category_cache_key(structured_data),
+                self._request_category,
+                structured_data
+            )
+        return category or "Kantoorkosten"
+
+    def _request_category(self, structured_data: Dict) -> Optional[str]:
+        """
+        Ask Gemini for the expense category of a receipt.
+
+        Concurrent requests from all instances are batched into a single
+        Gemini call.
+
+        Args:
+            structured_data: Structured receipt data
+
+        Returns:
+            Category name, or None if Gemini returned an unknown category
+        """
+        return _get_category_batcher(self).run(structured_data, timeout=CATEGORY_TIMEOUT_SECONDS)
 
+    def _request_categories(self, receipts: List[Dict]) -> List[Optional[str]]:
+        """
+        Ask Gemini for the expense categories of one or more receipts.
+
+        Args:
+            receipts: Structured receipt data per receipt
+
+        Returns:
+            Category name per receipt, None where Gemini returned an unknown category
+        """
+        if len(receipts) > 1:
+            return self._request_categories_batched(receipts)
+
+        structured_data = receipts[0]
         prompt = f"""
-Based on this receipt information, determine the expense category for Dutch freelance tax purposes.
+Based on the receipt information at the end of this prompt, determine the expense category for Dutch freelance tax purposes.
+
+{self.CATEGORY_GUIDELINES}
+
+Return ONLY the category name exactly as listed above, nothing else.
 
 Receipt Data:
 - Vendor: {structured_data.get('vendor_name', 'Unknown')}
 - Items: {json.dumps(structured_data.get('items', []), ensure_ascii=False)}
 - Total: €{structured_data.get('total_amount', 0)}
-
-Available Categories:
-{categories_str}
-
-Category Guidelines:
-1. Beroepskosten: Professional tools, equipment, software, electronics for work
-2. Kantoorkosten: Office supplies, stationery, small office items
-3. Reis- en verblijfkosten: Travel expenses, accommodation, hotels
-4. Representatiekosten - Type 1 (Supermarket): Food/drinks from supermarkets (Albert Heijn, Jumbo, Lidl, etc.)
-5. Representatiekosten - Type 2 (Horeca): Restaurant, cafe, bar expenses
-6. Vervoerskosten: Fuel, parking, public transport, taxi
-7. Zakelijke opleidingskosten: Training courses, books, educational materials
-
-Return ONLY the category name exactly as listed above, nothing else.
 """
         response = self._call_with_retry(self.model.generate_content, prompt)
         category = response.text.strip()
 
         # Validate category
-        if category not in categories:
+        if category not in self.CATEGORIES:
             logger.warning(f"Invalid category '{category}', defaulting to Kantoorkosten")
-            return "Kantoorkosten"
+            return [None]
+
+        return [category]
+
+    def _request_categories_batched(self, receipts: List[Dict]) -> List[Optional[str]]:
+        """Categorize several receipts with one Gemini call."""
+        receipts_str = '\n'.join(
+            f"{i}. Vendor: {data.get('vendor_name', 'Unknown')} | "
+            f"Items: {json.dumps(data.get('items', []), ensure_ascii=False)} | "
+            f"Total: €{data.get('total_amount', 0)}"
+            for i, data in enumerate(receipts, 1)
+        )
+
+        prompt = f"""
+Based on the numbered receipts at the end of this prompt, determine the expense category of each receipt for Dutch freelance tax purposes.
 
-        return category
+{self.CATEGORY_GUIDELINES}
+
+Return ONLY a JSON object mapping each receipt number to its category name exactly as listed above, e.g. {{"1": "Kantoorkosten", "2": "Vervoerskosten"}}.
+
+Receipts:
+{receipts_str}
+"""
+        response = self._call_with_retry(self.model.generate_content, prompt)
+        answers = self._parse_json_response(response.text)
+        if not isinstance(answers, dict):
+            answers = {}
+
+        categories = []
+        for i in range(1, len(receipts) + 1):
+            category = answers.get(str(i))
+            if category not in self.CATEGORIES:
+                logger.warning(f"Invalid category '{category}' for batched receipt {i}, defaulting to Kantoorkosten")
+                category = None
+            categories.append(category)
+
+        return categories
 
     def _apply_tax_rules(self, category: str) -> Dict:
         """
@@ -515,6 +696,7 @@ Return ONLY the category name exactly as listed above, nothing else.
         """
         Extract text directly from PDF (for digital receipts).
         No image conversion needed - PDFs already contain text.
+        Uses pypdfium2 when available, PyPDF2 otherwise.
 
         Args:
             pdf_path: Path to PDF file
@@ -523,13 +705,19 @@ Return ONLY the category name exactly as listed above, nothing else.
             Raw text extracted from PDF
         """
         try:
+            if pdfium is not None:
+                pdf = pdfium.PdfDocument(pdf_path)
+                try:
+                    parts = [page.get_textpage().get_text_range() for page in pdf]
+                finally:
+                    pdf.close()
+                return "\n".join(parts).strip()
+
             with open(pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
                 # Extract text from all pages
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text.strip()
+                parts = [page.extract_text() or "" for page in pdf_reader.pages]
+                return "\n".join(parts).strip()
         except Exception as e:
             logger.error(f"PDF text extraction failed: {e}")
             return ""
@@ -1,6 +1,10 @@
 """OCR service for extracting text from receipts."""
 
+import copy
+import io
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import re
@@ -8,43 +12,154 @@ from PIL import Image
 import pytesseract
 import cv2
 import numpy as np
+import xxhash
+from cachetools import LRUCache
+from fast_langdetect import detect as fast_detect
 
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Successful OCR results keyed by file content hash, shared across the process.
+# Entries are private deep copies, so callers may change what they get back.
+_RESULT_CACHE = LRUCache(maxsize=512)
+_RESULT_CACHE_LOCK = threading.Lock()
+
+# Load the bundled lite language model once so detection is a forward pass
+try:
+    fast_detect("kassabon totaal", low_memory=True)
+except Exception as e:
+    logger.warning(f"Could not load language detection model: {e}")
+
+# Tesseract runs outside the GIL, so language passes can overlap in threads
+_TESSERACT_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='tesseract')
+
+# Keyword patterns are compiled case-insensitive so the OCR text never needs
+# to be lowercased (and copied) before scanning.
+_TOTAL_AMOUNT_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'totaal[:\s]+[€]?\s*([\d,]+\.?\d*)',
+        r'total[:\s]+[€]?\s*([\d,]+\.?\d*)',
+        r'te betalen[:\s]+[€]?\s*([\d,]+\.?\d*)',
+        r'[€]\s*([\d,]+\.?\d*)',
+    )
+]
+
+_VAT_AMOUNT_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), vat_key) for pattern, vat_key in (
+        (r'btw\s+6%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_6'),
+        (r'btw\s+9%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_9'),
+        (r'btw\s+21%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_21'),
+        (r'vat\s+21%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_21'),
+    )
+]
+
+_INVOICE_NUMBER_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'bon[:\s]+(\w+)',
+        r'factuur[:\s]+(\w+)',
+        r'invoice[:\s]+(\w+)',
+        r'receipt[:\s]+(\w+)',
+        r'nummer[:\s]+(\w+)',
+        r'nr[:\s]+(\w+)',
+    )
+]
+
+# Keyword fallback for Dutch detection when fast-langdetect fails
+_DUTCH_INDICATOR_PATTERNS = [
+    re.compile(re.escape(word), re.IGNORECASE) for word in (
+        'btw', 'totaal', 'bedrag', 'datum', 'bon', 'kassabon',
+        'inclusief', 'exclusief', 'aantal', 'prijs', 'korting',
+        'subtotaal', 'te betalen', 'contant', 'pinnen', 'retour'
+    )
+]
+
+# Vendor name cleanup
+_VENDOR_CLEAN_RE = re.compile(r'[^\w\s-]')
+_NUM_LINE_RE = re.compile(r'^[\d\s]+$')
+
 class OCRService:
     """Service for performing OCR on receipt images."""
 
     SUPPORTED_LANGUAGES = ['nld', 'eng']  # Dutch and English
 
+    # Projection-profile deskew: search window (degrees) and working width
+    DESKEW_ANGLES = np.linspace(-5, 5, 101)
+    DESKEW_MAX_WIDTH = 800
+
+    # Mean word confidence at which the Dutch+English pass is accepted
+    # without waiting for the English-only pass
+    LANGUAGE_CONFIDENCE_THRESHOLD = 0.6
+
+    # PDFs below this size are cheaper to re-extract than to hash
+    CACHE_MIN_PDF_BYTES = 64 * 1024
+
     @classmethod
-    def process_receipt(cls, file_path: str) -> Dict:
+    def process_receipt(cls, file_path: str, file_bytes: Optional[bytes] = None) -> Dict:
         """
         Process a receipt file and extract text using OCR.
 
+        Results are cached by file content, so re-processing the same
+        receipt (retries, re-uploads) skips OCR.
+
         Args:
             file_path: Path to the receipt file
+            file_bytes: File contents if already loaded; read from disk otherwise
 
         Returns:
             Dictionary containing OCR results
         """
+        try:
+            if file_bytes is None:
+                file_bytes = Path(file_path).read_bytes()
+        except OSError as e:
+            logger.error(f"OCR processing failed for {file_path}: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'file_path': file_path
+            }
+
+        if file_path.lower().endswith('.pdf') and len(file_bytes) < cls.CACHE_MIN_PDF_BYTES:
+            return cls._process_receipt_uncached(file_path, file_bytes)
+
+        content_hash = xxhash.xxh3_64(file_bytes).hexdigest()
+        with _RESULT_CACHE_LOCK:
+            cached = _RESULT_CACHE.get(content_hash)
+        if cached is not None:
+            logger.info(f"OCR result for {file_path} found in cache")
+            return {**copy.deepcopy(cached), 'file_path': file_path}
+
+        result = cls._process_receipt_uncached(file_path, file_bytes)
+        if result['success']:
+            snapshot = copy.deepcopy(result)
+            with _RESULT_CACHE_LOCK:
+                _RESULT_CACHE[content_hash] = snapshot
+
+        return result
+
+    @classmethod
+    def _process_receipt_uncached(cls, file_path: str, file_bytes: Optional[bytes] = None) -> Dict:
+        """Run text extraction and parsing for a receipt file."""
         try:
             # Handle PDFs differently - extract text directly
             if file_path.lower().endswith('.pdf'):
-                ocr_text = cls.extract_text_from_pdf(file_path)
+                ocr_text = cls.extract_text_from_pdf(file_path, file_bytes)
                 if not ocr_text or len(ocr_text.strip()) < 10:
                     return {
                         'success': False,
                         'error': 'PDF text extraction failed or no text found',
                         'file_path': file_path
                     }
+
+                # PDF text layers are exact; only sanity-check the length
+                confidence = cls.calculate_confidence(ocr_text)
             else:
                 # Preprocess image
-                processed_image = cls.preprocess_image(file_path)
+                processed_image = cls.preprocess_image(file_path, file_bytes)
 
-                # Perform OCR
-                ocr_text = cls.extract_text(processed_image)
+                # Perform OCR (Tesseract reports per-word confidences)
+                ocr_text, confidence = cls.extract_text(processed_image)
 
             # Detect language
             language = cls.detect_language(ocr_text)
@@ -52,9 +167,6 @@ class OCRService:
             # Extract structured data
             structured_data = cls.extract_structured_data(ocr_text)
 
-            # Calculate confidence score
-            confidence = cls.calculate_confidence(ocr_text)
-
             return {
                 'success': True,
                 'raw_text': ocr_text,
@@ -73,35 +185,53 @@ class OCRService:
             }
 
     @classmethod
-    def extract_text_from_pdf(cls, file_path: str) -> str:
+    def extract_text_from_pdf(cls, file_path: str, file_bytes: Optional[bytes] = None) -> str:
         """
-        Extract text directly from PDF using PyPDF2.
+        Extract text directly from PDF.
+
+        Uses the native PDFium bindings (pypdfium2) when installed and falls
+        back to PyPDF2 otherwise.
 
         Args:
             file_path: Path to PDF file
+            file_bytes: PDF contents if already loaded
 
         Returns:
             Extracted text
         """
         try:
+            try:
+                import pypdfium2 as pdfium
+            except ImportError:
+                pdfium = None
+
+            if pdfium is not None:
+                pdf = pdfium.PdfDocument(file_bytes if file_bytes is not None else file_path)
+                try:
+                    parts = [page.get_textpage().get_text_range() for page in pdf]
+                finally:
+                    pdf.close()
+                return "\n".join(parts)
+
             import PyPDF2
-            text = ""
-            with open(file_path, 'rb') as file:
+            parts = []
+            with (io.BytesIO(file_bytes) if file_bytes is not None else open(file_path, 'rb')) as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+                    parts.append(page.extract_text() or "")
+            return "\n".join(parts)
         except Exception as e:
             logger.error(f"PDF text extraction failed: {e}")
             return ""
 
     @classmethod
-    def preprocess_image(cls, file_path: str) -> np.ndarray:
+    def preprocess_image(cls, file_path: str, file_bytes: Optional[bytes] = None) -> np.ndarray:
         """
         Preprocess image for better OCR results.
 
         Args:
             file_path: Path to the image file
+            file_bytes: Encoded image contents if already loaded
 
         Returns:
             Preprocessed image as numpy array
@@ -110,11 +240,12 @@ class OCRService:
         if file_path.lower().endswith('.pdf'):
             # For PDFs, return empty array - we'll use direct text extraction
             return np.array([])
-        else:
-            image = cv2.imread(file_path)
 
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Decode straight to a single grayscale channel
+        if file_bytes is not None:
+            gray = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
 
         # Apply thresholding to get better OCR results
         _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
@@ -138,19 +269,36 @@ class OCRService:
         Returns:
             Deskewed image
         """
-        # Find all white pixels
-        coords = np.column_stack(np.where(image > 0))
-
-        # Calculate the skew angle
-        angle = cv2.minAreaRect(coords)[-1]
-
-        if angle < -45:
-            angle = -(90 + angle)
-        else:
-            angle = -angle
+        # Estimate the skew on a downscaled copy: the angle whose rotation
+        # gives the sharpest row-sum profile is the one that levels the text
+        (h, w) = image.shape[:2]
+        scale = min(1.0, cls.DESKEW_MAX_WIDTH / w)
+        small = cv2.resize(
+            image,
+            (max(1, int(w * scale)), max(1, int(h * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        (sh, sw) = small.shape[:2]
+        small_center = (sw // 2, sh // 2)
+
+        angle = 0.0
+        best_score = -1.0
+        for candidate in cls.DESKEW_ANGLES:
+            M = cv2.getRotationMatrix2D(small_center, candidate, 1.0)
+            rotated_small = cv2.warpAffine(
+                small,
+                M,
+                (sw, sh),
+                flags=cv2.INTER_NEAREST,
+                borderMode=cv2.BORDER_REPLICATE
+            )
+            proj = rotated_small.sum(axis=1, dtype=np.int32)
+            score = np.diff(proj).var()
+            if score > best_score:
+                best_score = score
+                angle = float(candidate)
 
         # Rotate the image to deskew it
-        (h, w) = image.shape[:2]
         center = (w // 2, h // 2)
         M = cv2.getRotationMatrix2D(center, angle, 1.0)
         rotated = cv2.warpAffine(
@@ -164,7 +312,7 @@ class OCRService:
         return rotated
 
     @classmethod
-    def extract_text(cls, image: np.ndarray) -> str:
+    def extract_text(cls, image: np.ndarray) -> Tuple[str, float]:
         """
         Extract text from image using Tesseract OCR.
 
@@ -172,27 +320,68 @@ class OCRService:
             image: Preprocessed image
 
         Returns:
-            Extracted text
+            Tuple of (extracted text, mean word confidence between 0 and 1)
         """
-        # Configure Tesseract
-        custom_config = r'--oem 3 --psm 6'
+        # Run the Dutch+English and English-only passes concurrently
+        nl_future = _TESSERACT_POOL.submit(cls._run_tesseract, image, 'nld+eng')
+        en_future = _TESSERACT_POOL.submit(cls._run_tesseract, image, 'eng')
 
-        # Perform OCR for Dutch and English
+        data = None
+        confidence = 0.0
         try:
-            text = pytesseract.image_to_string(
-                image,
-                lang='nld+eng',
-                config=custom_config
-            )
+            data = nl_future.result()
+            confidence = cls._mean_confidence(data)
+            if confidence >= cls.LANGUAGE_CONFIDENCE_THRESHOLD:
+                en_future.cancel()
+                return cls._data_to_text(data), confidence
         except Exception as e:
-            logger.warning(f"OCR with Dutch failed, trying English only: {e}")
-            text = pytesseract.image_to_string(
-                image,
-                lang='eng',
-                config=custom_config
-            )
+            logger.warning(f"OCR with Dutch failed, using English only: {e}")
+
+        # Dutch pass failed or was unsure: keep whichever pass is more confident
+        try:
+            en_data = en_future.result()
+        except Exception as e:
+            if data is None:
+                raise
+            logger.warning(f"OCR with English only failed: {e}")
+        else:
+            en_confidence = cls._mean_confidence(en_data)
+            if data is None or en_confidence > confidence:
+                data, confidence = en_data, en_confidence
 
-        return text
+        return cls._data_to_text(data), confidence
+
+    @classmethod
+    def _run_tesseract(cls, image: np.ndarray, lang: str) -> Dict:
+        """Run Tesseract and return its word-level output."""
+        # Configure Tesseract
+        custom_config = r'--oem 3 --psm 6'
+
+        return pytesseract.image_to_data(
+            image,
+            lang=lang,
+            config=custom_config,
+            output_type=pytesseract.Output.DICT
+        )
+
+    @classmethod
+    def _data_to_text(cls, data: Dict) -> str:
+        """Rebuild line-based text from Tesseract image_to_data output."""
+        lines = {}
+        for idx, word in enumerate(data['text']):
+            if word and word.strip():
+                key = (data['block_num'][idx], data['par_num'][idx], data['line_num'][idx])
+                lines.setdefault(key, []).append(word)
+
+        return '\n'.join(' '.join(words) for words in lines.values())
+
+    @classmethod
+    def _mean_confidence(cls, data: Dict) -> float:
+        """Mean Tesseract word confidence scaled to 0-1 (-1 marks non-words)."""
+        confidences = [float(conf) for conf in data['conf'] if float(conf) >= 0]
+        if not confidences:
+            return 0.0
+        return round(sum(confidences) / len(confidences) / 100, 2)
 
     @classmethod
     def detect_language(cls, text: str) -> str:
@@ -205,15 +394,14 @@ class OCRService:
         Returns:
             Detected language code ('nl' or 'en')
         """
-        # Simple Dutch detection based on common words
-        dutch_indicators = [
-            'btw', 'totaal', 'bedrag', 'datum', 'bon', 'kassabon',
-            'inclusief', 'exclusief', 'aantal', 'prijs', 'korting',
-            'subtotaal', 'te betalen', 'contant', 'pinnen', 'retour'
-        ]
+        try:
+            # The model works on a single line; the first 500 chars suffice
+            sample = text[:500].replace('\n', ' ')
+            return 'nl' if fast_detect(sample, low_memory=True)['lang'] == 'nl' else 'en'
+        except Exception as e:
+            logger.warning(f"Language detection failed, using keyword fallback: {e}")
 
-        text_lower = text.lower()
-        dutch_count = sum(1 for word in dutch_indicators if word in text_lower)
+        dutch_count = sum(1 for pattern in _DUTCH_INDICATOR_PATTERNS if pattern.search(text))
 
         return 'nl' if dutch_count >= 3 else 'en'
 
@@ -260,18 +448,8 @@ class OCRService:
     @classmethod
     def extract_total_amount(cls, text: str) -> Optional[float]:
         """Extract total amount from text."""
-        # Patterns for total amount
-        amount_patterns = [
-            r'totaal[:\s]+[€]?\s*([\d,]+\.?\d*)',
-            r'total[:\s]+[€]?\s*([\d,]+\.?\d*)',
-            r'te betalen[:\s]+[€]?\s*([\d,]+\.?\d*)',
-            r'[€]\s*([\d,]+\.?\d*)',
-        ]
-
-        text_lower = text.lower()
-
-        for pattern in amount_patterns:
-            matches = re.findall(pattern, text_lower)
+        for pattern in _TOTAL_AMOUNT_PATTERNS:
+            matches = pattern.findall(text)
             if matches:
                 # Get the last match (usually the total)
                 amount_str = matches[-1].replace(',', '.')
@@ -291,18 +469,8 @@ class OCRService:
             'vat_21': 0.0
         }
 
-        # Patterns for VAT amounts
-        vat_patterns = [
-            (r'btw\s+6%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_6'),
-            (r'btw\s+9%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_9'),
-            (r'btw\s+21%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_21'),
-            (r'vat\s+21%[:\s]+[€]?\s*([\d,]+\.?\d*)', 'vat_21'),
-        ]
-
-        text_lower = text.lower()
-
-        for pattern, vat_key in vat_patterns:
-            match = re.search(pattern, text_lower)
+        for pattern, vat_key in _VAT_AMOUNT_PATTERNS:
+            match = pattern.search(text)
             if match:
                 amount_str = match.group(1).replace(',', '.')
                 try:
@@ -316,14 +484,12 @@ class OCRService:
     def extract_vendor_name(cls, text: str) -> Optional[str]:
         """Extract vendor name from text."""
         # Usually the vendor name is at the top of the receipt
-        lines = text.strip().split('\n')
-
-        for line in lines[:5]:  # Check first 5 lines
+        for line in text.strip().split('\n', 5)[:5]:  # Check first 5 lines
             line = line.strip()
             # Skip empty lines and lines with only numbers
-            if line and not line.replace(' ', '').isdigit():
+            if line and not _NUM_LINE_RE.match(line):
                 # Clean up the vendor name
-                vendor = re.sub(r'[^\w\s-]', '', line)
+                vendor = _VENDOR_CLEAN_RE.sub('', line)
                 if len(vendor) > 2:  # Minimum length check
                     return vendor.strip()
 
@@ -332,20 +498,8 @@ class OCRService:
     @classmethod
     def extract_invoice_number(cls, text: str) -> Optional[str]:
         """Extract invoice or receipt number from text."""
-        # Patterns for invoice numbers
-        invoice_patterns = [
-            r'bon[:\s]+(\w+)',
-            r'factuur[:\s]+(\w+)',
-            r'invoice[:\s]+(\w+)',
-            r'receipt[:\s]+(\w+)',
-            r'nummer[:\s]+(\w+)',
-            r'nr[:\s]+(\w+)',
-        ]
-
-        text_lower = text.lower()
-
-        for pattern in invoice_patterns:
-            match = re.search(pattern, text_lower)
+        for pattern in _INVOICE_NUMBER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1)
 
@@ -375,34 +529,15 @@ class OCRService:
     @classmethod
     def calculate_confidence(cls, text: str) -> float:
         """
-        Calculate OCR confidence score.
+        Sanity-check confidence for text that did not come from Tesseract.
 
         Args:
-            text: OCR extracted text
+            text: Extracted text
 
         Returns:
-            Confidence score between 0 and 1
+            Confidence score between 0 and 1, based on text length
         """
         if not text:
             return 0.0
 
-        # Factors for confidence calculation
-        factors = []
-
-        # Check text length
-        factors.append(min(len(text) / 500, 1.0))
-
-        # Check for key receipt elements
-        key_elements = ['totaal', 'total', 'btw', 'vat', '€', 'datum', 'date']
-        text_lower = text.lower()
-        element_score = sum(1 for elem in key_elements if elem in text_lower) / len(key_elements)
-        factors.append(element_score)
-
-        # Check for numbers (receipts should have numbers)
-        numbers = re.findall(r'\d+', text)
-        factors.append(min(len(numbers) / 10, 1.0))
-
-        # Calculate average confidence
-        confidence = sum(factors) / len(factors)
-
-        return round(confidence, 2)
\ No newline at end of file
+        return round(min(len(text.strip()) / 500, 1.0), 2)
@@ -1,6 +1,8 @@
 """PDF generation for invoices using ReportLab."""
 
+import io
 import logging
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Optional
@@ -19,6 +21,99 @@ logger = logging.getLogger(__name__)
 
 # Page dimensions
 PAGE_WIDTH, PAGE_HEIGHT = A4
+PAGE_MARGIN = 2*cm
+
+# Invoices use the built-in Helvetica family. Custom TTF fonts must be
+# registered here, once per process, via pdfmetrics.registerFont(TTFont(...)).
+
+# Brand colours
+_HEADER_BLUE = colors.HexColor('#1f4788')
+_ALT_ROW = colors.HexColor('#f0f2f6')
+
+# Cell formatters for amounts, percentages and quantities
+_EUR = "€ {:,.2f}".format
+_PCT = "{:.0f}%".format
+_QTY = "{:.2f}".format
+
+# Paragraph styles, built once per process and shared by every invoice
+_STYLES = getSampleStyleSheet()
+
+if 'CompanyName' not in _STYLES:
+    _STYLES.add(ParagraphStyle(
+        name='CompanyName',
+        parent=_STYLES['Heading1'],
+        fontSize=18,
+        textColor=_HEADER_BLUE,
+        spaceAfter=6
+    ))
+
+if 'InvoiceTitle' not in _STYLES:
+    _STYLES.add(ParagraphStyle(
+        name='InvoiceTitle',
+        parent=_STYLES['Heading1'],
+        fontSize=24,
+        textColor=_HEADER_BLUE,
+        spaceAfter=12
+    ))
+
+# Table styles
+_HEADER_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+_INFO_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+_ITEMS_TABLE_STYLE = TableStyle([
+    # Header row
+    ('BACKGROUND', (0, 0), (-1, 0), _HEADER_BLUE),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('TOPPADDING', (0, 0), (-1, 0), 12),
+
+    # Data rows
+    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, _ALT_ROW]),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+])
+
+_TOTALS_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 12),
+    ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+    ('TOPPADDING', (0, -1), (-1, -1), 8),
+])
+
+def _new_document(output_path: str) -> SimpleDocTemplate:
+    """Create an A4 document template with the standard invoice margins."""
+    return SimpleDocTemplate(
+        output_path,
+        pagesize=A4,
+        rightMargin=PAGE_MARGIN,
+        leftMargin=PAGE_MARGIN,
+        topMargin=PAGE_MARGIN,
+        bottomMargin=PAGE_MARGIN
+    )
+
+@lru_cache(maxsize=8)
+def _load_logo(logo_path: str, mtime: float) -> bytes:
+    """Read a logo file once; the mtime key invalidates it when replaced."""
+    return Path(logo_path).read_bytes()
 
 def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[str] = None) -> str:
     """Generate professional Dutch invoice PDF.
@@ -40,35 +135,11 @@ def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[st
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
     # Create PDF
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
+    doc = _new_document(output_path)
 
     # Build content
     elements = []
-    styles = getSampleStyleSheet()
-
-    # Add custom styles
-    styles.add(ParagraphStyle(
-        name='CompanyName',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1f4788'),
-        spaceAfter=6
-    ))
-
-    styles.add(ParagraphStyle(
-        name='InvoiceTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1f4788'),
-        spaceAfter=12
-    ))
+    styles = _STYLES
 
     # Header: Logo and Company Info
     header_data = []
@@ -77,7 +148,12 @@ def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[st
     logo_path = settings.get('logo_path')
     if logo_path and Path(logo_path).exists():
         try:
-            logo = Image(logo_path, width=Config.INVOICE_LOGO_MAX_WIDTH, height=Config.INVOICE_LOGO_MAX_HEIGHT)
+            logo_bytes = _load_logo(logo_path, Path(logo_path).stat().st_mtime)
+            logo = Image(
+                io.BytesIO(logo_bytes),
+                width=Config.INVOICE_LOGO_MAX_WIDTH,
+                height=Config.INVOICE_LOGO_MAX_HEIGHT
+            )
             logo.hAlign = 'LEFT'
             header_data.append([logo, ''])
         except Exception as e:
@@ -98,10 +174,7 @@ def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[st
             [[Paragraph(company_info, styles['Normal'])]],
             colWidths=[17*cm]
         )
-        header_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        header_table.setStyle(_HEADER_TABLE_STYLE)
         elements.append(header_table)
     else:
         elements.append(Paragraph(company_info, styles['Normal']))
@@ -153,58 +226,26 @@ def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[st
         [[Paragraph(client_info, styles['Normal']), Paragraph(invoice_info, styles['Normal'])]],
         colWidths=[8.5*cm, 8.5*cm]
     )
-    info_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
+    info_table.setStyle(_INFO_TABLE_STYLE)
     elements.append(info_table)
     elements.append(Spacer(1, 1*cm))
 
     # Line items table
     line_items = invoice.get('line_items', [])
 
-    table_data = [
-        ['Omschrijving', 'Aantal', 'Prijs', 'BTW', 'Totaal']
-    ]
-
-    for item in line_items:
-        quantity = item.get('quantity', 1)
-        unit_price = item.get('unit_price', 0)
-        vat_rate = item.get('vat_rate', 21)
-        subtotal = item.get('subtotal', 0)
-        total = item.get('total', 0)
-
-        table_data.append([
+    table_data = [['Omschrijving', 'Aantal', 'Prijs', 'BTW', 'Totaal']] + [
+        [
             item.get('description', ''),
-            f"{quantity:.2f}",
-            f"€ {unit_price:,.2f}",
-            f"{vat_rate:.0f}%",
-            f"€ {total:,.2f}"
-        ])
+            _QTY(item.get('quantity', 1)),
+            _EUR(item.get('unit_price', 0)),
+            _PCT(item.get('vat_rate', 21)),
+            _EUR(item.get('total', 0))
+        ]
+        for item in line_items
+    ]
 
     items_table = Table(table_data, colWidths=[7*cm, 2.5*cm, 2.5*cm, 2*cm, 3*cm])
-    items_table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 0), (-1, 0), 12),
-
-        # Data rows
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f2f6')]),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-    ]))
+    items_table.setStyle(_ITEMS_TABLE_STYLE)
     elements.append(items_table)
     elements.append(Spacer(1, 0.5*cm))
 
@@ -218,27 +259,20 @@ def generate_invoice_pdf(invoice: Dict, settings: Dict, output_path: Optional[st
     total_vat = invoice.get('vat_amount', 0)
     total = invoice.get('total_incl_vat', 0)
 
-    totals_data.append(['Subtotaal excl. BTW:', f"€ {subtotal:,.2f}"])
+    totals_data.append(['Subtotaal excl. BTW:', _EUR(subtotal)])
 
     if vat_0 > 0:
-        totals_data.append(['BTW 0%:', f"€ {vat_0:,.2f}"])
+        totals_data.append(['BTW 0%:', _EUR(vat_0)])
     if vat_9 > 0:
-        totals_data.append(['BTW 9%:', f"€ {vat_9:,.2f}"])
+        totals_data.append(['BTW 9%:', _EUR(vat_9)])
     if vat_21 > 0:
-        totals_data.append(['BTW 21%:', f"€ {vat_21:,.2f}"])
+        totals_data.append(['BTW 21%:', _EUR(vat_21)])
 
     totals_data.append(['', ''])  # Empty row
     totals_data.append(['<b>Totaal incl. BTW:</b>', f"<b>€ {total:,.2f}</b>"])
 
     totals_table = Table(totals_data, colWidths=[10*cm, 7*cm])
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ('TOPPADDING', (0, -1), (-1, -1), 8),
-    ]))
+    totals_table.setStyle(_TOTALS_TABLE_STYLE)
     elements.append(totals_table)
     elements.append(Spacer(1, 1*cm))
 
@@ -289,8 +323,6 @@ def generate_invoice_preview(invoice: Dict, settings: Dict) -> bytes:
     Returns:
         PDF bytes
     """
-    import io
-
     buffer = io.BytesIO()
 
     # Similar to generate_invoice_pdf but write to buffer
@@ -1,10 +1,15 @@
 """Simplified receipt processing pipeline - ONLY uses Gemini Vision."""
 
+import asyncio
 import logging
-from typing import Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
 from pathlib import Path
 from datetime import datetime
 
+from config import Config
+from database.connection import transaction
 from services.llm_service import LLMService
 from utils.database_utils import (
     save_extracted_data,
@@ -14,9 +19,40 @@ from utils.database_utils import (
 
 logger = logging.getLogger(__name__)
 
+# One processor (and thus one Gemini client) per batch worker thread
+_worker_local = threading.local()
+
+# Receipt date formats tried before falling back to dateutil
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d-%m-%y", "%d/%m/%y")
+
+def _parse_receipt_date(date_str: str) -> datetime:
+    """Parse a receipt date, trying the known formats before dateutil."""
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            pass
+
+    from dateutil import parser
+    return parser.parse(date_str)
+
 class ReceiptProcessor:
     """Simplified processor - uses ONLY Gemini Vision."""
 
+    # extracted_data key -> ExtractedData column, for fields copied as-is
+    _FIELD_MAP = {
+        'vendor_name': 'vendor_name',
+        'vendor_address': 'vendor_address',
+        'invoice_number': 'invoice_number',
+        'category': 'expense_category',
+        'vat_deductible_percentage': 'vat_deductible_percentage',
+        'ib_deductible_percentage': 'ib_deductible_percentage',
+        'vat_deductible_amount': 'vat_refund_amount',
+        'remainder_after_vat': 'remainder_after_vat',
+        'profit_deduction': 'profit_deduction',
+        'notes': 'explanation'
+    }
+
     def __init__(self):
         """Initialize the processor."""
         self.llm_service = LLMService()
@@ -61,24 +97,20 @@ class ReceiptProcessor:
             # Step 3: Prepare data for database
             db_data = self._prepare_database_data(extracted_data, file_path)
 
-            # Step 4: Save to database
-            save_success = save_extracted_data(receipt_id, db_data)
+            # Steps 4-6: Save data, completed status and audit event in one transaction
+            with transaction() as db:
+                save_extracted_data(receipt_id, db_data, db=db)
+                update_receipt_status(receipt_id, 'completed', db=db)
 
-            if not save_success:
-                raise Exception("Failed to save extracted data to database")
-
-            # Step 5: Update status to completed
-            update_receipt_status(receipt_id, 'completed')
-
-            # Step 6: Log audit event
-            if user_id:
-                log_audit_event(
-                    user_id=user_id,
-                    action='process',
-                    entity_type='receipt',
-                    entity_id=receipt_id,
-                    new_values={'status': 'completed', 'category': extracted_data.get('category')}
-                )
+                if user_id:
+                    log_audit_event(
+                        user_id=user_id,
+                        action='process',
+                        entity_type='receipt',
+                        entity_id=receipt_id,
+                        new_values={'status': 'completed', 'category': extracted_data.get('category')},
+                        db=db
+                    )
 
             result['success'] = True
             result['data'] = extracted_data
@@ -106,6 +138,92 @@ class ReceiptProcessor:
 
         return result
 
+    def process_receipts_batch(
+        self,
+        ids_and_paths: List[Tuple[int, str]],
+        user_id: int = None,
+        max_workers: int = None
+    ) -> List[Dict]:
+        """
+        Process several receipts concurrently.
+
+        Gemini calls are network-bound, so receipts are handed to a thread
+        pool; each worker thread gets its own processor instance.
+
+        Args:
+            ids_and_paths: List of (receipt_id, file_path) tuples
+            user_id: User ID for audit
+            max_workers: Number of worker threads (default: Config.MAX_PROCESSING_WORKERS)
+
+        Returns:
+            List of processing results in the same order as the input
+        """
+        if not ids_and_paths:
+            return []
+
+        max_workers = max_workers or Config.MAX_PROCESSING_WORKERS
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_process_in_worker, receipt_id, file_path, user_id): receipt_id
+                for receipt_id, file_path in ids_and_paths
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+        return [results[receipt_id] for receipt_id, _ in ids_and_paths]
+
+    async def process_receipt_async(
+        self,
+        receipt_id: int,
+        file_path: str,
+        user_id: int = None
+    ) -> Dict:
+        """
+        Process a receipt without blocking the event loop.
+
+        Args:
+            receipt_id: Database receipt ID
+            file_path: Path to receipt file
+            user_id: User ID for audit
+
+        Returns:
+            Dictionary with processing results
+        """
+        return await asyncio.to_thread(self.process_receipt, receipt_id, file_path, user_id)
+
+    async def process_receipts_async(
+        self,
+        ids_and_paths: List[Tuple[int, str]],
+        user_id: int = None,
+        max_concurrency: int = None
+    ) -> List[Dict]:
+        """
+        Process several receipts concurrently from async code.
+
+        A semaphore caps how many receipts talk to Gemini at once; each
+        receipt runs on a worker thread with its own processor instance.
+
+        Args:
+            ids_and_paths: List of (receipt_id, file_path) tuples
+            user_id: User ID for audit
+            max_concurrency: Receipts in flight at once (default: Config.MAX_PROCESSING_WORKERS)
+
+        Returns:
+            List of processing results in the same order as the input
+        """
+        # Created per call so it binds to the running event loop
+        semaphore = asyncio.Semaphore(max_concurrency or Config.MAX_PROCESSING_WORKERS)
+
+        async def run(receipt_id: int, file_path: str) -> Dict:
+            async with semaphore:
+                return await asyncio.to_thread(_process_in_worker, receipt_id, file_path, user_id)
+
+        return list(await asyncio.gather(
+            *(run(receipt_id, file_path) for receipt_id, file_path in ids_and_paths)
+        ))
+
     def _prepare_database_data(self, extracted_data: Dict, file_path: str) -> Dict:
         """
         Prepare extracted data for database storage.
@@ -121,37 +239,35 @@ class ReceiptProcessor:
         transaction_date = None
         if extracted_data.get('date'):
             try:
-                from dateutil import parser
-                transaction_date = parser.parse(extracted_data['date'])
+                transaction_date = _parse_receipt_date(extracted_data['date'])
             except:
                 transaction_date = datetime.now()
 
         # Get VAT breakdown
         vat_breakdown = extracted_data.get('vat_breakdown', {})
 
-        db_data = {
+        db_data = {dest: extracted_data.get(src) for src, dest in self._FIELD_MAP.items()}
+        db_data.update({
             'transaction_date': transaction_date,
-            'vendor_name': extracted_data.get('vendor_name'),
-            'vendor_address': extracted_data.get('vendor_address'),
-            'invoice_number': extracted_data.get('invoice_number'),
             'detected_language': extracted_data.get('detected_language', 'nl'),
-            'expense_category': extracted_data.get('category'),
             'amount_excl_vat': extracted_data.get('amount_excl_vat', 0),
             'vat_6_amount': vat_breakdown.get('6', 0),
             'vat_9_amount': vat_breakdown.get('9', 0),
             'vat_21_amount': vat_breakdown.get('21', 0),
             'total_incl_vat': extracted_data.get('total_amount', 0),
-            'vat_deductible_percentage': extracted_data.get('vat_deductible_percentage'),
-            'ib_deductible_percentage': extracted_data.get('ib_deductible_percentage'),
-            'vat_refund_amount': extracted_data.get('vat_deductible_amount'),
-            'remainder_after_vat': extracted_data.get('remainder_after_vat'),
-            'profit_deduction': extracted_data.get('profit_deduction'),
-            'explanation': extracted_data.get('notes'),
             'items_json': extracted_data.get('items', []),
             'raw_ocr_text': '',  # Not used anymore
             'confidence_score': extracted_data.get('confidence', 0.8),
             'extraction_version': '2.0-gemini-only',
             'manual_review_required': extracted_data.get('confidence', 1) < 0.7
-        }
+        })
 
         return db_data
+
+def _process_in_worker(receipt_id: int, file_path: str, user_id: int = None) -> Dict:
+    """Run process_receipt on the calling thread's own ReceiptProcessor."""
+    processor = getattr(_worker_local, 'processor', None)
+    if processor is None:
+        processor = ReceiptProcessor()
+        _worker_local.processor = processor
+    return processor.process_receipt(receipt_id, file_path, user_id)
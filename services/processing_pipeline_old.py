@@ -1,24 +1,62 @@
 """Receipt processing pipeline orchestrating OCR and LLM services."""
 
 import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Dict, Optional, List, Tuple
 from pathlib import Path
 from datetime import datetime
 
+from config import Config
 from services.ocr_service import OCRService
 from services.llm_service import LLMService
+from services.processing_pipeline import _parse_receipt_date
 from utils.calculations import calculate_tax_deductions
 from utils.database_utils import (
     save_extracted_data,
+    save_extracted_data_bulk,
+    bulk_update_receipt_statuses,
     update_receipt_status,
     log_audit_event
 )
 
 logger = logging.getLogger(__name__)
 
+# Caps concurrent OCR calls across all batch workers
+_OCR_SEMAPHORE = threading.Semaphore(Config.MAX_OCR_CONCURRENCY)
+
+def _sum_vat(vat_breakdown: Dict) -> float:
+    """Sum a VAT breakdown, converting only values that aren't numbers yet."""
+    return math.fsum(
+        v if isinstance(v, (int, float)) else float(v)
+        for v in vat_breakdown.values()
+    )
+
+def _read_file(file_path: Optional[str]) -> Optional[bytes]:
+    """Read a receipt file, returning None if it can't be read."""
+    try:
+        return Path(file_path).read_bytes()
+    except (OSError, TypeError):
+        return None
+
 class ReceiptProcessor:
     """Main processing pipeline for receipts."""
 
+    # extracted_data key -> ExtractedData column, for fields copied as-is
+    _FIELD_MAP = {
+        'vendor_name': 'vendor_name',
+        'vendor_address': 'vendor_address',
+        'invoice_number': 'invoice_number',
+        'category': 'expense_category',
+        'vat_deductible_percentage': 'vat_deductible_percentage',
+        'ib_deductible_percentage': 'ib_deductible_percentage',
+        'vat_deductible_amount': 'vat_refund_amount',
+        'remainder_after_vat': 'remainder_after_vat',
+        'profit_deduction': 'profit_deduction',
+        'notes': 'explanation'
+    }
+
     def __init__(self):
         """Initialize the processor."""
         self.ocr_service = OCRService()
@@ -28,7 +66,11 @@ class ReceiptProcessor:
         self,
         receipt_id: int,
         file_path: str,
-        user_id: int = None
+        user_id: int = None,
+        defer_save: bool = False,
+        file_bytes: Optional[bytes] = None,
+        defer_status: bool = False,
+        ocr_result: Optional[Dict] = None
     ) -> Dict:
         """
         Process a single receipt through the complete pipeline.
@@ -37,6 +79,12 @@ class ReceiptProcessor:
             receipt_id: Database receipt ID
             file_path: Path to receipt file
             user_id: User ID for audit
+            defer_save: Return the prepared rows in result['db_data'] instead
+                of saving them, so a batch can write them in one transaction
+            file_bytes: File contents if already loaded; read from disk otherwise
+            defer_status: Skip the status updates and report the outcome in
+                result['status'] for the caller to write in bulk
+            ocr_result: Result of an OCR pass already run for this file
 
         Returns:
             Dictionary with processing results
@@ -50,11 +98,13 @@ class ReceiptProcessor:
 
         try:
             # Step 1: Update status to processing
-            update_receipt_status(receipt_id, 'processing')
+            if not defer_status:
+                update_receipt_status(receipt_id, 'processing')
 
             # Step 2: OCR extraction
-            logger.info(f"Starting OCR for receipt {receipt_id}")
-            ocr_result = self.ocr_service.process_receipt(file_path)
+            if ocr_result is None:
+                logger.info(f"Starting OCR for receipt {receipt_id}")
+                ocr_result = self._run_ocr(file_path, file_bytes)
 
             if not ocr_result['success']:
                 raise Exception(f"OCR failed: {ocr_result.get('error')}")
@@ -83,6 +133,13 @@ class ReceiptProcessor:
             # Step 6: Prepare data for database
             db_data = self._prepare_database_data(extracted_data, ocr_result)
 
+            if defer_save:
+                result['success'] = True
+                result['status'] = 'completed'
+                result['data'] = extracted_data
+                result['db_data'] = db_data
+                return result
+
             # Step 7: Save to database
             save_success = save_extracted_data(receipt_id, db_data)
 
@@ -112,7 +169,9 @@ class ReceiptProcessor:
             result['error'] = str(e)
 
             # Update status to failed
-            update_receipt_status(receipt_id, 'failed', str(e))
+            result['status'] = 'failed'
+            if not defer_status:
+                update_receipt_status(receipt_id, 'failed', str(e))
 
             if user_id:
                 log_audit_event(
@@ -125,6 +184,11 @@ class ReceiptProcessor:
 
         return result
 
+    def _run_ocr(self, file_path: str, file_bytes: Optional[bytes] = None) -> Dict:
+        """Run OCR on a receipt file within the global OCR concurrency cap."""
+        with _OCR_SEMAPHORE:
+            return self.ocr_service.process_receipt(file_path, file_bytes)
+
     def _prepare_database_data(self, extracted_data: Dict, ocr_result: Dict) -> Dict:
         """
         Prepare extracted data for database storage.
@@ -140,42 +204,33 @@ class ReceiptProcessor:
         transaction_date = None
         if extracted_data.get('date'):
             try:
-                from dateutil import parser
-                transaction_date = parser.parse(extracted_data['date'])
+                transaction_date = _parse_receipt_date(extracted_data['date'])
             except:
                 transaction_date = datetime.now()
 
         # Get VAT breakdown
-        vat_breakdown = extracted_data.get('vat_breakdown', {})
+        vat_breakdown = extracted_data.get('vat_breakdown') or {}
 
         # Calculate totals
-        total_vat = sum(float(v) for v in vat_breakdown.values())
-        amount_excl_vat = extracted_data.get('subtotal', 0) or extracted_data.get('total_amount', 0) - total_vat
+        total_vat = _sum_vat(vat_breakdown)
+        total_incl_vat = extracted_data.get('total_amount') or 0
+        amount_excl_vat = extracted_data.get('subtotal') or total_incl_vat - total_vat
 
-        db_data = {
+        db_data = {dest: extracted_data.get(src) for src, dest in self._FIELD_MAP.items()}
+        db_data.update({
             'transaction_date': transaction_date,
-            'vendor_name': extracted_data.get('vendor_name'),
-            'vendor_address': extracted_data.get('vendor_address'),
-            'invoice_number': extracted_data.get('invoice_number'),
             'detected_language': extracted_data.get('detected_language', ocr_result.get('language')),
-            'expense_category': extracted_data.get('category'),
             'amount_excl_vat': amount_excl_vat,
             'vat_6_amount': vat_breakdown.get('6', 0),
             'vat_9_amount': vat_breakdown.get('9', 0),
             'vat_21_amount': vat_breakdown.get('21', 0),
-            'total_incl_vat': extracted_data.get('total_amount', 0),
-            'vat_deductible_percentage': extracted_data.get('vat_deductible_percentage'),
-            'ib_deductible_percentage': extracted_data.get('ib_deductible_percentage'),
-            'vat_refund_amount': extracted_data.get('vat_deductible_amount'),
-            'remainder_after_vat': extracted_data.get('remainder_after_vat'),
-            'profit_deduction': extracted_data.get('profit_deduction'),
-            'explanation': extracted_data.get('notes'),
+            'total_incl_vat': total_incl_vat,
             'items_json': extracted_data.get('items', []),
             'raw_ocr_text': ocr_result.get('raw_text'),
             'confidence_score': extracted_data.get('confidence', ocr_result.get('confidence')),
             'extraction_version': '1.0',
             'manual_review_required': extracted_data.get('confidence', 1) < 0.7
-        }
+        })
 
         return db_data
 
@@ -183,15 +238,22 @@ class ReceiptProcessor:
         self,
         receipt_files: List[Dict],
         user_id: int = None,
-        callback=None
+        callback=None,
+        max_workers: int = None
     ) -> Dict:
         """
         Process multiple receipts in batch.
 
+        Receipts are processed concurrently as a two-stage pipeline: an OCR
+        pool scans files and hands each result to an LLM pool as soon as it
+        is ready.
+
         Args:
-            receipt_files: List of dictionaries with receipt_id and file_path
+            receipt_files: List of dictionaries with receipt_id and file_path,
+                and optionally preloaded file_bytes
             user_id: User ID for audit
             callback: Optional callback function for progress updates
+            max_workers: Number of LLM worker threads (default: Config.MAX_PROCESSING_WORKERS)
 
         Returns:
             Dictionary with batch processing results
@@ -203,22 +265,88 @@ class ReceiptProcessor:
             'results': []
         }
 
-        for idx, receipt_file in enumerate(receipt_files):
-            # Update progress if callback provided
-            if callback:
-                callback(idx + 1, len(receipt_files), f"Processing {receipt_file.get('filename', 'receipt')}")
-
-            # Process receipt
-            result = self.process_receipt(
-                receipt_file['receipt_id'],
-                receipt_file['file_path'],
-                user_id
-            )
-
-            results['results'].append(result)
+        if not receipt_files:
+            return results
+
+        max_workers = max_workers or Config.MAX_PROCESSING_WORKERS
+
+        # Mark the whole batch as processing in one statement
+        bulk_update_receipt_statuses({rf['receipt_id']: ('processing', None) for rf in receipt_files})
+
+        # OCR and LLM stages run on separate pools, so OCR of the next
+        # receipts overlaps with LLM processing of the ones already scanned
+        with ThreadPoolExecutor(max_workers=Config.MAX_OCR_CONCURRENCY, thread_name_prefix='ocr') as ocr_pool, \
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm') as llm_pool:
+            ocr_futures = {
+                ocr_pool.submit(
+                    self._run_ocr,
+                    receipt_file['file_path'],
+                    receipt_file.get('file_bytes')
+                ): receipt_file
+                for receipt_file in receipt_files
+            }
+            llm_futures = {}
+            pending = set(ocr_futures)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in ocr_futures:
+                        receipt_file = ocr_futures[future]
+                        llm_future = llm_pool.submit(
+                            self.process_receipt,
+                            receipt_file['receipt_id'],
+                            receipt_file['file_path'],
+                            user_id,
+                            defer_save=True,
+                            defer_status=True,
+                            ocr_result=future.result()
+                        )
+                        llm_futures[llm_future] = receipt_file
+                        pending.add(llm_future)
+                        continue
+
+                    receipt_file = llm_futures[future]
+                    results['results'].append(future.result())
+
+                    # Update progress if callback provided
+                    if callback:
+                        callback(
+                            len(results['results']),
+                            len(receipt_files),
+                            f"Processed {receipt_file.get('filename', 'receipt')}"
+                        )
+
+        # Write all extracted rows and completed statuses in one transaction
+        processed = [r for r in results['results'] if r['success']]
+        if processed and not save_extracted_data_bulk(
+            [(r['receipt_id'], r.pop('db_data')) for r in processed]
+        ):
+            for r in processed:
+                r['success'] = False
+                r['status'] = 'failed'
+                r['error'] = "Failed to save extracted data to database"
+
+        # Write all failure statuses in one statement
+        failed_statuses = {
+            r['receipt_id']: ('failed', r['error'])
+            for r in results['results'] if not r['success']
+        }
+        if failed_statuses:
+            bulk_update_receipt_statuses(failed_statuses)
 
-            if result['success']:
+        for r in results['results']:
+            if r['success']:
                 results['successful'] += 1
+                if user_id:
+                    log_audit_event(
+                        user_id=user_id,
+                        action='process',
+                        entity_type='receipt',
+                        entity_id=r['receipt_id'],
+                        new_values={'status': 'completed', 'category': r['data'].get('category')}
+                    )
             else:
                 results['failed'] += 1
 
@@ -230,40 +358,51 @@ class ReceiptProcessor:
         """
         Reprocess all failed receipts.
 
+        Failed receipts are fetched page by page, and each page is processed
+        as its own batch before the next one is loaded.
+
         Args:
             user_id: User ID for audit
 
         Returns:
             Dictionary with reprocessing results
         """
-        from utils.database_utils import search_receipts
-
-        # Get all failed receipts
-        failed_receipts = search_receipts(
-            user_id=user_id,
-            status='failed'
-        )
-
-        if not failed_receipts:
-            return {
-                'total': 0,
-                'successful': 0,
-                'failed': 0,
-                'message': 'No failed receipts to reprocess'
-            }
+        from utils.database_utils import iter_failed_receipts
 
-        # Prepare for batch processing
-        receipt_files = [
-            {
-                'receipt_id': r['id'],
-                'file_path': r.get('file_path'),
-                'filename': r.get('filename')
-            }
-            for r in failed_receipts
-        ]
+        results = {
+            'total': 0,
+            'successful': 0,
+            'failed': 0,
+            'results': []
+        }
 
-        # Process batch
-        results = self.batch_process_receipts(receipt_files, user_id)
+        for failed_receipts in iter_failed_receipts(user_id=user_id):
+            # Read the page's files up front so OCR workers don't wait on disk one by one
+            paths = [r['file_path'] for r in failed_receipts]
+            with ThreadPoolExecutor(max_workers=min(16, len(paths))) as executor:
+                blobs = list(executor.map(_read_file, paths))
+
+            # Prepare for batch processing
+            receipt_files = [
+                {
+                    'receipt_id': r['id'],
+                    'file_path': r['file_path'],
+                    'filename': r['filename'],
+                    'file_bytes': blob
+                }
+                for r, blob in zip(failed_receipts, blobs)
+            ]
+
+            # Process batch
+            page_results = self.batch_process_receipts(receipt_files, user_id)
+
+            results['total'] += page_results['total']
+            results['successful'] += page_results['successful']
+            results['failed'] += page_results['failed']
+            results['results'].extend(page_results['results'])
+
+        if not results['total']:
+            results['message'] = 'No failed receipts to reprocess'
 
         return results
 
@@ -285,10 +424,12 @@ class ReceiptProcessor:
             if not extracted_data.get(field):
                 issues.append(f"Missing required field: {field}")
 
+        total_amount = extracted_data.get('total_amount') or 0
+
         # Validate amounts
-        if extracted_data.get('total_amount'):
+        if total_amount:
             try:
-                amount = float(extracted_data['total_amount'])
+                amount = total_amount if isinstance(total_amount, (int, float)) else float(total_amount)
                 if amount <= 0:
                     issues.append("Total amount must be positive")
                 if amount > 100000:
@@ -297,19 +438,18 @@ class ReceiptProcessor:
                 issues.append("Invalid total amount format")
 
         # Validate VAT breakdown
-        vat_breakdown = extracted_data.get('vat_breakdown', {})
-        total_vat = sum(float(v) for v in vat_breakdown.values())
+        vat_breakdown = extracted_data.get('vat_breakdown') or {}
+        total_vat = _sum_vat(vat_breakdown)
 
         if total_vat > 0:
-            amount_excl = extracted_data.get('total_amount', 0) - total_vat
+            amount_excl = total_amount - total_vat
             if amount_excl < 0:
                 issues.append("VAT amount exceeds total amount")
 
         # Validate date
         if extracted_data.get('date'):
             try:
-                from dateutil import parser
-                date = parser.parse(extracted_data['date'])
+                date = _parse_receipt_date(extracted_data['date'])
                 if date > datetime.now():
                     issues.append("Transaction date is in the future")
             except:
@@ -1,28 +1,70 @@
 """Authentication utilities for user management."""
 
 import streamlit as st
-from passlib.context import CryptContext
+import bcrypt
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 import logging
+from sqlalchemy import select, bindparam
+from cachetools import TTLCache
 
+from config import Config
 from database.models import User
-from database.connection import get_db
+from database.connection import db_session
 from utils.session_state import set_user_info, logout
 
 logger = logging.getLogger(__name__)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context, created on first use (only needed for hashing)
+pwd_context = None
+
+# bcrypt releases the GIL, so hashing can overlap with the user lookup
+_HASH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bcrypt')
+
+# Successful logins keyed by sha256(email:password), so repeat logins skip bcrypt.
+# Expired entries are evicted and the cache is bounded, so old logins go away.
+AUTH_CACHE_TTL = 300  # seconds
+AUTH_CACHE_SIZE = 1024
+_auth_cache: TTLCache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+_auth_cache_lock = threading.Lock()
+
+# Built once so SQLAlchemy reuses the compiled statement
+_USER_BY_EMAIL = select(User).where(User.email == bindparam('email'))
+_USER_BY_ID = select(User).where(User.id == bindparam('user_id'))
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        return False
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+        pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            bcrypt__rounds=Config.BCRYPT_ROUNDS,
+            deprecated="auto"
+        )
     return pwd_context.hash(password)
 
+def _auth_cache_key(email: str, password: str) -> str:
+    """Build the login cache key without keeping the plain password around."""
+    return hashlib.sha256(f"{email}:{password}".encode('utf-8')).hexdigest()
+
+def _invalidate_auth_cache(user_id: int):
+    """Drop cached logins for a user."""
+    with _auth_cache_lock:
+        for key, user_data in list(_auth_cache.items()):
+            if user_data['id'] == user_id:
+                _auth_cache.pop(key, None)
+
 def authenticate_user(email: str, password: str) -> Optional[Dict]:
     """
     Authenticate user with email and password.
@@ -34,27 +76,36 @@ def authenticate_user(email: str, password: str) -> Optional[Dict]:
     Returns:
         User data if authenticated, None otherwise
     """
+    cache_key = _auth_cache_key(email, password)
+    with _auth_cache_lock:
+        cached = _auth_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
     try:
-        db = next(get_db())
+        with db_session() as db:
+            user = db.execute(_USER_BY_EMAIL, {'email': email}).scalar_one_or_none()
 
-        user = db.query(User).filter(User.email == email).first()
+            if not user:
+                return None
 
-        if not user:
-            return None
+            if not verify_password(password, user.hashed_password):
+                return None
 
-        if not verify_password(password, user.hashed_password):
-            return None
+            if not user.is_active:
+                return None
 
-        if not user.is_active:
-            return None
+            user_data = {
+                'id': user.id,
+                'email': user.email,
+                'name': user.full_name,
+                'company': user.company_name,
+                'username': user.username
+            }
+        with _auth_cache_lock:
+            _auth_cache[cache_key] = user_data
 
-        return {
-            'id': user.id,
-            'email': user.email,
-            'name': user.full_name,
-            'company': user.company_name,
-            'username': user.username
-        }
+        return dict(user_data)
 
     except Exception as e:
         logger.error(f"Authentication error: {e}")
@@ -242,37 +293,39 @@ def create_user(
     Returns:
         User ID if successful, None otherwise
     """
+    # Start hashing right away; the KDF runs while the email check queries the DB
+    hashed_password = _HASH_POOL.submit(get_password_hash, password)
+
     try:
-        db = next(get_db())
-
-        # Check if user exists
-        existing = db.query(User).filter(User.email == email).first()
-        if existing:
-            logger.warning(f"User with email {email} already exists")
-            return None
-
-        # Create new user
-        user = User(
-            email=email,
-            username=email.split('@')[0],
-            hashed_password=get_password_hash(password),
-            full_name=full_name,
-            company_name=company_name,
-            kvk_number=kvk_number,
-            btw_number=btw_number,
-            is_active=True
-        )
+        with db_session() as db:
+            # Check if user exists
+            existing = db.execute(_USER_BY_EMAIL, {'email': email}).scalar_one_or_none()
+            if existing:
+                logger.warning(f"User with email {email} already exists")
+                hashed_password.cancel()
+                return None
+
+            # Create new user
+            user = User(
+                email=email,
+                username=email.split('@')[0],
+                hashed_password=hashed_password.result(),
+                full_name=full_name,
+                company_name=company_name,
+                kvk_number=kvk_number,
+                btw_number=btw_number,
+                is_active=True
+            )
 
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+            db.add(user)
+            db.commit()
+            db.refresh(user)
 
-        logger.info(f"User created: {user.id}")
-        return user.id
+            logger.info(f"User created: {user.id}")
+            return user.id
 
     except Exception as e:
         logger.error(f"Error creating user: {e}")
-        db.rollback()
         return None
 
 def update_user_password(user_id: int, new_password: str) -> bool:
@@ -287,22 +340,21 @@ def update_user_password(user_id: int, new_password: str) -> bool:
         True if successful
     """
     try:
-        db = next(get_db())
+        with db_session() as db:
+            user = db.execute(_USER_BY_ID, {'user_id': user_id}).scalar_one_or_none()
 
-        user = db.query(User).filter(User.id == user_id).first()
+            if user:
+                user.hashed_password = get_password_hash(new_password)
+                user.updated_at = datetime.now()
+                db.commit()
+                _invalidate_auth_cache(user_id)
+                logger.info(f"Password updated for user {user_id}")
+                return True
 
-        if user:
-            user.hashed_password = get_password_hash(new_password)
-            user.updated_at = datetime.now()
-            db.commit()
-            logger.info(f"Password updated for user {user_id}")
-            return True
-
-        return False
+            return False
 
     except Exception as e:
         logger.error(f"Error updating password: {e}")
-        db.rollback()
         return False
 
 def deactivate_user(user_id: int) -> bool:
@@ -316,20 +368,19 @@ def deactivate_user(user_id: int) -> bool:
         True if successful
     """
     try:
-        db = next(get_db())
-
-        user = db.query(User).filter(User.id == user_id).first()
+        with db_session() as db:
+            user = db.execute(_USER_BY_ID, {'user_id': user_id}).scalar_one_or_none()
 
-        if user:
-            user.is_active = False
-            user.updated_at = datetime.now()
-            db.commit()
-            logger.info(f"User {user_id} deactivated")
-            return True
+            if user:
+                user.is_active = False
+                user.updated_at = datetime.now()
+                db.commit()
+                _invalidate_auth_cache(user_id)
+                logger.info(f"User {user_id} deactivated")
+                return True
 
-        return False
+            return False
 
     except Exception as e:
         logger.error(f"Error deactivating user: {e}")
-        db.rollback()
         return False
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""Coalesce concurrent single-item calls into batched requests."""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds run waits for a result unless given a timeout
+DEFAULT_TIMEOUT_SECONDS = 300
+
+# Seconds the collector thread stays idle before exiting; submit restarts it
+COLLECTOR_IDLE_SECONDS = 30
+
+class Batcher:
+    """
+    Collect items submitted from concurrent threads and process them together.
+
+    While no batch is running, an item is dispatched at once, so a lone
+    call doesn't wait. Otherwise a batch is dispatched once it holds
+    max_batch items or the oldest item has waited max_wait_ms. The handler
+    receives the list of items and must return a list of results in the
+    same order.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], List[Any]],
+        max_batch: int = 16,
+        max_wait_ms: int = 50,
+        queue_size: int = 64,
+        max_concurrent_batches: int = 4
+    ):
+        """
+        Initialize the batcher; its collector thread starts on the first submit.
+
+        Args:
+            handler: Function processing a list of items into a list of results
+            max_batch: Maximum number of items per batch
+            max_wait_ms: Maximum time the first item of a batch waits for company
+            queue_size: Maximum number of pending items before submit blocks
+            max_concurrent_batches: Number of batches the handler may run at once
+        """
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_batches,
+            thread_name_prefix='batcher'
+        )
+        self._lock = threading.Lock()
+        self._collector = None
+        self._in_flight = 0
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue an item for the next batch.
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Future resolving to the item's result
+        """
+        future = Future()
+        self._queue.put((item, future))
+
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name='batcher-collector', daemon=True)
+                self._collector.start()
+        return future
+
+    def run(self, item: Any, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> Any:
+        """
+        Queue an item and wait for its result.
+
+        Args:
+            item: Item to process
+            timeout: Seconds to wait for the result (default: DEFAULT_TIMEOUT_SECONDS)
+
+        Returns:
+            The handler's result for this item
+
+        Raises:
+            concurrent.futures.TimeoutError: If no result arrived in time
+        """
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        """
+        Group queued items into batches and hand them to the executor.
+
+        Exits after COLLECTOR_IDLE_SECONDS without items, so an unused
+        batcher holds no thread.
+        """
+        while True:
+            try:
+                batch = [self._queue.get(timeout=COLLECTOR_IDLE_SECONDS)]
+            except queue.Empty:
+                with self._lock:
+                    # submit queues before it checks the collector, so an
+                    # item that arrives now is seen here or starts a new one
+                    if self._queue.empty():
+                        self._collector = None
+                        return
+                continue
+
+            # Only wait for company while another batch is running; items
+            # already queued are always taken along
+            with self._lock:
+                busy = self._in_flight > 0
+            deadline = time.monotonic() + (self.max_wait if busy else 0)
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._in_flight += 1
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[Any, Future]]):
+        """Run the handler on a batch and resolve each caller's future."""
+        items = [item for item, _ in batch]
+        try:
+            results = self.handler(items)
+            if len(results) != len(items):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} items failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -3,13 +3,63 @@
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, List, Tuple
 from datetime import datetime
+from types import MappingProxyType
+
+import numpy as np
+
+try:
+    from numba import njit, prange, get_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:  # Run the kernels as plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+    def get_num_threads() -> int:
+        return 1
 
 from config import Config
 
+# Default deduction percentages per category (vat = BTW, ib = inkomstenbelasting)
+DEFAULT_DEDUCTION_RULES = MappingProxyType({
+    'Beroepskosten': MappingProxyType({'vat': 100, 'ib': 100}),
+    'Kantoorkosten': MappingProxyType({'vat': 100, 'ib': 100}),
+    'Reis- en verblijfkosten': MappingProxyType({'vat': 100, 'ib': 100}),
+    'Representatiekosten - Type 1 (Supermarket)': MappingProxyType({'vat': 0, 'ib': 80}),
+    'Representatiekosten - Type 2 (Horeca)': MappingProxyType({'vat': 0, 'ib': 80}),
+    'Vervoerskosten': MappingProxyType({'vat': 100, 'ib': 100}),
+    'Zakelijke opleidingskosten': MappingProxyType({'vat': 100, 'ib': 100})
+})
+
+# Rule for categories without a default
+FALLBACK_DEDUCTION_RULE = MappingProxyType({'vat': 100, 'ib': 100})
+
+def _div_half_up(numerator: int, denominator: int) -> int:
+    """Integer division rounding halves away from zero (like ROUND_HALF_UP)."""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return -quotient if numerator < 0 else quotient
+
+def _r2(x: float) -> float:
+    """Round to cents, halves away from zero (like ROUND_HALF_UP)."""
+    return int(x * 100 + (0.5 if x >= 0 else -0.5)) / 100
+
+# Compiled copy for use inside the Numba kernels
+_r2_jit = njit(cache=True)(_r2)
+
 def calculate_vat_amount(amount_excl_vat: float, vat_rate: float) -> float:
     """
     Calculate VAT amount from base amount.
 
+    Works in integer cents and basis points rather than Decimal, unless
+    Config.STRICT_DECIMAL is set. The amount is rounded to cents first, so
+    sub-cent inputs can differ from the Decimal result.
+
     Args:
         amount_excl_vat: Amount excluding VAT
         vat_rate: VAT rate as percentage (e.g., 21 for 21%)
@@ -17,13 +67,20 @@ def calculate_vat_amount(amount_excl_vat: float, vat_rate: float) -> float:
     Returns:
         VAT amount
     """
-    vat_decimal = Decimal(str(amount_excl_vat)) * Decimal(str(vat_rate / 100))
-    return float(vat_decimal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+    if Config.STRICT_DECIMAL:
+        return _vat_amount_decimal(amount_excl_vat, vat_rate)
+
+    amount_cents = round(amount_excl_vat * 100)
+    rate_bp = round(vat_rate * 100)
+    return _div_half_up(amount_cents * rate_bp, 10000) / 100
 
 def calculate_amount_excl_vat(amount_incl_vat: float, vat_rate: float) -> Tuple[float, float]:
     """
     Calculate base amount and VAT from total amount.
 
+    Works in integer cents like calculate_vat_amount, unless
+    Config.STRICT_DECIMAL is set.
+
     Args:
         amount_incl_vat: Total amount including VAT
         vat_rate: VAT rate as percentage
@@ -31,6 +88,22 @@ def calculate_amount_excl_vat(amount_incl_vat: float, vat_rate: float) -> Tuple[
     Returns:
         Tuple of (amount_excl_vat, vat_amount)
     """
+    if Config.STRICT_DECIMAL:
+        return _amount_excl_vat_decimal(amount_incl_vat, vat_rate)
+
+    amount_incl_cents = round(amount_incl_vat * 100)
+    rate_bp = round(vat_rate * 100)
+    amount_excl_cents = _div_half_up(amount_incl_cents * 10000, 10000 + rate_bp)
+
+    return amount_excl_cents / 100, (amount_incl_cents - amount_excl_cents) / 100
+
+def _vat_amount_decimal(amount_excl_vat: float, vat_rate: float) -> float:
+    """Decimal version of calculate_vat_amount, used with Config.STRICT_DECIMAL."""
+    vat_decimal = Decimal(str(amount_excl_vat)) * Decimal(str(vat_rate / 100))
+    return float(vat_decimal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+def _amount_excl_vat_decimal(amount_incl_vat: float, vat_rate: float) -> Tuple[float, float]:
+    """Decimal version of calculate_amount_excl_vat, used with Config.STRICT_DECIMAL."""
     divisor = Decimal('1') + Decimal(str(vat_rate / 100))
     amount_excl = Decimal(str(amount_incl_vat)) / divisor
     amount_excl = amount_excl.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -39,6 +112,13 @@ def calculate_amount_excl_vat(amount_incl_vat: float, vat_rate: float) -> Tuple[
 
     return float(amount_excl), float(vat_amount)
 
+# Breakdown keys checked by determine_vat_rate and the rate each implies
+# (the 6% rate changed to 9% in 2024)
+_VAT_RATE_ORDER = (('21', 21.0), ('9', 9.0), ('6', 9.0))
+
+# Marks a missing 'vat_rate' key, which is distinct from an explicit None
+_NO_VAT_RATE = object()
+
 def determine_vat_rate(receipt_data: Dict) -> float:
     """
     Determine applicable VAT rate based on receipt data.
@@ -50,21 +130,45 @@ def determine_vat_rate(receipt_data: Dict) -> float:
         VAT rate as percentage
     """
     # Check for explicit VAT rate in data
-    if 'vat_rate' in receipt_data:
-        return receipt_data['vat_rate']
-
-    # Check VAT breakdown
-    vat_breakdown = receipt_data.get('vat_breakdown', {})
-
-    if vat_breakdown.get('21', 0) > 0:
-        return 21.0
-    elif vat_breakdown.get('9', 0) > 0:
-        return 9.0
-    elif vat_breakdown.get('6', 0) > 0:
-        return 9.0  # 6% rate changed to 9% in 2024
-    else:
-        # Default to standard rate
-        return 21.0
+    vat_rate = receipt_data.get('vat_rate', _NO_VAT_RATE)
+    if vat_rate is not _NO_VAT_RATE:
+        return vat_rate
+
+    # Check VAT breakdown, most common rate first
+    vat_breakdown = receipt_data.get('vat_breakdown') or {}
+    for key, rate in _VAT_RATE_ORDER:
+        if vat_breakdown.get(key, 0) > 0:
+            return rate
+
+    # Default to standard rate
+    return 21.0
+
+@njit(cache=True)
+def _deduction_core(
+    vat_pct: float,
+    ib_pct: float,
+    amount_excl_vat: float,
+    vat_amount: float
+) -> Tuple[float, float, float, float, float, float]:
+    """
+    Unrounded deduction math behind calculate_tax_deductions.
+
+    Returns:
+        Tuple of (vat_deductible, ib_deductible, remainder_after_vat,
+        profit_deduction, total_deductible, net_cost)
+    """
+    vat_deductible = vat_amount * (vat_pct / 100)
+    ib_deductible = amount_excl_vat * (ib_pct / 100)
+    remainder_after_vat = amount_excl_vat + vat_amount - vat_deductible
+    profit_deduction = remainder_after_vat * (ib_pct / 100)
+    return (
+        vat_deductible,
+        ib_deductible,
+        remainder_after_vat,
+        profit_deduction,
+        vat_deductible + profit_deduction,
+        amount_excl_vat + vat_amount - vat_deductible - profit_deduction
+    )
 
 def calculate_tax_deductions(
     category: str,
@@ -84,50 +188,143 @@ def calculate_tax_deductions(
     Returns:
         Dictionary with deduction calculations
     """
-    # Default deduction rules
-    default_rules = {
-        'Beroepskosten': {'vat': 100, 'ib': 100},
-        'Kantoorkosten': {'vat': 100, 'ib': 100},
-        'Reis- en verblijfkosten': {'vat': 100, 'ib': 100},
-        'Representatiekosten - Type 1 (Supermarket)': {'vat': 0, 'ib': 80},
-        'Representatiekosten - Type 2 (Horeca)': {'vat': 0, 'ib': 80},
-        'Vervoerskosten': {'vat': 100, 'ib': 100},
-        'Zakelijke opleidingskosten': {'vat': 100, 'ib': 100}
-    }
-
     # Use custom percentages if provided, otherwise use defaults
     if custom_percentages and category in custom_percentages:
         rules = custom_percentages[category]
     else:
-        rules = default_rules.get(category, {'vat': 100, 'ib': 100})
+        rules = DEFAULT_DEDUCTION_RULES.get(category, FALLBACK_DEDUCTION_RULE)
+
+    # Deductible amounts, remainder after VAT refund and profit deduction (winstaftrek)
+    (
+        vat_deductible,
+        ib_deductible,
+        remainder_after_vat,
+        profit_deduction,
+        total_deductible,
+        net_cost
+    ) = _deduction_core(
+        float(rules['vat']),
+        float(rules['ib']),
+        float(amount_excl_vat),
+        float(vat_amount)
+    )
 
-    # Calculate deductible amounts
-    vat_deductible = vat_amount * (rules['vat'] / 100)
-    ib_deductible = amount_excl_vat * (rules['ib'] / 100)
+    return {
+        'vat_deductible_percentage': rules['vat'],
+        'ib_deductible_percentage': rules['ib'],
+        'vat_deductible_amount': _r2(vat_deductible),
+        'ib_deductible_amount': _r2(ib_deductible),
+        'remainder_after_vat': _r2(remainder_after_vat),
+        'profit_deduction': _r2(profit_deduction),
+        'total_deductible': _r2(total_deductible),
+        'net_cost': _r2(net_cost)
+    }
 
-    # Calculate remainder after VAT refund
-    remainder_after_vat = amount_excl_vat + vat_amount - vat_deductible
+# Index of each predefined category in the summary arrays
+_CATEGORY_INDEX = {category: idx for idx, category in enumerate(Config.EXPENSE_CATEGORIES)}
+
+# Column of each VAT rate in the per-receipt VAT rows
+_VAT_RATE_COLUMNS = {'6': 0, '9': 1, '21': 2}
+
+def _receipt_arrays(receipts: List[Dict], rules_table: Dict = None) -> Dict[str, np.ndarray]:
+    """
+    Extract the numeric receipt fields into parallel arrays.
+
+    Categories are encoded as indices into the returned 'categories' list;
+    the first entries are Config.EXPENSE_CATEGORIES in order, followed by
+    any other category seen. The deduction percentages per receipt are
+    resolved once per distinct category.
+
+    Args:
+        receipts: List of receipt dictionaries
+        rules_table: Optional custom deduction percentages per category
+
+    Returns:
+        Dictionary of arrays (amount_excl, vat_6, vat_9, vat_21, vat_total,
+        category_idx, vat_pct, ib_pct, vat_pct_by_cat, ib_pct_by_cat) plus
+        the 'categories' list
+    """
+    n = len(receipts)
 
-    # Calculate profit deduction (winstaftrek)
-    profit_deduction = remainder_after_vat * (rules['ib'] / 100)
+    categories = list(Config.EXPENSE_CATEGORIES)
+    category_index = dict(_CATEGORY_INDEX)
+
+    # One sweep per receipt resolves the category index and fills the
+    # 6/9/21% columns and the VAT total from the breakdown
+    indices = []
+    vat_rows = []
+    for receipt in receipts:
+        category = receipt.get('category', 'Kantoorkosten')
+        idx = category_index.get(category)
+        if idx is None:
+            idx = category_index[category] = len(categories)
+            categories.append(category)
+        indices.append(idx)
+
+        row = [0.0, 0.0, 0.0, 0.0]
+        for rate, amount in (receipt.get('vat_breakdown') or {}).items():
+            column = _VAT_RATE_COLUMNS.get(rate)
+            if column is not None:
+                row[column] = amount
+            row[3] += amount
+        vat_rows.append(row)
+
+    vat = np.array(vat_rows, dtype=float).reshape(n, 4)
+    index_dtype = np.int8 if len(categories) <= np.iinfo(np.int8).max else np.int16
+    category_idx = np.array(indices, dtype=index_dtype)
+
+    # Deduction percentages per distinct category, then per receipt
+    rules_table = rules_table or {}
+    rules = [
+        rules_table.get(category) or DEFAULT_DEDUCTION_RULES.get(category, FALLBACK_DEDUCTION_RULE)
+        for category in categories
+    ]
+    vat_pct_by_cat = np.array([r['vat'] for r in rules], dtype=float)
+    ib_pct_by_cat = np.array([r['ib'] for r in rules], dtype=float)
 
     return {
-        'vat_deductible_percentage': rules['vat'],
-        'ib_deductible_percentage': rules['ib'],
-        'vat_deductible_amount': round(vat_deductible, 2),
-        'ib_deductible_amount': round(ib_deductible, 2),
-        'remainder_after_vat': round(remainder_after_vat, 2),
-        'profit_deduction': round(profit_deduction, 2),
-        'total_deductible': round(vat_deductible + profit_deduction, 2),
-        'net_cost': round(amount_excl_vat + vat_amount - vat_deductible - profit_deduction, 2)
+        'amount_excl': np.fromiter((r.get('amount_excl_vat', 0) for r in receipts), dtype=float, count=n),
+        'vat_6': vat[:, 0],
+        'vat_9': vat[:, 1],
+        'vat_21': vat[:, 2],
+        'vat_total': vat[:, 3],
+        'category_idx': category_idx,
+        'vat_pct': vat_pct_by_cat[category_idx],
+        'ib_pct': ib_pct_by_cat[category_idx],
+        'vat_pct_by_cat': vat_pct_by_cat,
+        'ib_pct_by_cat': ib_pct_by_cat,
+        'categories': categories
     }
 
-def calculate_quarterly_vat(receipts: List[Dict]) -> Dict:
+def _deduction_arrays(
+    vat_pct: np.ndarray,
+    ib_pct: np.ndarray,
+    amount_excl: np.ndarray,
+    vat_amount: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized counterpart of calculate_tax_deductions.
+
+    Returns:
+        Tuple of (vat_deductible_amount, profit_deduction) arrays, each
+        rounded to cents per receipt like calculate_tax_deductions
+    """
+    vat_deductible = vat_amount * (vat_pct / 100)
+    remainder_after_vat = amount_excl + vat_amount - vat_deductible
+    profit_deduction = remainder_after_vat * (ib_pct / 100)
+    return _r2_array(vat_deductible), _r2_array(profit_deduction)
+
+def _r2_array(values: np.ndarray) -> np.ndarray:
+    """Vectorized _r2."""
+    return np.trunc(values * 100 + np.copysign(0.5, values)) / 100
+
+def calculate_quarterly_vat(receipts: List[Dict], rules_table: Dict = None) -> Dict:
     """
     Calculate quarterly VAT summary for tax declaration.
 
     Args:
         receipts: List of receipt dictionaries
+        rules_table: Optional custom deduction percentages per category
 
     Returns:
         Dictionary with quarterly VAT calculations
@@ -148,30 +345,21 @@ def calculate_quarterly_vat(receipts: List[Dict]) -> Dict:
         'receipt_count': len(receipts)
     }
 
-    for receipt in receipts:
-        # Add purchase amounts
-        amount_excl = receipt.get('amount_excl_vat', 0)
-        summary['total_purchases'] += amount_excl
-
-        # Add VAT amounts by rate
-        vat_breakdown = receipt.get('vat_breakdown', {})
-        for rate, amount in vat_breakdown.items():
-            if rate in summary['vat_on_purchases']:
-                summary['vat_on_purchases'][rate] += amount
-                summary['vat_on_purchases']['total'] += amount
-
-        # Calculate deductible VAT
-        category = receipt.get('category', 'Kantoorkosten')
-        deductions = calculate_tax_deductions(
-            category,
-            amount_excl,
-            sum(vat_breakdown.values())
-        )
+    arrays = _receipt_arrays(receipts, rules_table)
+    vat_deductible, _ = _deduction_arrays(
+        arrays['vat_pct'], arrays['ib_pct'], arrays['amount_excl'], arrays['vat_total']
+    )
 
-        summary['deductible_vat'] += deductions['vat_deductible_amount']
-        summary['non_deductible_vat'] += (
-            sum(vat_breakdown.values()) - deductions['vat_deductible_amount']
-        )
+    summary['total_purchases'] += float(arrays['amount_excl'].sum())
+
+    # Add VAT amounts by rate
+    for rate in ('6', '9', '21'):
+        rate_total = float(arrays['vat_' + rate].sum())
+        summary['vat_on_purchases'][rate] += rate_total
+        summary['vat_on_purchases']['total'] += rate_total
+
+    summary['deductible_vat'] += float(vat_deductible.sum())
+    summary['non_deductible_vat'] += float((arrays['vat_total'] - vat_deductible).sum())
 
     # Calculate VAT balance (negative = refund, positive = to pay)
     summary['vat_balance'] = summary['vat_on_sales'] - summary['deductible_vat']
@@ -187,12 +375,149 @@ def calculate_quarterly_vat(receipts: List[Dict]) -> Dict:
 
     return summary
 
-def calculate_annual_summary(receipts: List[Dict]) -> Dict:
+# Order of the totals returned by _annual_kernel and _annual_sums
+_ANNUAL_TOTAL_KEYS = (
+    'total_expenses',
+    'total_vat_paid',
+    'total_vat_refunded',
+    'deductible_expenses',
+    'non_deductible_expenses'
+)
+
+def _month_indices(receipts: List[Dict]) -> Tuple[List[str], np.ndarray]:
+    """
+    Map each receipt to its 'YYYY-MM' month.
+
+    Returns:
+        Tuple of (month keys in first-seen order, month index per receipt
+        with -1 for undated receipts)
+    """
+    month_index = {}
+    month_idx = np.full(len(receipts), -1, dtype=np.int64)
+    for i, receipt in enumerate(receipts):
+        receipt_date = receipt.get('date')
+        if receipt_date:
+            if isinstance(receipt_date, str):
+                # 'YYYY-MM-DD' strings already contain the month key
+                if len(receipt_date) == 10 and receipt_date[4] == '-' and receipt_date[7] == '-':
+                    month_key = receipt_date[:7]
+                else:
+                    month_key = datetime.strptime(receipt_date, '%Y-%m-%d').strftime('%Y-%m')
+            else:
+                month_key = receipt_date.strftime('%Y-%m')
+
+            month_idx[i] = month_index.setdefault(month_key, len(month_index))
+
+    return list(month_index), month_idx
+
+@njit(parallel=True, cache=True)
+def _annual_kernel(
+    amount_excl: np.ndarray,
+    vat_amount: np.ndarray,
+    category_idx: np.ndarray,
+    month_idx: np.ndarray,
+    vat_pct_by_cat: np.ndarray,
+    ib_pct_by_cat: np.ndarray,
+    n_categories: int,
+    n_months: int,
+    n_chunks: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Accumulate the annual summary in parallel over receipts.
+
+    Receipts are split into n_chunks chunks (one per thread); each chunk adds
+    into its own row of the accumulators, which are summed at the end. The
+    thread count is passed in rather than read here, since a kernel calling
+    get_num_threads can't be cached to disk.
+
+    Returns:
+        Tuple of (totals in _ANNUAL_TOTAL_KEYS order, per-category
+        [count, amount_excl_vat, vat, total, deductible], per-month
+        [count, total, vat, deductible])
+    """
+    n = amount_excl.shape[0]
+    chunk_size = (n + n_chunks - 1) // n_chunks
+
+    totals = np.zeros((n_chunks, 5))
+    category_sums = np.zeros((n_chunks, n_categories, 5))
+    month_sums = np.zeros((n_chunks, n_months, 4))
+
+    for c in prange(n_chunks):
+        for i in range(c * chunk_size, min(n, (c + 1) * chunk_size)):
+            cat = category_idx[i]
+            amount = amount_excl[i]
+            vat = vat_amount[i]
+            total = amount + vat
+
+            vat_deductible = vat * (vat_pct_by_cat[cat] / 100)
+            profit_deduction = _r2_jit((amount + vat - vat_deductible) * (ib_pct_by_cat[cat] / 100))
+            vat_deductible = _r2_jit(vat_deductible)
+
+            totals[c, 0] += total
+            totals[c, 1] += vat
+            totals[c, 2] += vat_deductible
+            totals[c, 3] += profit_deduction
+            totals[c, 4] += amount - profit_deduction
+
+            category_sums[c, cat, 0] += 1
+            category_sums[c, cat, 1] += amount
+            category_sums[c, cat, 2] += vat
+            category_sums[c, cat, 3] += total
+            category_sums[c, cat, 4] += profit_deduction
+
+            month = month_idx[i]
+            if month >= 0:
+                month_sums[c, month, 0] += 1
+                month_sums[c, month, 1] += total
+                month_sums[c, month, 2] += vat
+                month_sums[c, month, 3] += profit_deduction
+
+    return totals.sum(axis=0), category_sums.sum(axis=0), month_sums.sum(axis=0)
+
+def _annual_sums(
+    arrays: Dict[str, np.ndarray],
+    month_idx: np.ndarray,
+    n_months: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """NumPy counterpart of _annual_kernel, used when Numba isn't installed."""
+    amount_excl = arrays['amount_excl']
+    vat_amount = arrays['vat_total']
+    total_amount = amount_excl + vat_amount
+    vat_deductible, profit_deduction = _deduction_arrays(
+        arrays['vat_pct'], arrays['ib_pct'], amount_excl, vat_amount
+    )
+
+    totals = np.array([
+        total_amount.sum(),
+        vat_amount.sum(),
+        vat_deductible.sum(),
+        profit_deduction.sum(),
+        (amount_excl - profit_deduction).sum()
+    ])
+
+    category_idx = arrays['category_idx']
+    n_categories = len(arrays['categories'])
+    category_sums = np.column_stack([
+        np.bincount(category_idx, weights=weights, minlength=n_categories)
+        for weights in (np.ones_like(amount_excl), amount_excl, vat_amount, total_amount, profit_deduction)
+    ])
+
+    dated = month_idx >= 0
+    idx = month_idx[dated]
+    month_sums = np.column_stack([
+        np.bincount(idx, weights=weights[dated], minlength=n_months)
+        for weights in (np.ones_like(amount_excl), total_amount, vat_amount, profit_deduction)
+    ]) if n_months else np.zeros((0, 4))
+
+    return totals, category_sums, month_sums
+
+def calculate_annual_summary(receipts: List[Dict], rules_table: Dict = None) -> Dict:
     """
     Calculate annual summary for income tax purposes.
 
     Args:
         receipts: List of receipt dictionaries
+        rules_table: Optional custom deduction percentages per category
 
     Returns:
         Dictionary with annual summary
@@ -218,68 +543,60 @@ def calculate_annual_summary(receipts: List[Dict]) -> Dict:
             'deductible': 0
         }
 
-    # Process each receipt
-    for receipt in receipts:
-        amount_excl = receipt.get('amount_excl_vat', 0)
-        vat_amount = sum(receipt.get('vat_breakdown', {}).values())
-        total_amount = amount_excl + vat_amount
-        category = receipt.get('category', 'Kantoorkosten')
-
-        # Update totals
-        summary['total_expenses'] += total_amount
-        summary['total_vat_paid'] += vat_amount
-
-        # Update category totals
-        if category in summary['by_category']:
-            summary['by_category'][category]['count'] += 1
-            summary['by_category'][category]['amount_excl_vat'] += amount_excl
-            summary['by_category'][category]['vat'] += vat_amount
-            summary['by_category'][category]['total'] += total_amount
-
-        # Calculate deductions
-        deductions = calculate_tax_deductions(category, amount_excl, vat_amount)
-
-        summary['total_vat_refunded'] += deductions['vat_deductible_amount']
-        summary['deductible_expenses'] += deductions['profit_deduction']
-        summary['non_deductible_expenses'] += (
-            amount_excl - deductions['profit_deduction']
+    arrays = _receipt_arrays(receipts, rules_table)
+    month_keys, month_idx = _month_indices(receipts)
+
+    if NUMBA_AVAILABLE:
+        totals, category_sums, month_sums = _annual_kernel(
+            arrays['amount_excl'],
+            arrays['vat_total'],
+            arrays['category_idx'],
+            month_idx,
+            arrays['vat_pct_by_cat'],
+            arrays['ib_pct_by_cat'],
+            len(arrays['categories']),
+            len(month_keys),
+            get_num_threads()
         )
-
-        if category in summary['by_category']:
-            summary['by_category'][category]['deductible'] += deductions['profit_deduction']
-
-        # Update monthly totals
-        receipt_date = receipt.get('date')
-        if receipt_date:
-            if isinstance(receipt_date, str):
-                receipt_date = datetime.strptime(receipt_date, '%Y-%m-%d')
-
-            month_key = receipt_date.strftime('%Y-%m')
-
-            if month_key not in summary['by_month']:
-                summary['by_month'][month_key] = {
-                    'count': 0,
-                    'total': 0,
-                    'vat': 0,
-                    'deductible': 0
-                }
-
-            summary['by_month'][month_key]['count'] += 1
-            summary['by_month'][month_key]['total'] += total_amount
-            summary['by_month'][month_key]['vat'] += vat_amount
-            summary['by_month'][month_key]['deductible'] += deductions['profit_deduction']
+    else:
+        totals, category_sums, month_sums = _annual_sums(arrays, month_idx, len(month_keys))
+
+    # Update totals
+    for key, value in zip(_ANNUAL_TOTAL_KEYS, totals):
+        summary[key] += float(value)
+
+    # Update category totals (only the predefined categories are reported)
+    for idx, category in enumerate(Config.EXPENSE_CATEGORIES):
+        count, amount_excl, vat, total, deductible = category_sums[idx]
+        category_summary = summary['by_category'][category]
+        category_summary['count'] += int(count)
+        category_summary['amount_excl_vat'] += float(amount_excl)
+        category_summary['vat'] += float(vat)
+        category_summary['total'] += float(total)
+        category_summary['deductible'] += float(deductible)
+
+    # Update monthly totals
+    for m, month_key in enumerate(month_keys):
+        count, total, vat, deductible = month_sums[m]
+        summary['by_month'][month_key] = {
+            'count': int(count),
+            'total': float(total),
+            'vat': float(vat),
+            'deductible': float(deductible)
+        }
 
     # Round all values
     summary = round_nested_dict(summary)
 
     return summary
 
-def calculate_vat_summary(receipts: List[Dict]) -> Dict:
+def calculate_vat_summary(receipts: List[Dict], rules_table: Dict = None) -> Dict:
     """
     Calculate VAT summary for display.
 
     Args:
         receipts: List of receipt dictionaries
+        rules_table: Optional custom deduction percentages per category
 
     Returns:
         Dictionary with VAT summary
@@ -294,27 +611,22 @@ def calculate_vat_summary(receipts: List[Dict]) -> Dict:
         'effective_rate': 0
     }
 
-    total_amount = 0
-
-    for receipt in receipts:
-        vat_breakdown = receipt.get('vat_breakdown', {})
-
-        summary['vat_6'] += vat_breakdown.get('6', 0)
-        summary['vat_9'] += vat_breakdown.get('9', 0)
-        summary['vat_21'] += vat_breakdown.get('21', 0)
-
-        total_vat = sum(vat_breakdown.values())
-        summary['total_vat'] += total_vat
+    arrays = _receipt_arrays(receipts, rules_table)
+    vat_total = arrays['vat_total']
+    vat_deductible, _ = _deduction_arrays(
+        arrays['vat_pct'], arrays['ib_pct'], arrays['amount_excl'], vat_total
+    )
 
-        # Calculate deductible portion
-        category = receipt.get('category', 'Kantoorkosten')
-        amount_excl = receipt.get('amount_excl_vat', 0)
-        deductions = calculate_tax_deductions(category, amount_excl, total_vat)
+    summary['vat_6'] += float(arrays['vat_6'].sum())
+    summary['vat_9'] += float(arrays['vat_9'].sum())
+    summary['vat_21'] += float(arrays['vat_21'].sum())
+    summary['total_vat'] += float(vat_total.sum())
 
-        summary['deductible_vat'] += deductions['vat_deductible_amount']
-        summary['non_deductible_vat'] += total_vat - deductions['vat_deductible_amount']
+    # Calculate deductible portion
+    summary['deductible_vat'] += float(vat_deductible.sum())
+    summary['non_deductible_vat'] += float((vat_total - vat_deductible).sum())
 
-        total_amount += amount_excl + total_vat
+    total_amount = float((arrays['amount_excl'] + vat_total).sum())
 
     # Calculate effective VAT rate
     if total_amount > 0:
@@ -337,52 +649,36 @@ def calculate_expense_summary(receipts: List[Dict]) -> Dict:
     Returns:
         Dictionary with expense summary
     """
-    summary = {}
+    arrays = _receipt_arrays(receipts)
+    amounts = arrays['amount_excl'] + arrays['vat_total']
 
-    for category in Config.EXPENSE_CATEGORIES:
-        summary[category] = {
-            'count': 0,
-            'total': 0,
-            'average': 0,
-            'percentage': 0
-        }
-
-    total_amount = 0
-
-    for receipt in receipts:
-        category = receipt.get('category', 'Kantoorkosten')
-        amount = (
-            receipt.get('amount_excl_vat', 0) +
-            sum(receipt.get('vat_breakdown', {}).values())
-        )
+    # Only the predefined categories count towards the totals
+    n_categories = len(Config.EXPENSE_CATEGORIES)
+    category_idx = arrays['category_idx']
+    known = category_idx < n_categories
+    totals = np.bincount(category_idx[known], weights=amounts[known], minlength=n_categories)
+    counts = np.bincount(category_idx[known], minlength=n_categories)
+    total_amount = totals.sum()
 
-        if category in summary:
-            summary[category]['count'] += 1
-            summary[category]['total'] += amount
-            total_amount += amount
+    averages = np.divide(totals, counts, out=np.zeros(n_categories), where=counts > 0)
+    percentages = totals / total_amount * 100 if total_amount > 0 else np.zeros(n_categories)
 
-    # Calculate averages and percentages
-    for category in summary:
-        if summary[category]['count'] > 0:
-            summary[category]['average'] = (
-                summary[category]['total'] / summary[category]['count']
-            )
-
-        if total_amount > 0:
-            summary[category]['percentage'] = (
-                summary[category]['total'] / total_amount * 100
-            )
-
-        # Round values
-        summary[category]['total'] = round(summary[category]['total'], 2)
-        summary[category]['average'] = round(summary[category]['average'], 2)
-        summary[category]['percentage'] = round(summary[category]['percentage'], 1)
+    summary = {}
+    for category, count, total, average, percentage in zip(
+        Config.EXPENSE_CATEGORIES, counts, totals, averages, percentages
+    ):
+        summary[category] = {
+            'count': int(count),
+            'total': round(float(total), 2),
+            'average': round(float(average), 2),
+            'percentage': round(float(percentage), 1)
+        }
 
     return summary
 
 def round_nested_dict(d: Dict, decimals: int = 2) -> Dict:
     """
-    Recursively round all float values in a nested dictionary.
+    Round all float values in a nested dictionary in place.
 
     Args:
         d: Dictionary to round
@@ -391,10 +687,13 @@ def round_nested_dict(d: Dict, decimals: int = 2) -> Dict:
     Returns:
         Dictionary with rounded values
     """
-    for key, value in d.items():
-        if isinstance(value, float):
-            d[key] = round(value, decimals)
-        elif isinstance(value, dict):
-            d[key] = round_nested_dict(value, decimals)
-
-    return d
\ No newline at end of file
+    stack = [d]
+    while stack:
+        current = stack.pop()
+        for key, value in current.items():
+            if type(value) is float:
+                current[key] = round(value, decimals)
+            elif type(value) is dict:
+                stack.append(value)
+
+    return d
@@ -1,16 +1,36 @@
 """Database utility functions for data operations."""
 
 import logging
-from typing import List, Dict, Optional, Any
+from functools import lru_cache
+from typing import List, Dict, Optional, Any, Iterator
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc
+from sqlalchemy.orm import Session, joinedload, contains_eager
+from sqlalchemy import and_, or_, desc, case, func, update
+from sqlalchemy.dialects import postgresql, sqlite
 
 from database.models import Receipt, ExtractedData, User, AuditLog, UserSettings, CategoryTaxRule
 from database.connection import get_db
 
 logger = logging.getLogger(__name__)
 
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+_upsert_dialects = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# Columns save_extracted_data may set (the keys are set by the function itself)
+_EXTRACTED_DATA_COLUMNS = frozenset(ExtractedData.__table__.columns.keys()) - {'id', 'receipt_id'}
+
+def _session(db: Optional[Session]) -> tuple:
+    """
+    Resolve the session a helper should use.
+
+    Returns:
+        Tuple of (session, owned); owned sessions are committed by the
+        helper itself, shared ones are left to the caller's transaction
+    """
+    if db is not None:
+        return db, False
+    return next(get_db()), True
+
 def get_receipt_stats(user_id: int = None, date_range: tuple = None) -> Dict:
     """
     Get receipt statistics for dashboard.
@@ -25,7 +45,19 @@ def get_receipt_stats(user_id: int = None, date_range: tuple = None) -> Dict:
     try:
         db = next(get_db())
 
-        query = db.query(Receipt)
+        # Count and sum in SQL so only one row of aggregates is returned
+        query = db.query(
+            func.count(Receipt.id),
+            func.count(case((Receipt.processing_status == 'completed', 1))),
+            func.count(case((Receipt.processing_status == 'pending', 1))),
+            func.count(case((Receipt.processing_status == 'failed', 1))),
+            func.coalesce(func.sum(ExtractedData.total_incl_vat), 0),
+            func.coalesce(func.sum(
+                func.coalesce(ExtractedData.vat_6_amount, 0) +
+                func.coalesce(ExtractedData.vat_9_amount, 0) +
+                func.coalesce(ExtractedData.vat_21_amount, 0)
+            ), 0)
+        ).select_from(Receipt).outerjoin(ExtractedData, ExtractedData.receipt_id == Receipt.id)
 
         if user_id:
             query = query.filter(Receipt.user_id == user_id)
@@ -38,27 +70,17 @@ def get_receipt_stats(user_id: int = None, date_range: tuple = None) -> Dict:
                 )
             )
 
-        receipts = query.all()
+        total, processed, pending, failed, total_amount, total_vat = query.first()
 
         stats = {
-            'total_receipts': len(receipts),
-            'processed': sum(1 for r in receipts if r.processing_status == 'completed'),
-            'pending': sum(1 for r in receipts if r.processing_status == 'pending'),
-            'failed': sum(1 for r in receipts if r.processing_status == 'failed'),
-            'total_amount': 0,
-            'total_vat': 0
+            'total_receipts': total,
+            'processed': processed,
+            'pending': pending,
+            'failed': failed,
+            'total_amount': float(total_amount),
+            'total_vat': float(total_vat)
         }
 
-        # Calculate financial totals
-        for receipt in receipts:
-            if receipt.extracted_data:
-                stats['total_amount'] += float(receipt.extracted_data.total_incl_vat or 0)
-                stats['total_vat'] += (
-                    float(receipt.extracted_data.vat_6_amount or 0) +
-                    float(receipt.extracted_data.vat_9_amount or 0) +
-                    float(receipt.extracted_data.vat_21_amount or 0)
-                )
-
         return stats
 
     except Exception as e:
@@ -91,7 +113,9 @@ def get_recent_receipts(
     try:
         db = next(get_db())
 
-        query = db.query(Receipt).filter(Receipt.is_deleted == False)
+        query = db.query(Receipt).options(
+            joinedload(Receipt.extracted_data)
+        ).filter(Receipt.is_deleted == False)
 
         if user_id:
             query = query.filter(Receipt.user_id == user_id)
@@ -131,7 +155,8 @@ def save_receipt_to_db(
     original_filename: str,
     file_size: int,
     file_type: str,
-    user_id: int = None
+    user_id: int = None,
+    db: Session = None
 ) -> Optional[int]:
     """
     Save receipt information to database.
@@ -142,13 +167,13 @@ def save_receipt_to_db(
         file_size: File size in bytes
         file_type: MIME type
         user_id: User ID
+        db: Optional session of an enclosing transaction
 
     Returns:
         Receipt ID if successful, None otherwise
     """
+    db, owned = _session(db)
     try:
-        db = next(get_db())
-
         # Generate receipt number
         receipt_number = f"R{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
@@ -164,20 +189,26 @@ def save_receipt_to_db(
         )
 
         db.add(receipt)
-        db.commit()
-        db.refresh(receipt)
+        if owned:
+            db.commit()
+            db.refresh(receipt)
+        else:
+            db.flush()
 
         logger.info(f"Receipt saved to database: {receipt.id}")
         return receipt.id
 
     except Exception as e:
         logger.error(f"Error saving receipt to database: {e}")
+        if not owned:
+            raise
         db.rollback()
         return None
 
 def save_extracted_data(
     receipt_id: int,
-    extracted_data: Dict
+    extracted_data: Dict,
+    db: Session = None
 ) -> bool:
     """
     Save extracted data for a receipt.
@@ -185,50 +216,115 @@ def save_extracted_data(
     Args:
         receipt_id: Receipt ID
         extracted_data: Dictionary with extracted data
+        db: Optional session of an enclosing transaction
 
     Returns:
         True if successful
     """
+    db, owned = _session(db)
     try:
-        db = next(get_db())
-
-        # Check if extracted data already exists
-        existing = db.query(ExtractedData).filter(
-            ExtractedData.receipt_id == receipt_id
-        ).first()
+        data = {
+            key: value for key, value in extracted_data.items()
+            if key in _EXTRACTED_DATA_COLUMNS
+        }
+        upsert = _upsert_dialects.get(db.get_bind().dialect.name)
+
+        if upsert:
+            # Insert or update the row in a single statement
+            stmt = upsert(ExtractedData).values(receipt_id=receipt_id, **data)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=['receipt_id'],
+                set_={**data, 'updated_at': datetime.utcnow()}
+            ))
+        else:
+            existing = db.query(ExtractedData).filter(
+                ExtractedData.receipt_id == receipt_id
+            ).first()
 
-        if existing:
-            # Update existing record
-            for key, value in extracted_data.items():
-                if hasattr(existing, key):
+            if existing:
+                for key, value in data.items():
                     setattr(existing, key, value)
-        else:
-            # Create new record
-            data = ExtractedData(
-                receipt_id=receipt_id,
-                **extracted_data
+            else:
+                db.add(ExtractedData(receipt_id=receipt_id, **data))
+
+        # Update receipt status without loading it
+        db.execute(
+            update(Receipt).where(Receipt.id == receipt_id).values(
+                processing_status='completed',
+                updated_at=datetime.now()
             )
-            db.add(data)
-
-        # Update receipt status
-        receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-        if receipt:
-            receipt.processing_status = 'completed'
-            receipt.updated_at = datetime.now()
+        )
 
-        db.commit()
+        if owned:
+            db.commit()
         logger.info(f"Extracted data saved for receipt {receipt_id}")
         return True
 
     except Exception as e:
         logger.error(f"Error saving extracted data: {e}")
+        if not owned:
+            raise
+        db.rollback()
+        return False
+
+def save_extracted_data_bulk(rows: List[tuple]) -> bool:
+    """
+    Save extracted data for several receipts in a single transaction.
+
+    New rows are bulk-inserted, existing rows bulk-updated, and all
+    receipts are marked completed with one UPDATE.
+
+    Args:
+        rows: List of (receipt_id, extracted_data) tuples
+
+    Returns:
+        True if successful
+    """
+    if not rows:
+        return True
+
+    try:
+        db = next(get_db())
+
+        receipt_ids = [receipt_id for receipt_id, _ in rows]
+        existing_ids = dict(
+            db.query(ExtractedData.receipt_id, ExtractedData.id).filter(
+                ExtractedData.receipt_id.in_(receipt_ids)
+            ).all()
+        )
+
+        inserts = []
+        updates = []
+        for receipt_id, extracted_data in rows:
+            if receipt_id in existing_ids:
+                updates.append({'id': existing_ids[receipt_id], **extracted_data})
+            else:
+                inserts.append({'receipt_id': receipt_id, **extracted_data})
+
+        if inserts:
+            db.bulk_insert_mappings(ExtractedData, inserts)
+        if updates:
+            db.bulk_update_mappings(ExtractedData, updates)
+
+        db.query(Receipt).filter(Receipt.id.in_(receipt_ids)).update(
+            {Receipt.processing_status: 'completed', Receipt.updated_at: datetime.now()},
+            synchronize_session=False
+        )
+
+        db.commit()
+        logger.info(f"Extracted data saved for {len(rows)} receipts")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error saving extracted data in bulk: {e}")
         db.rollback()
         return False
 
 def update_receipt_status(
     receipt_id: int,
     status: str,
-    error_msg: str = None
+    error_msg: str = None,
+    db: Session = None
 ) -> bool:
     """
     Update receipt processing status.
@@ -237,20 +333,21 @@ def update_receipt_status(
         receipt_id: Receipt ID
         status: New status
         error_msg: Optional error message
+        db: Optional session of an enclosing transaction
 
     Returns:
         True if successful
     """
+    db, owned = _session(db)
     try:
-        db = next(get_db())
-
         receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
 
         if receipt:
             receipt.processing_status = status
             receipt.processing_error = error_msg
             receipt.updated_at = datetime.now()
-            db.commit()
+            if owned:
+                db.commit()
             logger.info(f"Receipt {receipt_id} status updated to {status}")
             return True
 
@@ -258,6 +355,48 @@ def update_receipt_status(
 
     except Exception as e:
         logger.error(f"Error updating receipt status: {e}")
+        if not owned:
+            raise
+        db.rollback()
+        return False
+
+def bulk_update_receipt_statuses(status_map: Dict[int, tuple]) -> bool:
+    """
+    Update the processing status of several receipts in one statement.
+
+    Args:
+        status_map: Dictionary of receipt_id -> (status, error_msg)
+
+    Returns:
+        True if successful
+    """
+    if not status_map:
+        return True
+
+    try:
+        db = next(get_db())
+
+        db.query(Receipt).filter(Receipt.id.in_(list(status_map))).update(
+            {
+                Receipt.processing_status: case(
+                    {receipt_id: status for receipt_id, (status, _) in status_map.items()},
+                    value=Receipt.id
+                ),
+                Receipt.processing_error: case(
+                    {receipt_id: error_msg for receipt_id, (_, error_msg) in status_map.items()},
+                    value=Receipt.id
+                ),
+                Receipt.updated_at: datetime.now()
+            },
+            synchronize_session=False
+        )
+
+        db.commit()
+        logger.info(f"Status updated for {len(status_map)} receipts")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error updating receipt statuses: {e}")
         db.rollback()
         return False
 
@@ -287,6 +426,8 @@ def search_receipts(
             ExtractedData,
             Receipt.id == ExtractedData.receipt_id,
             isouter=True
+        ).options(
+            contains_eager(Receipt.extracted_data)
         ).filter(Receipt.is_deleted == False)
 
         if user_id:
@@ -348,6 +489,54 @@ def search_receipts(
         logger.error(f"Error searching receipts: {e}")
         return []
 
+def iter_failed_receipts(user_id: int = None, page_size: int = 500) -> Iterator[List[Dict]]:
+    """
+    Yield failed receipts in pages, using keyset pagination on the ID.
+
+    Args:
+        user_id: User ID for filtering
+        page_size: Number of receipts per page
+
+    Yields:
+        Lists of receipts with id, file_path and filename
+    """
+    db = next(get_db())
+    last_id = 0
+
+    try:
+        while True:
+            query = db.query(
+                Receipt.id,
+                Receipt.file_path,
+                Receipt.original_filename
+            ).filter(
+                Receipt.is_deleted == False,
+                Receipt.processing_status == 'failed',
+                Receipt.id > last_id
+            )
+
+            if user_id:
+                query = query.filter(Receipt.user_id == user_id)
+
+            rows = query.order_by(Receipt.id).limit(page_size).all()
+            if not rows:
+                return
+
+            yield [
+                {'id': row.id, 'file_path': row.file_path, 'filename': row.original_filename}
+                for row in rows
+            ]
+
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1].id
+
+    except Exception as e:
+        logger.error(f"Error fetching failed receipts: {e}")
+
+    finally:
+        db.close()
+
 def log_audit_event(
     user_id: int,
     action: str,
@@ -355,17 +544,19 @@ def log_audit_event(
     entity_id: int,
     old_values: Dict = None,
     new_values: Dict = None,
-    ip_address: str = None
+    ip_address: str = None,
+    db: Session = None
 ):
     """
     Log an audit event.
 
     Args:
         Various audit parameters
+        db: Optional session of an enclosing transaction; the event is
+            committed with it instead of on its own
     """
+    db, owned = _session(db)
     try:
-        db = next(get_db())
-
         audit = AuditLog(
             user_id=user_id,
             action=action,
@@ -377,7 +568,8 @@ def log_audit_event(
         )
 
         db.add(audit)
-        db.commit()
+        if owned:
+            db.commit()
 
         logger.info(f"Audit logged: {action} on {entity_type} {entity_id}")
 
@@ -388,24 +580,45 @@ def get_receipts_for_export(
     user_id: int,
     date_from: datetime,
     date_to: datetime,
-    categories: List[str] = None
-) -> List[Dict]:
+    categories: List[str] = None,
+    batch_size: int = 500
+) -> Iterator[Dict]:
     """
-    Get receipts for export with all details.
+    Stream receipts for export with all details.
+
+    Rows are fetched in batches of batch_size so only one batch is held in
+    memory at a time.
 
     Args:
         user_id: User ID
         date_from: Start date
         date_to: End date
         categories: Optional category filter
+        batch_size: Number of rows fetched per round-trip
 
-    Returns:
-        List of receipt dictionaries with full details
+    Yields:
+        Receipt dictionaries with full details
     """
-    try:
-        db = next(get_db())
+    db = next(get_db())
 
-        query = db.query(Receipt).join(
+    try:
+        # Plain row tuples; no ORM objects are needed for a read-only export
+        query = db.query(
+            Receipt.receipt_number,
+            ExtractedData.transaction_date,
+            ExtractedData.vendor_name,
+            ExtractedData.expense_category,
+            ExtractedData.amount_excl_vat,
+            ExtractedData.vat_6_amount,
+            ExtractedData.vat_9_amount,
+            ExtractedData.vat_21_amount,
+            ExtractedData.total_incl_vat,
+            ExtractedData.vat_deductible_percentage,
+            ExtractedData.ib_deductible_percentage,
+            ExtractedData.vat_refund_amount,
+            ExtractedData.profit_deduction,
+            ExtractedData.explanation
+        ).join(
             ExtractedData,
             Receipt.id == ExtractedData.receipt_id
         ).filter(
@@ -421,34 +634,29 @@ def get_receipts_for_export(
         if categories:
             query = query.filter(ExtractedData.expense_category.in_(categories))
 
-        receipts = query.order_by(ExtractedData.transaction_date).all()
-
-        result = []
-        for receipt in receipts:
-            ed = receipt.extracted_data
-            data = {
-                'receipt_number': receipt.receipt_number,
-                'transaction_date': ed.transaction_date,
-                'vendor_name': ed.vendor_name,
-                'category': ed.expense_category,
-                'amount_excl_vat': float(ed.amount_excl_vat or 0),
-                'vat_6': float(ed.vat_6_amount or 0),
-                'vat_9': float(ed.vat_9_amount or 0),
-                'vat_21': float(ed.vat_21_amount or 0),
-                'total_incl_vat': float(ed.total_incl_vat or 0),
-                'vat_deductible_percentage': ed.vat_deductible_percentage or 0,
-                'ib_deductible_percentage': ed.ib_deductible_percentage or 0,
-                'vat_refund': float(ed.vat_refund_amount or 0),
-                'profit_deduction': float(ed.profit_deduction or 0),
-                'explanation': ed.explanation
+        for row in query.order_by(ExtractedData.transaction_date).yield_per(batch_size):
+            yield {
+                'receipt_number': row.receipt_number,
+                'transaction_date': row.transaction_date,
+                'vendor_name': row.vendor_name,
+                'category': row.expense_category,
+                'amount_excl_vat': float(row.amount_excl_vat or 0),
+                'vat_6': float(row.vat_6_amount or 0),
+                'vat_9': float(row.vat_9_amount or 0),
+                'vat_21': float(row.vat_21_amount or 0),
+                'total_incl_vat': float(row.total_incl_vat or 0),
+                'vat_deductible_percentage': row.vat_deductible_percentage or 0,
+                'ib_deductible_percentage': row.ib_deductible_percentage or 0,
+                'vat_refund': float(row.vat_refund_amount or 0),
+                'profit_deduction': float(row.profit_deduction or 0),
+                'explanation': row.explanation
             }
-            result.append(data)
-
-        return result
 
     except Exception as e:
         logger.error(f"Error getting receipts for export: {e}")
-        return []
+
+    finally:
+        db.close()
 
 def get_category_tax_rules(user_settings_id: int = 1) -> Dict[str, Dict[str, float]]:
     """
@@ -461,25 +669,34 @@ def get_category_tax_rules(user_settings_id: int = 1) -> Dict[str, Dict[str, flo
         Dictionary mapping category names to their tax percentages
     """
     try:
-        db = next(get_db())
-
-        rules = db.query(CategoryTaxRule).filter(
-            CategoryTaxRule.user_settings_id == user_settings_id
-        ).all()
-
-        result = {}
-        for rule in rules:
-            result[rule.category_name] = {
-                'vat_deductible': rule.vat_deductible_percentage,
-                'ib_deductible': rule.ib_deductible_percentage
-            }
-
-        return result
+        # Copy so callers can't modify the cached table
+        return {
+            category: dict(percentages)
+            for category, percentages in _load_category_tax_rules(user_settings_id).items()
+        }
 
     except Exception as e:
         logger.error(f"Error getting category tax rules: {e}")
         return {}
 
+@lru_cache(maxsize=16)
+def _load_category_tax_rules(user_settings_id: int) -> Dict[str, Dict[str, float]]:
+    """Load the tax rules table once; cleared by save_category_tax_rules and clear_settings_caches."""
+    db = next(get_db())
+
+    rules = db.query(CategoryTaxRule).filter(
+        CategoryTaxRule.user_settings_id == user_settings_id
+    ).all()
+
+    result = {}
+    for rule in rules:
+        result[rule.category_name] = {
+            'vat_deductible': rule.vat_deductible_percentage,
+            'ib_deductible': rule.ib_deductible_percentage
+        }
+
+    return result
+
 def save_category_tax_rules(rules: Dict[str, Dict[str, float]], user_settings_id: int = 1):
     """
     Save category-specific tax deduction rules to database.
@@ -494,19 +711,21 @@ def save_category_tax_rules(rules: Dict[str, Dict[str, float]], user_settings_id
         # Delete existing rules for this user
         db.query(CategoryTaxRule).filter(
             CategoryTaxRule.user_settings_id == user_settings_id
-        ).delete()
-
-        # Create new rules
-        for category_name, percentages in rules.items():
-            rule = CategoryTaxRule(
-                user_settings_id=user_settings_id,
-                category_name=category_name,
-                vat_deductible_percentage=percentages['vat'],
-                ib_deductible_percentage=percentages['ib']
-            )
-            db.add(rule)
+        ).delete(synchronize_session=False)
+
+        # Create new rules in one multi-row INSERT
+        db.bulk_insert_mappings(CategoryTaxRule, [
+            {
+                'user_settings_id': user_settings_id,
+                'category_name': category_name,
+                'vat_deductible_percentage': percentages['vat'],
+                'ib_deductible_percentage': percentages['ib']
+            }
+            for category_name, percentages in rules.items()
+        ])
 
         db.commit()
+        _load_category_tax_rules.cache_clear()
         logger.info(f"Saved {len(rules)} category tax rules for user_settings_id {user_settings_id}")
 
     except Exception as e:
@@ -524,19 +743,29 @@ def ensure_user_settings_exists(user_id: int = 1) -> int:
         UserSettings ID
     """
     try:
-        db = next(get_db())
+        return _user_settings_id(user_id)
 
-        settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
+    except Exception as e:
+        logger.error(f"Error ensuring user settings exists: {e}")
+        return 1
 
-        if not settings:
-            settings = UserSettings(user_id=user_id)
-            db.add(settings)
-            db.commit()
-            db.refresh(settings)
-            logger.info(f"Created UserSettings for user_id {user_id}")
+def clear_settings_caches():
+    """Forget the cached settings rows and tax rules; call after the tables are recreated."""
+    _user_settings_id.cache_clear()
+    _load_category_tax_rules.cache_clear()
 
-        return settings.id
+@lru_cache(maxsize=16)
+def _user_settings_id(user_id: int) -> int:
+    """Look up (or create) the settings row once; cleared by clear_settings_caches."""
+    db = next(get_db())
 
-    except Exception as e:
-        logger.error(f"Error ensuring user settings exists: {e}")
-        return 1
\ No newline at end of file
+    settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
+
+    if not settings:
+        settings = UserSettings(user_id=user_id)
+        db.add(settings)
+        db.commit()
+        db.refresh(settings)
+        logger.info(f"Created UserSettings for user_id {user_id}")
+
+    return settings.id
\ No newline at end of file
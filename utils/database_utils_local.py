@@ -1,15 +1,17 @@
 """Local storage wrappers that match database_utils interface."""
 
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 from datetime import datetime
 
+import pandas as pd
+
 from utils.local_storage import (
     save_receipt,
     update_receipt_status as update_status_local,
     update_receipt_data,
     get_receipt,
-    get_all_receipts,
+    get_receipts_by_upload_date,
     filter_receipts,
     get_statistics,
     init_storage
@@ -21,7 +23,11 @@ logger = logging.getLogger(__name__)
 init_storage()
 
 def get_receipt_stats(user_id: int = None, date_range: tuple = None) -> Dict:
-    """Get receipt statistics for dashboard."""
+    """Get receipt statistics for dashboard.
+
+    get_statistics keeps its columns per metadata file version, so every
+    write, including direct local_storage updates, shows up immediately.
+    """
     start_date = None
     end_date = None
 
@@ -33,13 +39,7 @@ def get_receipt_stats(user_id: int = None, date_range: tuple = None) -> Dict:
 
 def get_recent_receipts(user_id: int = None, limit: int = 10, offset: int = 0) -> List[Dict]:
     """Get recent receipts."""
-    receipts = get_all_receipts()
-
-    # Sort by upload_date descending
-    receipts = sorted(receipts, key=lambda x: x.get('upload_date', ''), reverse=True)
-
-    # Apply pagination
-    receipts = receipts[offset:offset + limit]
+    receipts = get_receipts_by_upload_date(limit=limit, offset=offset)
 
     # Convert to expected format
     result = []
@@ -48,14 +48,14 @@ def get_recent_receipts(user_id: int = None, limit: int = 10, offset: int = 0) -
 
         result.append({
             'id': receipt['id'],
-            'receipt_number': f"R{receipt['id']:06d}",
+            'receipt_number': receipt['receipt_number'],
             'date': receipt['upload_date'],
-            'transaction_date': extracted.get('transaction_date') or extracted.get('date'),
+            'transaction_date': extracted.get('transaction_date'),
             'filename': receipt['filename'],
             'status': receipt['processing_status'],
             'vendor_name': extracted.get('vendor_name'),
-            'expense_category': extracted.get('expense_category') or extracted.get('category'),
-            'total_incl_vat': extracted.get('total_incl_vat') or extracted.get('total_amount', 0),
+            'expense_category': extracted.get('expense_category'),
+            'total_incl_vat': extracted.get('total_incl_vat', 0),
             'vat_6_amount': extracted.get('vat_6_amount', 0),
             'vat_9_amount': extracted.get('vat_9_amount', 0),
             'vat_21_amount': extracted.get('vat_21_amount', 0),
@@ -102,7 +102,7 @@ def update_receipt_status(receipt_id: int, status: str, error_msg: str = None) -
         logger.error(f"Error updating receipt status: {e}")
         return False
 
-def search_receipts(
+def iter_search_receipts(
     user_id: int = None,
     search_term: str = None,
     category: str = None,
@@ -111,8 +111,8 @@ def search_receipts(
     status: str = None,
     min_amount: float = None,
     max_amount: float = None
-) -> List[Dict]:
-    """Search receipts with filters."""
+) -> Iterator[Dict]:
+    """Search receipts with filters, yielding results one at a time."""
     try:
         categories = [category] if category else None
         receipts = filter_receipts(
@@ -126,25 +126,43 @@ def search_receipts(
         )
 
         # Convert to expected format
-        result = []
         for receipt in receipts:
             extracted = receipt.get('extracted_data', {})
-            result.append({
+            yield {
                 'id': receipt['id'],
-                'receipt_number': f"R{receipt['id']:06d}",
+                'receipt_number': receipt['receipt_number'],
                 'date': receipt['upload_date'],
-                'transaction_date': extracted.get('transaction_date') or extracted.get('date'),
+                'transaction_date': extracted.get('transaction_date'),
                 'filename': receipt['filename'],
                 'status': receipt['processing_status'],
                 'vendor': extracted.get('vendor_name'),
-                'category': extracted.get('expense_category') or extracted.get('category'),
-                'amount': extracted.get('total_incl_vat') or extracted.get('total_amount', 0)
-            })
-
-        return result
+                'category': extracted.get('expense_category'),
+                'amount': extracted.get('total_incl_vat', 0)
+            }
     except Exception as e:
         logger.error(f"Error searching receipts: {e}")
-        return []
+
+def search_receipts(
+    user_id: int = None,
+    search_term: str = None,
+    category: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    status: str = None,
+    min_amount: float = None,
+    max_amount: float = None
+) -> List[Dict]:
+    """Search receipts with filters."""
+    return list(iter_search_receipts(
+        user_id=user_id,
+        search_term=search_term,
+        category=category,
+        date_from=date_from,
+        date_to=date_to,
+        status=status,
+        min_amount=min_amount,
+        max_amount=max_amount
+    ))
 
 def get_receipts_for_export(
     user_id: int,
@@ -160,47 +178,54 @@ def get_receipts_for_export(
             categories=categories,
             status='completed'
         )
+        if not receipts:
+            return []
+
+        # Build the export columns with whole-column operations
+        extracted_rows = [receipt.get('extracted_data') or {} for receipt in receipts]
+        extracted = pd.DataFrame(extracted_rows)
+        vat_breakdown = pd.DataFrame(
+            [row.get('vat_breakdown') or {} for row in extracted_rows],
+            columns=['6', '9', '21']
+        )
 
-        result = []
-        for receipt in receipts:
-            extracted = receipt.get('extracted_data', {})
-
-            # Convert transaction date
-            trans_date = extracted.get('transaction_date') or extracted.get('date')
-            if isinstance(trans_date, str):
-                try:
-                    trans_date = datetime.fromisoformat(trans_date)
-                except:
-                    trans_date = datetime.now()
-
-            # Calculate VAT amounts
-            vat_breakdown = extracted.get('vat_breakdown', {})
-            vat_6 = vat_breakdown.get('6', extracted.get('vat_6_amount', 0))
-            vat_9 = vat_breakdown.get('9', extracted.get('vat_9_amount', 0))
-            vat_21 = vat_breakdown.get('21', extracted.get('vat_21_amount', 0))
-
-            data = {
-                'receipt_number': f"R{receipt['id']:06d}",
-                'transaction_date': trans_date,
-                'vendor_name': extracted.get('vendor_name', 'Onbekend'),
-                'category': extracted.get('expense_category') or extracted.get('category', 'Niet gecategoriseerd'),
-                'amount_excl_vat': extracted.get('amount_excl_vat', 0),
-                'vat_6': vat_6,
-                'vat_9': vat_9,
-                'vat_21': vat_21,
-                'total_incl_vat': extracted.get('total_incl_vat') or extracted.get('total_amount', 0),
-                'vat_deductible_percentage': extracted.get('vat_deductible_percentage', 100),
-                'ib_deductible_percentage': extracted.get('ib_deductible_percentage', 100),
-                'vat_refund': extracted.get('vat_refund_amount') or extracted.get('vat_deductible_amount', 0),
-                'profit_deduction': extracted.get('profit_deduction') or extracted.get('ib_deduction_amount', 0),
-                'explanation': extracted.get('explanation') or extracted.get('notes', '')
-            }
-            result.append(data)
+        def column(name: str, default=None) -> pd.Series:
+            if name in extracted:
+                return extracted[name]
+            return pd.Series(default, index=extracted.index, dtype=object)
+
+        def first_set(primary: pd.Series, fallback: pd.Series) -> pd.Series:
+            # Vectorized `primary or fallback`
+            return primary.where(primary.notna() & primary.astype(bool), fallback)
+
+        # Convert transaction date; unparseable dates fall back to now
+        trans_date = pd.to_datetime(
+            column('transaction_date'),
+            format='ISO8601',
+            errors='coerce'
+        ).fillna(pd.Timestamp.now())
+
+        export = pd.DataFrame({
+            'receipt_number': [receipt['receipt_number'] for receipt in receipts],
+            'transaction_date': trans_date,
+            'vendor_name': column('vendor_name').fillna('Onbekend'),
+            'category': column('expense_category').fillna('Niet gecategoriseerd'),
+            'amount_excl_vat': column('amount_excl_vat').fillna(0),
+            'vat_6': vat_breakdown['6'].fillna(column('vat_6_amount')).fillna(0),
+            'vat_9': vat_breakdown['9'].fillna(column('vat_9_amount')).fillna(0),
+            'vat_21': vat_breakdown['21'].fillna(column('vat_21_amount')).fillna(0),
+            'total_incl_vat': column('total_incl_vat').fillna(0),
+            'vat_deductible_percentage': column('vat_deductible_percentage').fillna(100),
+            'ib_deductible_percentage': column('ib_deductible_percentage').fillna(100),
+            'vat_refund': first_set(column('vat_refund_amount'), column('vat_deductible_amount')).fillna(0),
+            'profit_deduction': first_set(column('profit_deduction'), column('ib_deduction_amount')).fillna(0),
+            'explanation': first_set(column('explanation'), column('notes')).fillna('')
+        })
 
         # Sort by transaction date
-        result = sorted(result, key=lambda x: x['transaction_date'])
+        export.sort_values('transaction_date', kind='stable', inplace=True)
 
-        return result
+        return export.to_dict('records')
 
     except Exception as e:
         logger.error(f"Error getting receipts for export: {e}")
@@ -1,11 +1,19 @@
 """File utility functions for handling uploads and processing."""
 
 import os
-import hashlib
+import atexit
+import copy
+import json
+import secrets
 import shutil
+import threading
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Tuple, Optional, BinaryIO
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, List, Tuple, Optional, BinaryIO
 import logging
 from PIL import Image
 import magic
@@ -14,6 +22,35 @@ from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Allowed upload extensions, without the dot
+_ALLOWED_EXTENSIONS = frozenset(Config.ALLOWED_EXTENSIONS)
+
+# Top-level MIME type (e.g. 'image' of 'image/png') expected per extension
+_EXPECTED_MIME_TYPES = {
+    'pdf': 'application',
+    'png': 'image',
+    'jpg': 'image',
+    'jpeg': 'image'
+}
+
+# MIME detector, created once so the magic database is loaded once
+_MIME_DETECTOR = magic.Magic(mime=True)
+
+# PIL format of each image extension get_file_info reports dimensions for
+_IMAGE_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+
+# Bytes read from an upload to detect its MIME type
+MIME_SNIFF_BYTES = 4096
+
+# Buffer size for streaming uploads to disk
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+# Upload statistics are recomputed at most once per this many seconds
+STATS_CACHE_SECONDS = 10
+
+# Number of files cleanup_old_files deletes concurrently
+CLEANUP_WORKERS = 16
+
 def validate_file(file) -> Tuple[bool, Optional[str]]:
     """
     Validate uploaded file.
@@ -29,25 +66,20 @@ def validate_file(file) -> Tuple[bool, Optional[str]]:
         return False, f"File size exceeds {Config.MAX_UPLOAD_SIZE_MB}MB limit"
 
     # Check file extension
-    file_ext = Path(file.name).suffix.lower().replace('.', '')
-    if file_ext not in Config.ALLOWED_EXTENSIONS:
+    file_ext = Path(file.name).suffix[1:].lower()
+    if file_ext not in _ALLOWED_EXTENSIONS:
         return False, f"File type '{file_ext}' not allowed. Allowed types: {', '.join(Config.ALLOWED_EXTENSIONS)}"
 
     # Check MIME type for additional security
     try:
-        file_bytes = file.read()
+        # libmagic only needs the start of the file
+        header = file.read(MIME_SNIFF_BYTES)
         file.seek(0)  # Reset file pointer
 
-        mime = magic.from_buffer(file_bytes, mime=True)
-        allowed_mimes = {
-            'pdf': 'application/pdf',
-            'png': 'image/png',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg'
-        }
+        mime = _MIME_DETECTOR.from_buffer(header)
 
-        expected_mime = allowed_mimes.get(file_ext)
-        if expected_mime and not mime.startswith(expected_mime.split('/')[0]):
+        expected_type = _EXPECTED_MIME_TYPES.get(file_ext)
+        if expected_type and not mime.startswith(expected_type):
             return False, f"File content doesn't match extension"
 
     except Exception as e:
@@ -66,10 +98,9 @@ def generate_unique_filename(original_filename: str) -> str:
         Unique filename
     """
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    file_hash = hashlib.md5(f"{original_filename}_{timestamp}".encode()).hexdigest()[:8]
     extension = Path(original_filename).suffix
 
-    return f"{timestamp}_{file_hash}{extension}"
+    return f"{timestamp}_{secrets.token_hex(4)}{extension}"
 
 def save_uploaded_file(file, subfolder: str = "receipts") -> str:
     """
@@ -91,9 +122,10 @@ def save_uploaded_file(file, subfolder: str = "receipts") -> str:
         unique_filename = generate_unique_filename(file.name)
         file_path = upload_dir / unique_filename
 
-        # Save file
+        # Stream file to disk
+        file.seek(0)
         with open(file_path, 'wb') as f:
-            f.write(file.getvalue())
+            shutil.copyfileobj(file, f, length=COPY_BUFFER_SIZE)
 
         logger.info(f"File saved: {file_path}")
         return str(file_path)
@@ -102,6 +134,13 @@ def save_uploaded_file(file, subfolder: str = "receipts") -> str:
         logger.error(f"Failed to save file {file.name}: {e}")
         raise
 
+def _move_file(source: Path, destination: Path):
+    """Move a file with a single rename, copying only across filesystems."""
+    try:
+        os.replace(source, destination)
+    except OSError:
+        shutil.move(str(source), str(destination))
+
 def move_to_processed(file_path: str) -> str:
     """
     Move file to processed folder after successful processing.
@@ -124,7 +163,7 @@ def move_to_processed(file_path: str) -> str:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             destination = processed_dir / f"{source.stem}_{timestamp}{source.suffix}"
 
-        shutil.move(str(source), str(destination))
+        _move_file(source, destination)
         logger.info(f"File moved to processed: {destination}")
 
         return str(destination)
@@ -133,6 +172,50 @@ def move_to_processed(file_path: str) -> str:
         logger.error(f"Failed to move file to processed: {e}")
         raise
 
+class _ErrorLog:
+    """
+    Buffer processing-error records and append them to a JSON Lines file.
+
+    Records are written in one append at most flush_interval seconds after
+    the first unflushed record, and at interpreter exit.
+    """
+
+    def __init__(self, path: Path, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._records: List[Dict] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    def add(self, record: Dict):
+        """Queue a record and schedule a flush if none is pending."""
+        with self._lock:
+            self._records.append(record)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Append all queued records to the log file."""
+        with self._lock:
+            records, self._records = self._records, []
+            self._timer = None
+
+        if not records:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        except Exception as e:
+            logger.error(f"Failed to write {len(records)} error records: {e}")
+
+# Processing errors of files moved to the failed folder
+_error_log = _ErrorLog(Config.UPLOAD_FOLDER / "failed" / "errors.jsonl")
+
 def move_to_failed(file_path: str, error_msg: str = None) -> str:
     """
     Move file to failed folder after processing failure.
@@ -156,15 +239,16 @@ def move_to_failed(file_path: str, error_msg: str = None) -> str:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             destination = failed_dir / f"{source.stem}_{timestamp}{source.suffix}"
 
-        shutil.move(str(source), str(destination))
+        _move_file(source, destination)
 
-        # Save error message if provided
+        # Record error message if provided
         if error_msg:
-            error_file = destination.with_suffix('.error.txt')
-            with open(error_file, 'w') as f:
-                f.write(f"Error processing {source.name}\n")
-                f.write(f"Timestamp: {datetime.now()}\n")
-                f.write(f"Error: {error_msg}\n")
+            _error_log.add({
+                'file': source.name,
+                'path': str(destination),
+                'timestamp': datetime.now().isoformat(),
+                'error': error_msg
+            })
 
         logger.info(f"File moved to failed: {destination}")
         return str(destination)
@@ -213,11 +297,13 @@ def get_file_info(file_path: str) -> dict:
 
         stats = path.stat()
 
-        # Get image dimensions if it's an image
+        # Get image dimensions if it's an image. Image.open only parses the
+        # header, and naming the format skips probing the other plugins.
         dimensions = None
-        if path.suffix.lower() in ['.png', '.jpg', '.jpeg']:
+        image_format = _IMAGE_FORMATS.get(path.suffix.lower())
+        if image_format:
             try:
-                with Image.open(path) as img:
+                with Image.open(path, formats=(image_format,)) as img:
                     dimensions = img.size
             except:
                 pass
@@ -237,6 +323,22 @@ def get_file_info(file_path: str) -> dict:
         logger.error(f"Failed to get file info for {file_path}: {e}")
         return None
 
+def _upload_folder_entries(folder: str) -> Optional[List[os.DirEntry]]:
+    """
+    List an upload subfolder as plain os.scandir entries.
+
+    Entries carry their name, path and file type as strings and flags, so
+    loops over them need no Path objects and one stat() per file at most.
+
+    Returns:
+        List of directory entries, or None if the folder doesn't exist
+    """
+    try:
+        with os.scandir(os.path.join(Config.UPLOAD_FOLDER, folder)) as entries:
+            return list(entries)
+    except FileNotFoundError:
+        return None
+
 def cleanup_old_files(days: int = 30):
     """
     Clean up old files from upload directories.
@@ -245,22 +347,25 @@ def cleanup_old_files(days: int = 30):
         days: Delete files older than this many days
     """
     try:
-        cutoff_time = datetime.now().timestamp() - (days * 86400)
-        cleaned_count = 0
+        cutoff_time = time.time() - (days * 86400)
+        expired = []
 
         for folder in ['receipts', 'processed', 'failed', 'temp']:
-            folder_path = Config.UPLOAD_FOLDER / folder
-
-            if not folder_path.exists():
+            entries = _upload_folder_entries(folder)
+            if entries is None:
                 continue
 
-            for file_path in folder_path.glob('*'):
-                if file_path.is_file():
-                    if file_path.stat().st_mtime < cutoff_time:
-                        file_path.unlink()
-                        cleaned_count += 1
-                        logger.info(f"Deleted old file: {file_path}")
+            expired.extend(
+                entry.path for entry in entries
+                if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff_time
+            )
+
+        # The deletions are independent, so keep several in flight at once
+        with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+            for path, _ in zip(expired, executor.map(os.unlink, expired)):
+                logger.info(f"Deleted old file: {path}")
 
+        cleaned_count = len(expired)
         logger.info(f"Cleanup completed. Deleted {cleaned_count} old files.")
         return cleaned_count
 
@@ -287,8 +392,10 @@ def create_thumbnail(image_path: str, size: Tuple[int, int] = (200, 200)) -> str
         thumb_path = thumb_dir / f"thumb_{source.name}"
 
         with Image.open(source) as img:
+            # Let libjpeg decode at a reduced scale (no-op for other formats)
+            img.draft('RGB', size)
             img.thumbnail(size, Image.Resampling.LANCZOS)
-            img.save(thumb_path)
+            img.save(thumb_path, optimize=True, progressive=True)
 
         return str(thumb_path)
 
@@ -296,13 +403,39 @@ def create_thumbnail(image_path: str, size: Tuple[int, int] = (200, 200)) -> str
         logger.error(f"Failed to create thumbnail for {image_path}: {e}")
         return None
 
+def create_thumbnails_batch(image_paths: List[str], size: Tuple[int, int] = (200, 200)) -> List[Optional[str]]:
+    """
+    Create thumbnails for several images in parallel worker processes.
+
+    Args:
+        image_paths: Paths to image files
+        size: Thumbnail size (width, height)
+
+    Returns:
+        Thumbnail paths in input order (None where creation failed)
+    """
+    if len(image_paths) < 2:
+        return [create_thumbnail(path, size) for path in image_paths]
+
+    # Decoding and resampling are CPU-bound, so use one process per core
+    with ProcessPoolExecutor(max_workers=min(len(image_paths), os.cpu_count() or 1)) as executor:
+        return list(executor.map(create_thumbnail, image_paths, repeat(size)))
+
 def get_upload_statistics() -> dict:
     """
     Get statistics about uploaded files.
 
+    Results are cached for up to STATS_CACHE_SECONDS.
+
     Returns:
         Dictionary with upload statistics
     """
+    # Copy so callers can't modify the cached statistics
+    return copy.deepcopy(_upload_statistics(int(time.time() // STATS_CACHE_SECONDS)))
+
+@lru_cache(maxsize=4)
+def _upload_statistics(time_bucket: int) -> dict:
+    """Scan the upload folders; time_bucket only serves as the cache key."""
     try:
         stats = {
             'total_files': 0,
@@ -311,30 +444,33 @@ def get_upload_statistics() -> dict:
             'by_extension': {},
             'recent_uploads': []
         }
+        recent_cutoff = time.time() - 604800  # 7 days
 
         for folder in ['receipts', 'processed', 'failed']:
-            folder_path = Config.UPLOAD_FOLDER / folder
-            if not folder_path.exists():
+            entries = _upload_folder_entries(folder)
+            if entries is None:
                 continue
 
-            files = list(folder_path.glob('*'))
-            stats['by_status'][folder] = len(files)
+            stats['by_status'][folder] = len(entries)
+
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat()
+                    size_mb = st.st_size / (1024 * 1024)
 
-            for file_path in files:
-                if file_path.is_file():
                     stats['total_files'] += 1
-                    stats['total_size_mb'] += file_path.stat().st_size / (1024 * 1024)
+                    stats['total_size_mb'] += size_mb
 
-                    ext = file_path.suffix.lower()
+                    ext = os.path.splitext(entry.name)[1].lower()
                     stats['by_extension'][ext] = stats['by_extension'].get(ext, 0) + 1
 
                     # Add to recent if within last 7 days
-                    if file_path.stat().st_mtime > (datetime.now().timestamp() - 604800):
+                    if st.st_mtime > recent_cutoff:
                         stats['recent_uploads'].append({
-                            'name': file_path.name,
+                            'name': entry.name,
                             'folder': folder,
-                            'size_mb': round(file_path.stat().st_size / (1024 * 1024), 2),
-                            'date': datetime.fromtimestamp(file_path.stat().st_mtime)
+                            'size_mb': round(size_mb, 2),
+                            'date': datetime.fromtimestamp(st.st_mtime)
                         })
 
         stats['total_size_mb'] = round(stats['total_size_mb'], 2)
@@ -344,4 +480,4 @@ def get_upload_statistics() -> dict:
 
     except Exception as e:
         logger.error(f"Failed to get upload statistics: {e}")
-        return {}
\ No newline at end of file
+        return {}
@@ -1,14 +1,20 @@
 """Local file-based storage for invoices - mirrors receipt storage pattern."""
 
-import json
 import shutil
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from decimal import Decimal
 import logging
 
+import numpy as np
+
 from config import Config
+from utils.json_cache import (
+    write_json, load_cached, save_cached, lookup, next_record_id, record_dates,
+    record_lowered, select_records, should_stream, stream_records,
+    derived, datetime_column, date_mask
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +26,16 @@ METADATA_FILE = STORAGE_DIR / "invoices_metadata.json"
 SETTINGS_FILE = STORAGE_DIR / "invoice_settings.json"
 CLIENTS_FILE = STORAGE_DIR / "clients.json"
 
+# Whether init_invoice_storage has run; it runs again if the metadata file
+# was removed since (hard reset)
+_invoice_storage_initialized = False
+
 def init_invoice_storage():
     """Initialize invoice storage directories."""
+    global _invoice_storage_initialized
+    if _invoice_storage_initialized and METADATA_FILE.exists():
+        return
+
     STORAGE_DIR.mkdir(parents=True, exist_ok=True)
     INVOICES_DIR.mkdir(parents=True, exist_ok=True)
     LOGOS_DIR.mkdir(parents=True, exist_ok=True)
@@ -35,6 +49,7 @@ def init_invoice_storage():
     if not CLIENTS_FILE.exists():
         save_clients([])
 
+    _invoice_storage_initialized = True
     logger.info(f"Invoice storage initialized at {STORAGE_DIR}")
 
 def get_default_settings() -> Dict:
@@ -91,10 +106,7 @@ def save_invoice(invoice_data: Dict) -> int:
 
     # Get next ID
     metadata = load_metadata()
-    if metadata:
-        invoice_id = max([inv['id'] for inv in metadata]) + 1
-    else:
-        invoice_id = 1
+    invoice_id = next_record_id(METADATA_FILE)
 
     # Add metadata
     invoice_data['id'] = invoice_id
@@ -118,11 +130,10 @@ def update_invoice(invoice_id: int, updates: Dict):
     """
     metadata = load_metadata()
 
-    for invoice in metadata:
-        if invoice['id'] == invoice_id:
-            invoice.update(updates)
-            invoice['updated_at'] = datetime.now().isoformat()
-            break
+    invoice = lookup(METADATA_FILE, 'id', invoice_id)
+    if invoice:
+        invoice.update(updates)
+        invoice['updated_at'] = datetime.now().isoformat()
 
     save_metadata(metadata)
     logger.info(f"Updated invoice {invoice_id}")
@@ -157,13 +168,7 @@ def get_invoice(invoice_id: int) -> Optional[Dict]:
     Returns:
         Invoice dictionary or None
     """
-    metadata = load_metadata()
-
-    for invoice in metadata:
-        if invoice['id'] == invoice_id:
-            return invoice
-
-    return None
+    return lookup(METADATA_FILE, 'id', invoice_id)
 
 def get_invoice_by_number(invoice_number: str) -> Optional[Dict]:
     """Get invoice by invoice number.
@@ -174,13 +179,7 @@ def get_invoice_by_number(invoice_number: str) -> Optional[Dict]:
     Returns:
         Invoice dictionary or None
     """
-    metadata = load_metadata()
-
-    for invoice in metadata:
-        if invoice.get('invoice_number') == invoice_number:
-            return invoice
-
-    return None
+    return lookup(METADATA_FILE, 'invoice_number', invoice_number)
 
 def get_all_invoices() -> List[Dict]:
     """Get all invoices.
@@ -213,19 +212,62 @@ def filter_invoices(
     Returns:
         Filtered list of invoices
     """
-    metadata = load_metadata()
-    filtered = []
+    return list(_iter_filtered_invoices(
+        start_date, end_date, status, payment_status, client_name, min_amount, max_amount
+    ))
+
+def _iter_filtered_invoices(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    status: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    client_name: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+) -> Iterator[Dict]:
+    """Yield the invoices matching the filter_invoices criteria.
+
+    A large metadata file that is not cached yet is streamed, so only the
+    matching invoices are held in memory. Otherwise the status filters and
+    date range are looked up in the cache indexes and only the invoices
+    they select are checked against the rest.
+    """
+    if status == "Alle":
+        status = None
+    if payment_status == "Alle":
+        payment_status = None
+
+    invoice_dates = {}
+    client_names = {}
+    if should_stream(METADATA_FILE):
+        metadata = stream_records(METADATA_FILE)
+    else:
+        equals = {}
+        if status:
+            equals['status'] = status
+        if payment_status:
+            equals['payment_status'] = payment_status
+
+        metadata = select_records(METADATA_FILE, equals, 'invoice_date', start_date, end_date)
+        if metadata is None:
+            metadata = load_metadata()
+            invoice_dates = record_dates(METADATA_FILE, 'invoice_date')
+        else:
+            # Already limited by status and date range
+            start_date = end_date = status = payment_status = None
+
+        if client_name:
+            client_names = record_lowered(METADATA_FILE, 'client_name')
+
+    client_name = client_name.lower() if client_name else None
 
     for invoice in metadata:
         # Date filter
         if start_date or end_date:
-            invoice_date_str = invoice['invoice_date']
-            # Handle both date and datetime strings
-            if 'T' in invoice_date_str or ' ' in invoice_date_str:
-                invoice_date = datetime.fromisoformat(invoice_date_str)
-            else:
-                # Date only string, parse and set to start of day
-                invoice_date = datetime.fromisoformat(invoice_date_str + 'T00:00:00')
+            # Date-only strings parse to the start of the day
+            invoice_date = invoice_dates.get(id(invoice))
+            if invoice_date is None:
+                invoice_date = datetime.fromisoformat(invoice['invoice_date'])
 
             if start_date and invoice_date < start_date:
                 continue
@@ -233,17 +275,19 @@ def filter_invoices(
                 continue
 
         # Status filter
-        if status and status != "Alle" and invoice.get('status') != status:
+        if status and invoice.get('status') != status:
             continue
 
         # Payment status filter
-        if payment_status and payment_status != "Alle" and invoice.get('payment_status') != payment_status:
+        if payment_status and invoice.get('payment_status') != payment_status:
             continue
 
         # Client filter
         if client_name:
-            inv_client = invoice.get('client_name', '').lower()
-            if client_name.lower() not in inv_client:
+            inv_client = client_names.get(id(invoice))
+            if inv_client is None:
+                inv_client = invoice.get('client_name', '').lower()
+            if client_name not in inv_client:
                 continue
 
         # Amount filter
@@ -254,9 +298,7 @@ def filter_invoices(
             if max_amount is not None and amount > max_amount:
                 continue
 
-        filtered.append(invoice)
-
-    return filtered
+        yield invoice
 
 def delete_invoice(invoice_id: int) -> bool:
     """Delete an invoice.
@@ -269,23 +311,48 @@ def delete_invoice(invoice_id: int) -> bool:
     """
     metadata = load_metadata()
 
-    for idx, invoice in enumerate(metadata):
-        if invoice['id'] == invoice_id:
-            # Delete PDF if exists
-            pdf_path = invoice.get('pdf_path')
-            if pdf_path:
-                pdf_file = Path(pdf_path)
-                if pdf_file.exists():
-                    pdf_file.unlink()
+    invoice = lookup(METADATA_FILE, 'id', invoice_id)
+    if not invoice:
+        return False
 
-            # Remove from metadata
-            metadata.pop(idx)
-            save_metadata(metadata)
+    # Delete PDF if exists
+    pdf_path = invoice.get('pdf_path')
+    if pdf_path:
+        pdf_file = Path(pdf_path)
+        if pdf_file.exists():
+            pdf_file.unlink()
 
-            logger.info(f"Deleted invoice {invoice_id}")
-            return True
+    # Remove from metadata
+    metadata.remove(invoice)
+    save_metadata(metadata)
 
-    return False
+    logger.info(f"Deleted invoice {invoice_id}")
+    return True
+
+def _invoice_columns(invoices: List[Dict]) -> Optional[Dict[str, np.ndarray]]:
+    """Column arrays of the invoice fields get_invoice_statistics aggregates.
+
+    None if an invoice has a field the arrays cannot hold; the statistics
+    are then aggregated row by row, which reports it.
+    """
+    invoice_dates = datetime_column(invoices, 'invoice_date')
+    if invoice_dates is None:
+        return None
+
+    try:
+        totals = np.array([inv.get('total_incl_vat', 0) for inv in invoices], dtype=np.float64)
+        vat = np.array([inv.get('vat_amount', 0) for inv in invoices], dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    payment_status = np.array([inv.get('payment_status', 'unpaid') for inv in invoices], dtype=object)
+
+    return {
+        'invoice_date': invoice_dates,
+        'total_incl_vat': totals,
+        'vat_amount': vat,
+        'paid': payment_status == 'paid',
+        'overdue': payment_status == 'overdue'
+    }
 
 def get_invoice_statistics(
     start_date: Optional[datetime] = None,
@@ -300,9 +367,34 @@ def get_invoice_statistics(
     Returns:
         Statistics dictionary
     """
-    invoices = filter_invoices(start_date=start_date, end_date=end_date)
-
-    total_invoices = len(invoices)
+    # A large uncached file is streamed row by row instead
+    columns = None
+    if not should_stream(METADATA_FILE):
+        columns = derived(METADATA_FILE, 'statistics:columns', _invoice_columns)
+
+    if columns is not None:
+        mask = date_mask(columns['invoice_date'], start_date, end_date)
+        totals = columns['total_incl_vat']
+        paid = mask & columns['paid']
+        overdue = mask & columns['overdue']
+        unpaid = mask & ~columns['paid']  # overdue counts as unpaid
+
+        total_invoices = int(np.count_nonzero(mask))
+        total_revenue = float(totals[mask].sum())
+        return {
+            'total_invoices': total_invoices,
+            'total_revenue': total_revenue,
+            'total_vat_payable': float(columns['vat_amount'][mask].sum()),
+            'total_paid': float(totals[paid].sum()),
+            'total_unpaid': float(totals[unpaid].sum()),
+            'total_overdue': float(totals[overdue].sum()),
+            'count_paid': int(np.count_nonzero(paid)),
+            'count_unpaid': int(np.count_nonzero(unpaid)),
+            'count_overdue': int(np.count_nonzero(overdue)),
+            'average_invoice_value': total_revenue / total_invoices if total_invoices > 0 else 0
+        }
+
+    total_invoices = 0
     total_revenue = 0
     total_vat_payable = 0
     total_paid = 0
@@ -312,7 +404,8 @@ def get_invoice_statistics(
     count_unpaid = 0
     count_overdue = 0
 
-    for invoice in invoices:
+    for invoice in _iter_filtered_invoices(start_date=start_date, end_date=end_date):
+        total_invoices += 1
         total_incl_vat = invoice.get('total_incl_vat', 0)
         vat_amount = invoice.get('vat_amount', 0)
         payment_status = invoice.get('payment_status', 'unpaid')
@@ -348,12 +441,15 @@ def get_invoice_statistics(
 def check_overdue_invoices():
     """Check for overdue invoices and update their status."""
     metadata = load_metadata()
+    due_dates = record_dates(METADATA_FILE, 'due_date')
     today = datetime.now()
     updated = False
 
     for invoice in metadata:
         if invoice.get('payment_status') == 'unpaid':
-            due_date = datetime.fromisoformat(invoice['due_date'])
+            due_date = due_dates.get(id(invoice))
+            if due_date is None:
+                due_date = datetime.fromisoformat(invoice['due_date'])
             if due_date < today:
                 invoice['payment_status'] = 'overdue'
                 invoice['updated_at'] = today.isoformat()
@@ -370,8 +466,7 @@ def load_settings() -> Dict:
         return get_default_settings()
 
     try:
-        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_cached(SETTINGS_FILE)
     except Exception as e:
         logger.error(f"Error loading invoice settings: {e}")
         return get_default_settings()
@@ -379,8 +474,7 @@ def load_settings() -> Dict:
 def save_settings(settings: Dict):
     """Save invoice settings."""
     try:
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=2, ensure_ascii=False)
+        save_cached(SETTINGS_FILE, settings)
     except Exception as e:
         logger.error(f"Error saving invoice settings: {e}")
         raise
@@ -392,8 +486,7 @@ def load_clients() -> List[Dict]:
         return []
 
     try:
-        with open(CLIENTS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_cached(CLIENTS_FILE)
     except Exception as e:
         logger.error(f"Error loading clients: {e}")
         return []
@@ -401,8 +494,7 @@ def load_clients() -> List[Dict]:
 def save_clients(clients: List[Dict]):
     """Save clients."""
     try:
-        with open(CLIENTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(clients, f, indent=2, ensure_ascii=False)
+        save_cached(CLIENTS_FILE, clients)
     except Exception as e:
         logger.error(f"Error saving clients: {e}")
         raise
@@ -417,11 +509,7 @@ def add_client(client_data: Dict) -> int:
         Client ID
     """
     clients = load_clients()
-
-    if clients:
-        client_id = max([c['id'] for c in clients]) + 1
-    else:
-        client_id = 1
+    client_id = next_record_id(CLIENTS_FILE)
 
     client_data['id'] = client_id
     client_data['created_at'] = datetime.now().isoformat()
@@ -435,11 +523,7 @@ def add_client(client_data: Dict) -> int:
 
 def get_client(client_id: int) -> Optional[Dict]:
     """Get client by ID."""
-    clients = load_clients()
-    for client in clients:
-        if client['id'] == client_id:
-            return client
-    return None
+    return lookup(CLIENTS_FILE, 'id', client_id)
 
 def get_all_clients(active_only: bool = True) -> List[Dict]:
     """Get all clients.
@@ -462,8 +546,7 @@ def load_metadata() -> List[Dict]:
         return []
 
     try:
-        with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_cached(METADATA_FILE)
     except Exception as e:
         logger.error(f"Error loading invoice metadata: {e}")
         return []
@@ -471,8 +554,7 @@ def load_metadata() -> List[Dict]:
 def save_metadata(metadata: List[Dict]):
     """Save invoices metadata to JSON file."""
     try:
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        save_cached(METADATA_FILE, metadata)
     except Exception as e:
         logger.error(f"Error saving invoice metadata: {e}")
         raise
@@ -488,8 +570,7 @@ def export_to_json(output_path: str) -> bool:
     """
     try:
         metadata = load_metadata()
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        write_json(output_path, metadata)
         logger.info(f"Exported invoices to {output_path}")
         return True
     except Exception as e:
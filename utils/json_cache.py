@@ -0,0 +1,360 @@
+"""Cached JSON storage files shared by the receipt and invoice storage.
+
+Files are parsed once per version on disk (mtime and size) and written
+atomically. Indexes over a file's records are kept on its cache entry, so
+they are built once per version as well.
+"""
+
+import os
+from bisect import bisect_left, bisect_right
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+import ijson
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# orjson options for the metadata files: two-space indent as before, with
+# non-string keys allowed. orjson always writes UTF-8 without escaping.
+_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+def read_json(path: Path):
+    """Parse a JSON file."""
+    return orjson.loads(path.read_bytes())
+
+def write_json(path, data):
+    """Write data to a JSON file atomically.
+
+    The data goes to a temporary file that is synced and then renamed over
+    the target, so a crash mid-write leaves the previous version intact.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=_JSON_OPTIONS))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# Parsed storage files as (st_mtime_ns, st_size, data, indexes), so repeated
+# loads skip re-parsing a file that has not changed on disk. indexes maps a
+# field name to the records keyed by that field, built on first lookup.
+_META_CACHE: Dict[Path, Tuple[int, int, object, Dict[str, Dict]]] = {}
+
+# Storage files larger than this are streamed record by record by read-only
+# scans while they are not cached, rather than parsed into memory whole
+STREAM_THRESHOLD_BYTES = 10 * 1024 * 1024
+
+# _batch.pending: storage files saved inside this thread's batch_updates
+# block that are still to be written, None outside a block
+_batch = threading.local()
+
+def _cache_entry(path: Path) -> Tuple[int, int, object, Dict[str, Dict]]:
+    """Cache entry of a storage file, re-parsed if the file changed on disk."""
+    stat = path.stat()
+    entry = _META_CACHE.get(path)
+    if not entry or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+        entry = (stat.st_mtime_ns, stat.st_size, read_json(path), {})
+        _META_CACHE[path] = entry
+    return entry
+
+def should_stream(path: Path) -> bool:
+    """Whether a scan over a list storage file should use stream_records."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size <= STREAM_THRESHOLD_BYTES:
+        return False
+
+    entry = _META_CACHE.get(path)
+    return not (entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size)
+
+def stream_records(path: Path) -> Iterator[Dict]:
+    """Yield the records of a list storage file one at a time."""
+    try:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'item', use_float=True)
+    except Exception as e:
+        logger.error(f"Error streaming {path.name}: {e}")
+
+def load_cached(path: Path):
+    """Parse a storage file, reusing the cached result while it is unchanged.
+
+    Returns a shallow copy: callers may append to or reorder the container,
+    and the records themselves are only changed right before a save.
+    """
+    return _cache_entry(path)[2].copy()
+
+def save_cached(path: Path, data):
+    """Write a storage file and cache what was written.
+
+    Inside a batch_updates block only the cache is updated, keyed on the
+    unchanged file so that loads keep returning it, and the write is left
+    to the end of the block.
+    """
+    indexes = _carried_indexes(path, data)
+
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None and path.exists():
+        stat = path.stat()
+        _META_CACHE[path] = (stat.st_mtime_ns, stat.st_size, data.copy(), indexes)
+        pending.add(path)
+        return
+
+    try:
+        write_json(path, data)
+    except Exception:
+        _META_CACHE.pop(path, None)
+        raise
+    stat = path.stat()
+    _META_CACHE[path] = (stat.st_mtime_ns, stat.st_size, data.copy(), indexes)
+
+def _carried_indexes(path: Path, data) -> Dict:
+    """Indexes of the cache entry for newly saved data.
+
+    Only the next free id carries over from the previous entry: records are
+    appended with the id it hands out, so the last record is enough to keep
+    it current. It is only carried while the file still matches the entry;
+    a file deleted or replaced since (hard reset) starts counting afresh.
+    """
+    entry = _META_CACHE.get(path)
+    if not entry or 'id:next' not in entry[3] or not isinstance(data, list):
+        return {}
+
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return {}
+    if entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+        return {}
+
+    next_id = entry[3]['id:next']
+    if data and 'id' in data[-1]:
+        next_id = max(next_id, data[-1]['id'] + 1)
+    return {'id:next': next_id}
+
+def next_record_id(path: Path) -> int:
+    """Next free record id of a list storage file.
+
+    One past the highest stored id; the scan for it runs once per process
+    (or external change of the file) and is carried over between saves.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except FileNotFoundError:
+        return 1
+    except Exception as e:
+        logger.error(f"Error loading {path.name}: {e}")
+        return 1
+
+    next_id = indexes.get('id:next')
+    if next_id is None:
+        next_id = indexes['id:next'] = max((r['id'] for r in records), default=0) + 1
+    return next_id
+
+@contextmanager
+def batch_updates():
+    """Write the storage files saved inside a with-block once, on exit.
+
+    Bulk imports (with batch_updates(): for r in rows: save_invoice(r))
+    then rewrite each file once instead of once per record. The files are
+    written also if the block raises; nested blocks write when the
+    outermost one exits.
+    """
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+
+    _batch.pending = pending = set()
+    try:
+        yield
+    finally:
+        _batch.pending = None
+        for path in pending:
+            entry = _META_CACHE.get(path)
+            if entry:
+                save_cached(path, entry[2])
+
+def lookup(path: Path, field: str, value) -> Optional[Dict]:
+    """Find the record of a list storage file whose field equals value.
+
+    The records returned are the cached ones, also shared with the lists
+    from load_cached, so a record changed in place is saved with that list.
+    The first record wins when several share a value.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Error loading {path.name}: {e}")
+        return None
+
+    index = indexes.get(field)
+    if index is None:
+        index = indexes[field] = {r[field]: r for r in reversed(records) if field in r}
+    return index.get(value)
+
+def record_dates(path: Path, field: str) -> Dict[int, datetime]:
+    """Parsed ISO dates of a field, keyed by id() of the cached records.
+
+    Parsed once per file version. Records missing from the result (not from
+    the current cache entry, or with no valid date) are for the caller to
+    parse itself.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except Exception:
+        return {}
+    return _entry_dates(records, indexes, field)
+
+def _entry_dates(records: List[Dict], indexes: Dict, field: str) -> Dict[int, datetime]:
+    """The record_dates map of one cache entry."""
+    key = f"{field}:datetime"
+    dates = indexes.get(key)
+    if dates is None:
+        dates = indexes[key] = {}
+        for record in records:
+            try:
+                dates[id(record)] = datetime.fromisoformat(record[field])
+            except (KeyError, TypeError, ValueError):
+                pass
+    return dates
+
+def derived(path: Path, key: str, build):
+    """Value built by build(records) from the cached records of a storage file.
+
+    Kept on the cache entry, so it is built once per file version. None if
+    the file cannot be loaded.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except Exception:
+        return None
+    if key not in indexes:
+        indexes[key] = build(records)
+    return indexes[key]
+
+def datetime_column(records: List[Dict], field: str) -> Optional[np.ndarray]:
+    """datetime64 array of an ISO date field, or None if a record has no valid naive date."""
+    try:
+        dates = [datetime.fromisoformat(r[field]) for r in records]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if any(d.tzinfo for d in dates):
+        return None
+    return np.array(dates, dtype='datetime64[us]')
+
+def date_mask(
+    dates: np.ndarray,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+) -> np.ndarray:
+    """Boolean mask of the dates within [start_date, end_date]."""
+    mask = np.ones(len(dates), dtype=bool)
+    if start_date:
+        mask &= dates >= np.datetime64(start_date)
+    if end_date:
+        mask &= dates <= np.datetime64(end_date)
+    return mask
+
+def record_lowered(path: Path, field: str) -> Dict[int, str]:
+    """Lowercased string values of a field, keyed by id() of the cached records.
+
+    Built once per file version, like record_dates.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except Exception:
+        return {}
+
+    key = f"{field}:lower"
+    lowered = indexes.get(key)
+    if lowered is None:
+        lowered = indexes[key] = {
+            id(r): r.get(field, '').lower() for r in records if isinstance(r.get(field, ''), str)
+        }
+    return lowered
+
+def _date_positions(
+    records: List[Dict],
+    indexes: Dict,
+    field: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime]
+) -> Optional[List[int]]:
+    """Ascending positions of the records with a date in [start_date, end_date].
+
+    Found by bisecting a date-sorted order kept on the cache entry. None if
+    a record has no valid date.
+    """
+    dates = _entry_dates(records, indexes, field)
+    if len(dates) != len(records):
+        return None
+
+    key = f"{field}:order"
+    order = indexes.get(key)
+    if order is None:
+        positions = sorted(range(len(records)), key=lambda i: dates[id(records[i])])
+        order = indexes[key] = ([dates[id(records[i])] for i in positions], positions)
+
+    sorted_dates, positions = order
+    lo = bisect_left(sorted_dates, start_date) if start_date else 0
+    hi = bisect_right(sorted_dates, end_date) if end_date else len(positions)
+    return sorted(positions[lo:hi])
+
+def select_records(
+    path: Path,
+    equals: Dict[str, object],
+    date_field: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Optional[List[Dict]]:
+    """Cached records matching field values and a date range, in storage order.
+
+    The candidates come from indexes on the cache entry, built once per file
+    version: the record positions grouped by each field in equals, and the
+    date-sorted order of date_field. Only those records are touched.
+    Returns None if the file cannot be loaded or a record has no valid date;
+    the caller then scans all records and reports it.
+    """
+    try:
+        _, _, records, indexes = _cache_entry(path)
+    except Exception:
+        return None
+
+    candidates = None
+    for field, value in equals.items():
+        key = f"{field}:groups"
+        groups = indexes.get(key)
+        if groups is None:
+            groups = indexes[key] = {}
+            for i, record in enumerate(records):
+                groups.setdefault(record.get(field), []).append(i)
+        positions = groups.get(value, [])
+        if candidates is None:
+            candidates = positions
+        else:
+            keep = set(positions)
+            candidates = [i for i in candidates if i in keep]
+
+    if date_field and (start_date or end_date):
+        positions = _date_positions(records, indexes, date_field, start_date, end_date)
+        if positions is None:
+            return None
+        if candidates is None:
+            candidates = positions
+        else:
+            keep = set(positions)
+            candidates = [i for i in candidates if i in keep]
+
+    if candidates is None:
+        return records.copy()
+    return [records[i] for i in candidates]
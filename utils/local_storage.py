@@ -1,13 +1,20 @@
 """Local file-based storage for receipts - no database needed."""
 
-import json
+import heapq
 import shutil
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 
+import numpy as np
+
 from config import Config
+from utils.json_cache import (
+    write_json, load_cached, save_cached, lookup, next_record_id, record_dates,
+    derived, datetime_column, date_mask
+)
 
 logger = logging.getLogger(__name__)
 
@@ -16,22 +23,116 @@ STORAGE_DIR = Path(Config.UPLOAD_FOLDER).parent / "receipt_data"
 RECEIPTS_DIR = STORAGE_DIR / "receipts"
 METADATA_FILE = STORAGE_DIR / "receipts_metadata.json"
 
+# Extracted-data fields that older pipelines store under another name, as
+# (field, alias, default). The field is filled in on write so readers need
+# a single lookup.
+FIELD_ALIASES = (
+    ('transaction_date', 'date', None),
+    ('expense_category', 'category', None),
+    ('total_incl_vat', 'total_amount', 0)
+)
+
+# vat_breakdown rates and the extracted-data field each one is copied into
+# on write; the breakdown takes precedence, as it does for every reader
+VAT_BREAKDOWN_FIELDS = (
+    ('6', 'vat_6_amount'),
+    ('9', 'vat_9_amount'),
+    ('21', 'vat_21_amount')
+)
+
+# Whether init_storage has run; it runs again if the metadata file was
+# removed since (hard reset)
+_storage_initialized = False
+
+# Whether records stored by older versions have been normalized
+_stored_receipts_normalized = False
+
+# Positions of the stored receipts ordered by upload_date, valid for the
+# metadata file version (mtime) they were built from
+_upload_date_order: List[int] = []
+_upload_date_order_version: Optional[int] = None
+
 def init_storage():
     """Initialize local storage directories."""
+    global _storage_initialized
+    if _storage_initialized and METADATA_FILE.exists():
+        return
+
     STORAGE_DIR.mkdir(parents=True, exist_ok=True)
     RECEIPTS_DIR.mkdir(parents=True, exist_ok=True)
 
     if not METADATA_FILE.exists():
         save_metadata([])
 
+    _normalize_stored_receipts()
+
+    _storage_initialized = True
     logger.info(f"Local storage initialized at {STORAGE_DIR}")
 
+def normalize_extracted_data(extracted_data: Dict) -> Dict:
+    """Fill in each FIELD_ALIASES field from its alias, in place.
+
+    The vat_N_amount fields are also set from vat_breakdown when it has
+    them, so readers need no breakdown fallback.
+
+    Args:
+        extracted_data: Extracted data from processing
+
+    Returns:
+        The same dictionary
+    """
+    if extracted_data:
+        for field, alias, default in FIELD_ALIASES:
+            if not extracted_data.get(field):
+                extracted_data[field] = extracted_data.get(alias, default)
+
+        breakdown = extracted_data.get('vat_breakdown')
+        if breakdown:
+            for rate, field in VAT_BREAKDOWN_FIELDS:
+                if rate in breakdown:
+                    extracted_data[field] = breakdown[rate]
+    return extracted_data
+
+def _is_normalized(extracted_data: Dict) -> bool:
+    """Whether normalize_extracted_data would leave extracted data unchanged."""
+    if any(field not in extracted_data for field, _, _ in FIELD_ALIASES):
+        return False
+
+    breakdown = extracted_data.get('vat_breakdown') or {}
+    return all(
+        rate not in breakdown or extracted_data.get(field) == breakdown[rate]
+        for rate, field in VAT_BREAKDOWN_FIELDS
+    )
+
+def format_receipt_number(receipt_id: int) -> str:
+    """Format the display number of a receipt, e.g. R000042."""
+    return 'R%06d' % receipt_id
+
+def _normalize_stored_receipts():
+    """Add fields introduced since older versions to stored receipts, once per process."""
+    global _stored_receipts_normalized
+    if _stored_receipts_normalized:
+        return
+    _stored_receipts_normalized = True
+
+    metadata = load_metadata()
+    changed = False
+    for receipt in metadata:
+        if 'receipt_number' not in receipt:
+            receipt['receipt_number'] = format_receipt_number(receipt['id'])
+            changed = True
+
+        extracted = receipt.get('extracted_data')
+        if extracted and not _is_normalized(extracted):
+            normalize_extracted_data(extracted)
+            changed = True
+
+    if changed:
+        save_metadata(metadata)
+
 def get_next_receipt_id() -> int:
     """Get the next available receipt ID."""
-    metadata = load_metadata()
-    if not metadata:
-        return 1
-    return max([r['id'] for r in metadata]) + 1
+    return next_record_id(METADATA_FILE)
 
 def save_receipt(
     file_path: str,
@@ -60,18 +161,19 @@ def save_receipt(
     # Copy file to receipts directory
     source = Path(file_path)
     destination = RECEIPTS_DIR / f"{receipt_id}_{filename}"
-    shutil.copy2(source, destination)
+    shutil.copyfile(source, destination)
 
     # Create receipt record
     receipt = {
         'id': receipt_id,
+        'receipt_number': format_receipt_number(receipt_id),
         'filename': filename,
         'file_path': str(destination),
         'file_size': file_size,
         'file_type': file_type,
         'upload_date': upload_date.isoformat(),
         'processing_status': 'pending',
-        'extracted_data': extracted_data or {},
+        'extracted_data': normalize_extracted_data(extracted_data or {}),
         'error_message': None,
         'created_at': upload_date.isoformat(),
         'updated_at': upload_date.isoformat()
@@ -97,13 +199,12 @@ def update_receipt_status(receipt_id: int, status: str, error_message: Optional[
     """
     metadata = load_metadata()
 
-    for receipt in metadata:
-        if receipt['id'] == receipt_id:
-            receipt['processing_status'] = status
-            receipt['updated_at'] = datetime.now().isoformat()
-            if error_message:
-                receipt['error_message'] = error_message
-            break
+    receipt = lookup(METADATA_FILE, 'id', receipt_id)
+    if receipt:
+        receipt['processing_status'] = status
+        receipt['updated_at'] = datetime.now().isoformat()
+        if error_message:
+            receipt['error_message'] = error_message
 
     save_metadata(metadata)
     logger.info(f"Updated receipt {receipt_id} status to {status}")
@@ -117,12 +218,11 @@ def update_receipt_data(receipt_id: int, extracted_data: Dict):
     """
     metadata = load_metadata()
 
-    for receipt in metadata:
-        if receipt['id'] == receipt_id:
-            receipt['extracted_data'] = extracted_data
-            receipt['processing_status'] = 'completed'
-            receipt['updated_at'] = datetime.now().isoformat()
-            break
+    receipt = lookup(METADATA_FILE, 'id', receipt_id)
+    if receipt:
+        receipt['extracted_data'] = normalize_extracted_data(extracted_data)
+        receipt['processing_status'] = 'completed'
+        receipt['updated_at'] = datetime.now().isoformat()
 
     save_metadata(metadata)
     logger.info(f"Updated receipt {receipt_id} with extracted data")
@@ -136,21 +236,65 @@ def get_receipt(receipt_id: int) -> Optional[Dict]:
     Returns:
         Receipt dictionary or None
     """
-    metadata = load_metadata()
+    return lookup(METADATA_FILE, 'id', receipt_id)
 
-    for receipt in metadata:
-        if receipt['id'] == receipt_id:
-            return receipt
+def get_all_receipts(
+    limit: Optional[int] = None,
+    offset: int = 0,
+    order_by: Optional[str] = None,
+    descending: bool = False
+) -> List[Dict]:
+    """Get all receipts, optionally ordered and paginated.
 
-    return None
+    Args:
+        limit: Maximum number of receipts to return (default: all)
+        offset: Number of receipts to skip
+        order_by: Receipt field to order by (default: storage order)
+        descending: Order from highest to lowest
+
+    Returns:
+        List of receipt dictionaries
+    """
+    receipts = load_metadata()
+
+    if order_by:
+        key = itemgetter(order_by)
+        # A partial sort is enough unless the page reaches deep into the list
+        if limit is not None and offset + limit < len(receipts) // 2:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            receipts = select(offset + limit, receipts, key=key)
+        else:
+            receipts.sort(key=key, reverse=descending)
+
+    if limit is not None:
+        return receipts[offset:offset + limit]
+    return receipts[offset:] if offset else receipts
 
-def get_all_receipts() -> List[Dict]:
-    """Get all receipts.
+def get_receipts_by_upload_date(limit: int, offset: int = 0) -> List[Dict]:
+    """Get a page of receipts, newest upload first.
+
+    The upload_date ordering is kept between calls and only rebuilt when
+    the metadata file changes, so a page costs O(limit) after the load.
+
+    Args:
+        limit: Maximum number of receipts to return
+        offset: Number of receipts to skip
 
     Returns:
         List of receipt dictionaries
     """
-    return load_metadata()
+    global _upload_date_order, _upload_date_order_version
+
+    version = _metadata_version()
+    metadata = load_metadata()
+
+    if version != _upload_date_order_version or len(_upload_date_order) != len(metadata):
+        _upload_date_order = sorted(range(len(metadata)), key=lambda i: metadata[i]['upload_date'])
+        _upload_date_order_version = version
+
+    stop = max(len(metadata) - offset, 0)
+    start = max(stop - limit, 0)
+    return [metadata[i] for i in reversed(_upload_date_order[start:stop])]
 
 def filter_receipts(
     start_date: Optional[datetime] = None,
@@ -177,11 +321,14 @@ def filter_receipts(
     """
     metadata = load_metadata()
     filtered = []
+    upload_dates = record_dates(METADATA_FILE, 'upload_date') if start_date or end_date else None
 
     for receipt in metadata:
         # Date filter
         if start_date or end_date:
-            upload_date = datetime.fromisoformat(receipt['upload_date'])
+            upload_date = upload_dates.get(id(receipt))
+            if upload_date is None:
+                upload_date = datetime.fromisoformat(receipt['upload_date'])
             if start_date and upload_date < start_date:
                 continue
             if end_date and upload_date > end_date:
@@ -194,7 +341,7 @@ def filter_receipts(
         # Category filter
         extracted = receipt.get('extracted_data', {})
         if categories:
-            category = extracted.get('expense_category') or extracted.get('category')
+            category = extracted.get('expense_category')
             if category not in categories:
                 continue
 
@@ -206,7 +353,7 @@ def filter_receipts(
 
         # Amount filter
         if min_amount is not None or max_amount is not None:
-            amount = extracted.get('total_incl_vat') or extracted.get('total_amount', 0)
+            amount = extracted.get('total_incl_vat', 0)
             if min_amount is not None and amount < min_amount:
                 continue
             if max_amount is not None and amount > max_amount:
@@ -227,21 +374,44 @@ def delete_receipt(receipt_id: int) -> bool:
     """
     metadata = load_metadata()
 
-    for idx, receipt in enumerate(metadata):
-        if receipt['id'] == receipt_id:
-            # Delete file
-            file_path = Path(receipt['file_path'])
-            if file_path.exists():
-                file_path.unlink()
+    receipt = lookup(METADATA_FILE, 'id', receipt_id)
+    if not receipt:
+        return False
+
+    # Delete file
+    file_path = Path(receipt['file_path'])
+    if file_path.exists():
+        file_path.unlink()
 
-            # Remove from metadata
-            metadata.pop(idx)
-            save_metadata(metadata)
+    # Remove from metadata
+    metadata.remove(receipt)
+    save_metadata(metadata)
 
-            logger.info(f"Deleted receipt {receipt_id}")
-            return True
+    logger.info(f"Deleted receipt {receipt_id}")
+    return True
 
-    return False
+def _receipt_columns(receipts: List[Dict]) -> Optional[Dict[str, np.ndarray]]:
+    """Column arrays of the receipt fields get_statistics aggregates.
+
+    None if a receipt has a field the arrays cannot hold; get_statistics
+    then aggregates row by row and reports it.
+    """
+    upload_dates = datetime_column(receipts, 'upload_date')
+    if upload_dates is None:
+        return None
+
+    try:
+        completed = np.array([r['processing_status'] == 'completed' for r in receipts], dtype=bool)
+        extracted = [r.get('extracted_data', {}) if done else {} for r, done in zip(receipts, completed)]
+        amounts = np.array([e.get('total_incl_vat', 0) for e in extracted], dtype=np.float64)
+        vat = np.array([
+            e.get('vat_6_amount', 0) + e.get('vat_9_amount', 0) + e.get('vat_21_amount', 0)
+            for e in extracted
+        ], dtype=np.float64)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+    return {'upload_date': upload_dates, 'completed': completed, 'amount': amounts, 'vat': vat}
 
 def get_statistics(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Dict:
     """Get statistics for receipts.
@@ -253,6 +423,17 @@ def get_statistics(start_date: Optional[datetime] = None, end_date: Optional[dat
     Returns:
         Statistics dictionary
     """
+    columns = derived(METADATA_FILE, 'statistics:columns', _receipt_columns)
+    if columns is not None:
+        mask = date_mask(columns['upload_date'], start_date, end_date)
+        completed = mask & columns['completed']
+        return {
+            'total_receipts': int(np.count_nonzero(mask)),
+            'total_amount': float(columns['amount'][completed].sum()),
+            'total_vat': float(columns['vat'][completed].sum()),
+            'processed': int(np.count_nonzero(completed))
+        }
+
     receipts = filter_receipts(start_date=start_date, end_date=end_date)
 
     total_receipts = len(receipts)
@@ -264,21 +445,14 @@ def get_statistics(start_date: Optional[datetime] = None, end_date: Optional[dat
         if receipt['processing_status'] == 'completed':
             processed += 1
             extracted = receipt.get('extracted_data', {})
-            total_amount += extracted.get('total_incl_vat') or extracted.get('total_amount', 0)
-
-            # Calculate VAT
-            vat_6 = extracted.get('vat_6_amount', 0)
-            vat_9 = extracted.get('vat_9_amount', 0)
-            vat_21 = extracted.get('vat_21_amount', 0)
+            total_amount += extracted.get('total_incl_vat', 0)
 
-            # Also check for vat_breakdown format
-            vat_breakdown = extracted.get('vat_breakdown', {})
-            if vat_breakdown:
-                vat_6 = vat_breakdown.get('6', vat_6)
-                vat_9 = vat_breakdown.get('9', vat_9)
-                vat_21 = vat_breakdown.get('21', vat_21)
-
-            total_vat += vat_6 + vat_9 + vat_21
+            # vat_breakdown is folded into these fields on write
+            total_vat += (
+                extracted.get('vat_6_amount', 0)
+                + extracted.get('vat_9_amount', 0)
+                + extracted.get('vat_21_amount', 0)
+            )
 
     return {
         'total_receipts': total_receipts,
@@ -287,14 +461,20 @@ def get_statistics(start_date: Optional[datetime] = None, end_date: Optional[dat
         'processed': processed
     }
 
+def _metadata_version() -> Optional[int]:
+    """Modification time of the metadata file in ns, or None if missing."""
+    try:
+        return METADATA_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
 def load_metadata() -> List[Dict]:
     """Load receipts metadata from JSON file."""
     if not METADATA_FILE.exists():
         return []
 
     try:
-        with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_cached(METADATA_FILE)
     except Exception as e:
         logger.error(f"Error loading metadata: {e}")
         return []
@@ -305,8 +485,7 @@ def save_metadata(metadata: List[Dict]):
         # Clean duplicates before saving
         metadata = cleanup_duplicates(metadata)
 
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        save_cached(METADATA_FILE, metadata)
     except Exception as e:
         logger.error(f"Error saving metadata: {e}")
         raise
@@ -371,8 +550,7 @@ def cleanup_metadata_file():
         metadata = load_metadata()
         cleaned = cleanup_duplicates(metadata)
 
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cleaned, f, indent=2, ensure_ascii=False)
+        save_cached(METADATA_FILE, cleaned)
 
         logger.info(f"Cleaned metadata file: {len(metadata)} -> {len(cleaned)} receipts")
         return True
@@ -391,8 +569,7 @@ def export_to_json(output_path: str) -> bool:
     """
     try:
         metadata = load_metadata()
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        write_json(output_path, metadata)
         logger.info(f"Exported receipts to {output_path}")
         return True
     except Exception as e:
@@ -1,12 +1,16 @@
 """Utility functions for resetting application data."""
 
+import json
 import logging
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 from config import Config
 from database.connection import drop_db, init_db
+from utils.database_utils import clear_settings_caches
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,49 @@ RECEIPTS_DIR = RECEIPT_STORAGE_DIR / "receipts"
 RECEIPTS_METADATA_FILE = RECEIPT_STORAGE_DIR / "receipts_metadata.json"
 
 
+def _delete_file(path: Path):
+    """Delete a file if it exists."""
+    if path.exists():
+        path.unlink()
+        logger.info(f"Deleted {path}")
+
+
+def _count_files(path: Path, suffix: Optional[str] = None) -> int:
+    """Count the files in a directory, optionally only those with a suffix."""
+    with os.scandir(path) as entries:
+        return sum(
+            1 for entry in entries
+            if entry.is_file(follow_symlinks=False) and (suffix is None or entry.name.endswith(suffix))
+        )
+
+
+def _clear_dir(path: Path):
+    """Delete a directory with everything in it and recreate it empty."""
+    if path.exists():
+        shutil.rmtree(path)
+        path.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Deleted all files in {path}")
+
+
+def _reset_database() -> bool:
+    """Drop and recreate the database tables; True if they were recreated."""
+    try:
+        drop_db()
+        logger.info("Database dropped successfully")
+    except Exception as e:
+        logger.warning(f"Could not drop database: {e}")
+
+    try:
+        init_db()
+        # The cached settings rows went with the old tables
+        clear_settings_caches()
+        logger.info("Database recreated successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to recreate database: {e}")
+        return False
+
+
 def hard_reset_all_data() -> Dict[str, bool]:
     """
     Perform a hard reset of all application data.
@@ -38,73 +85,42 @@ def hard_reset_all_data() -> Dict[str, bool]:
     }
 
     try:
-        # 1. Delete receipt data
-        logger.info("Deleting receipt data...")
-        receipts_metadata = Path(RECEIPTS_METADATA_FILE)
-        if receipts_metadata.exists():
-            receipts_metadata.unlink()
-            logger.info(f"Deleted {receipts_metadata}")
-
-        receipts_dir = Path(RECEIPTS_DIR)
-        if receipts_dir.exists():
-            for file in receipts_dir.iterdir():
-                if file.is_file():
-                    file.unlink()
-            logger.info(f"Deleted all files in {receipts_dir}")
-
+        # 1-4. Delete receipt data, invoice data and exchange rate cache, and
+        # reset the database. These are independent, so they run concurrently;
+        # the database goes first so it does not queue behind the deletes.
+        logger.info("Deleting receipt data, invoice data and exchange rate cache...")
+        logger.info("Resetting database...")
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            database_job = pool.submit(_reset_database)
+            receipt_jobs = [
+                pool.submit(_delete_file, Path(RECEIPTS_METADATA_FILE)),
+                pool.submit(_clear_dir, Path(RECEIPTS_DIR))
+            ]
+            invoice_jobs = [
+                pool.submit(_delete_file, Path("invoice_data/invoices_metadata.json")),
+                pool.submit(_delete_file, Path("invoice_data/clients.json")),
+                pool.submit(_delete_file, Path("invoice_data/invoice_settings.json")),
+                pool.submit(_clear_dir, Path("invoice_data/invoices"))
+            ]
+            cache_jobs = [
+                pool.submit(_delete_file, Path("temp/exchange_rates_cache.json"))
+            ]
+
+        results['database_reset'] = database_job.result()
+
+        # result() re-raises the error of a failed delete
+        for job in receipt_jobs:
+            job.result()
         results['receipts_deleted'] = True
 
-        # 2. Delete invoice data
-        logger.info("Deleting invoice data...")
-        invoice_metadata = Path("invoice_data/invoices_metadata.json")
-        if invoice_metadata.exists():
-            invoice_metadata.unlink()
-            logger.info(f"Deleted {invoice_metadata}")
-
-        clients_file = Path("invoice_data/clients.json")
-        if clients_file.exists():
-            clients_file.unlink()
-            logger.info(f"Deleted {clients_file}")
-
-        settings_file = Path("invoice_data/invoice_settings.json")
-        if settings_file.exists():
-            settings_file.unlink()
-            logger.info(f"Deleted {settings_file}")
-
-        invoices_dir = Path("invoice_data/invoices")
-        if invoices_dir.exists():
-            for file in invoices_dir.iterdir():
-                if file.is_file():
-                    file.unlink()
-            logger.info(f"Deleted all files in {invoices_dir}")
-
+        for job in invoice_jobs:
+            job.result()
         results['invoices_deleted'] = True
 
-        # 3. Delete exchange rate cache
-        logger.info("Deleting exchange rate cache...")
-        cache_file = Path("temp/exchange_rates_cache.json")
-        if cache_file.exists():
-            cache_file.unlink()
-            logger.info(f"Deleted {cache_file}")
-
+        for job in cache_jobs:
+            job.result()
         results['cache_deleted'] = True
 
-        # 4. Reset database
-        logger.info("Resetting database...")
-        try:
-            drop_db()
-            logger.info("Database dropped successfully")
-        except Exception as e:
-            logger.warning(f"Could not drop database: {e}")
-
-        try:
-            init_db()
-            logger.info("Database recreated successfully")
-            results['database_reset'] = True
-        except Exception as e:
-            logger.error(f"Failed to recreate database: {e}")
-            results['database_reset'] = False
-
         # Check if all operations succeeded
         results['success'] = all([
             results['receipts_deleted'],
@@ -145,26 +161,24 @@ def get_data_statistics() -> Dict:
         # Count receipts
         receipts_metadata = Path(RECEIPTS_METADATA_FILE)
         if receipts_metadata.exists():
-            import json
             with open(receipts_metadata, 'r', encoding='utf-8') as f:
                 receipts = json.load(f)
                 stats['receipt_count'] = len(receipts)
 
         receipts_dir = Path(RECEIPTS_DIR)
         if receipts_dir.exists():
-            stats['receipt_files'] = len(list(receipts_dir.glob('*.*')))
+            stats['receipt_files'] = _count_files(receipts_dir)
 
         # Count invoices
         invoice_metadata = Path("invoice_data/invoices_metadata.json")
         if invoice_metadata.exists():
-            import json
             with open(invoice_metadata, 'r', encoding='utf-8') as f:
                 invoices = json.load(f)
                 stats['invoice_count'] = len(invoices)
 
         invoices_dir = Path("invoice_data/invoices")
         if invoices_dir.exists():
-            stats['invoice_files'] = len(list(invoices_dir.glob('*.pdf')))
+            stats['invoice_files'] = _count_files(invoices_dir, '.pdf')
 
     except Exception as e:
         logger.error(f"Failed to get data statistics: {e}")
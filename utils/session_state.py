@@ -1,73 +1,100 @@
 """Session state management for Streamlit app."""
 
+import heapq
+from collections import deque
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from time import monotonic as _monotonic
 import streamlit as st
 from datetime import datetime
-from typing import Any, Dict
-
-def init_session_state():
-    """Initialize session state variables."""
-
+from typing import Any, Dict, List, Optional
+
+# Bound once: the helpers below run on every Streamlit rerun
+_now = datetime.now
+
+@dataclass(frozen=True, slots=True)
+class StatusEntry:
+    """Processing status of an uploaded file, as kept in processing_status."""
+    status: str
+    details: Dict = field(default_factory=dict)
+    updated_at: Optional[datetime] = field(default_factory=datetime.now)
+    # Monotonic deadline after which a finished status is dropped
+    expires_at: Optional[float] = None
+
+# Returned by get_processing_status for files without a status
+_EMPTY_STATUS = StatusEntry(status='unknown', details=MappingProxyType({}), updated_at=None)
+
+# get_user_info fields and the session keys they are read from
+_USER_INFO_KEYS = (
+    ('user_id', 'user_id'),
+    ('email', 'user_email'),
+    ('name', 'user_name'),
+    ('company', 'company_name')
+)
+_USER_INFO_SESSION_KEYS = tuple(key for _, key in _USER_INFO_KEYS)
+
+# Most recent uploads kept in a session's uploaded_files
+MAX_UPLOADED_FILES = 500
+
+# Most entries kept in a session's analytics cache
+MAX_ANALYTICS_CACHE_ENTRIES = 64
+
+# Seconds a completed or failed processing status is kept in the session
+PROCESSING_STATUS_TTL_SECONDS = 3600
+
+# Default session state values. The dict values are read-only templates;
+# init_session_state gives each session its own copy of them.
+# Containers only some pages use (uploaded_files, processing_status,
+# selected_categories, selected_receipts, the analytics cache and temp_data)
+# are left out and created when first written.
+_DEFAULTS = {
     # User session
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
-
-    if 'user_id' not in st.session_state:
-        st.session_state.user_id = None
-
-    if 'user_email' not in st.session_state:
-        st.session_state.user_email = None
-
-    if 'user_name' not in st.session_state:
-        st.session_state.user_name = "Demo User"
-
-    if 'company_name' not in st.session_state:
-        st.session_state.company_name = "Demo Company"
+    'authenticated': False,
+    'user_id': None,
+    'user_email': None,
+    'user_name': "Demo User",
+    'company_name': "Demo Company",
 
     # Upload session
-    if 'uploaded_files' not in st.session_state:
-        st.session_state.uploaded_files = []
-
-    if 'processing_status' not in st.session_state:
-        st.session_state.processing_status = {}
-
-    if 'current_batch_id' not in st.session_state:
-        st.session_state.current_batch_id = None
+    'current_batch_id': None,
 
     # Filters and selections
-    if 'date_range' not in st.session_state:
-        st.session_state.date_range = {
-            'start': None,
-            'end': None
-        }
+    'date_range': MappingProxyType({
+        'start': None,
+        'end': None
+    }),
 
-    if 'selected_categories' not in st.session_state:
-        st.session_state.selected_categories = []
+    # Settings
+    'user_settings': MappingProxyType({
+        'language': 'nl',
+        'timezone': 'Europe/Amsterdam',
+        'date_format': 'DD-MM-YYYY',
+        'currency': 'EUR',
+        'auto_categorize': True,
+        'auto_extract': True,
+        'email_notifications': True
+    })
+}
 
-    if 'selected_receipts' not in st.session_state:
-        st.session_state.selected_receipts = []
+def init_session_state():
+    """Initialize session state variables.
 
-    # Analytics cache
-    if 'analytics_cache' not in st.session_state:
-        st.session_state.analytics_cache = {}
+    Runs once per session; reruns return on the '_initialized' sentinel.
+    clear_session_state removes the sentinel with everything else.
+    """
+    if st.session_state.get('_initialized'):
+        return
 
-    if 'last_refresh' not in st.session_state:
-        st.session_state.last_refresh = datetime.now()
+    missing = _DEFAULTS.keys() - st.session_state.keys()
+    for key in missing:
+        value = _DEFAULTS[key]
+        # The templates are flat, so a shallow copy is a private one
+        st.session_state[key] = dict(value) if isinstance(value, MappingProxyType) else value
 
-    # Settings
-    if 'user_settings' not in st.session_state:
-        st.session_state.user_settings = {
-            'language': 'nl',
-            'timezone': 'Europe/Amsterdam',
-            'date_format': 'DD-MM-YYYY',
-            'currency': 'EUR',
-            'auto_categorize': True,
-            'auto_extract': True,
-            'email_notifications': True
-        }
-
-    # Temporary data
-    if 'temp_data' not in st.session_state:
-        st.session_state.temp_data = {}
+    # Set when the session starts, so it has no static default
+    st.session_state.setdefault('last_refresh', _now())
+
+    st.session_state['_initialized'] = True
 
 def get_session_value(key: str, default: Any = None) -> Any:
     """
@@ -82,6 +109,20 @@ def get_session_value(key: str, default: Any = None) -> Any:
     """
     return st.session_state.get(key, default)
 
+def get_session_values(keys, default: Any = None) -> Dict[str, Any]:
+    """
+    Get several values from session state in one pass.
+
+    Args:
+        keys: Keys to retrieve
+        default: Default value for keys that don't exist
+
+    Returns:
+        Dictionary of key-value pairs
+    """
+    session = st.session_state
+    return {key: session.get(key, default) for key in keys}
+
 def set_session_value(key: str, value: Any) -> None:
     """
     Set value in session state.
@@ -91,6 +132,7 @@ def set_session_value(key: str, value: Any) -> None:
         value: Value to store
     """
     st.session_state[key] = value
+    _invalidate_user_info((key,))
 
 def update_session_values(updates: Dict[str, Any]) -> None:
     """
@@ -99,32 +141,53 @@ def update_session_values(updates: Dict[str, Any]) -> None:
     Args:
         updates: Dictionary of key-value pairs to update
     """
-    for key, value in updates.items():
-        st.session_state[key] = value
+    st.session_state.update(updates)
+    _invalidate_user_info(updates)
+
+def update_user_settings(changes: Dict[str, Any]) -> None:
+    """
+    Update user settings.
+
+    The settings dict is replaced rather than changed in place, so no other
+    reference to it sees the update.
+
+    Args:
+        changes: Settings to change
+    """
+    st.session_state.user_settings = {**st.session_state.get('user_settings', {}), **changes}
 
 def clear_session_state():
     """Clear all session state variables."""
-    for key in list(st.session_state.keys()):
-        del st.session_state[key]
+    st.session_state.clear()
     init_session_state()
 
 def clear_temp_data():
     """Clear temporary session data."""
-    if 'temp_data' in st.session_state:
-        st.session_state.temp_data = {}
+    st.session_state['temp_data'] = {}
 
 def is_authenticated() -> bool:
     """Check if user is authenticated."""
     return st.session_state.get('authenticated', False)
 
 def get_user_info() -> Dict[str, Any]:
-    """Get current user information from session."""
-    return {
-        'user_id': st.session_state.get('user_id'),
-        'email': st.session_state.get('user_email'),
-        'name': st.session_state.get('user_name'),
-        'company': st.session_state.get('company_name')
-    }
+    """Get current user information from session.
+
+    The snapshot is read-only and kept in the session until one of its
+    fields is set through this module.
+    """
+    info = st.session_state.get('_user_info_cache')
+    if info is None:
+        values = get_session_values(_USER_INFO_SESSION_KEYS)
+        info = MappingProxyType({
+            field: values[key] for field, key in _USER_INFO_KEYS
+        })
+        st.session_state['_user_info_cache'] = info
+    return info
+
+def _invalidate_user_info(keys):
+    """Drop the get_user_info snapshot if any of the keys feed it."""
+    if any(key in _USER_INFO_SESSION_KEYS for key in keys):
+        st.session_state.pop('_user_info_cache', None)
 
 def set_user_info(user_data: Dict[str, Any]):
     """Set user information in session."""
@@ -133,16 +196,44 @@ def set_user_info(user_data: Dict[str, Any]):
     st.session_state.user_email = user_data.get('email')
     st.session_state.user_name = user_data.get('name')
     st.session_state.company_name = user_data.get('company')
+    st.session_state.pop('_user_info_cache', None)
 
 def logout():
     """Logout user and clear session."""
-    st.session_state.authenticated = False
-    st.session_state.user_id = None
-    st.session_state.user_email = None
-    st.session_state.user_name = None
-    st.session_state.company_name = None
+    # Nothing to reset for a session that is not logged in
+    if not st.session_state.get('authenticated'):
+        clear_temp_data()
+        return
+
+    st.session_state.update({
+        'authenticated': False,
+        'user_id': None,
+        'user_email': None,
+        'user_name': None,
+        'company_name': None
+    })
+    st.session_state.pop('_user_info_cache', None)
     clear_temp_data()
 
+def _reap_analytics():
+    """Drop the expired analytics cache entries, in deadline order.
+
+    A heap item whose key was cached again since carries an old deadline
+    and is skipped.
+    """
+    heap = st.session_state.get('_analytics_heap')
+    if not heap:
+        return
+
+    data = st.session_state.analytics_cache_data
+    expiry = st.session_state.analytics_cache_expiry
+    now = _monotonic()
+    while heap and heap[0][0] <= now:
+        expires_at, key = heapq.heappop(heap)
+        if expiry.get(key) == expires_at:
+            del expiry[key]
+            del data[key]
+
 def cache_analytics_data(key: str, data: Any, ttl_seconds: int = 300):
     """
     Cache analytics data with TTL.
@@ -152,14 +243,26 @@ def cache_analytics_data(key: str, data: Any, ttl_seconds: int = 300):
         data: Data to cache
         ttl_seconds: Time to live in seconds
     """
-    if 'analytics_cache' not in st.session_state:
-        st.session_state.analytics_cache = {}
-
-    st.session_state.analytics_cache[key] = {
-        'data': data,
-        'timestamp': datetime.now(),
-        'ttl': ttl_seconds
-    }
+    # Parallel key -> data and key -> expires_at dicts, and a min-heap of
+    # the (expires_at, key) deadlines
+    cache_data = st.session_state.setdefault('analytics_cache_data', {})
+    cache_expiry = st.session_state.setdefault('analytics_cache_expiry', {})
+    heap = st.session_state.setdefault('_analytics_heap', [])
+
+    _reap_analytics()
+
+    # Deadline on the monotonic clock, unaffected by wall-clock changes
+    expires_at = _monotonic() + ttl_seconds
+    cache_data[key] = data
+    cache_expiry[key] = expires_at
+    heapq.heappush(heap, (expires_at, key))
+
+    # Over the cap, evict the entries closest to their deadline first
+    while len(cache_data) > MAX_ANALYTICS_CACHE_ENTRIES:
+        old_expires_at, old_key = heapq.heappop(heap)
+        if cache_expiry.get(old_key) == old_expires_at:
+            del cache_expiry[old_key]
+            del cache_data[old_key]
 
 def get_cached_analytics(key: str) -> Any:
     """
@@ -171,39 +274,43 @@ def get_cached_analytics(key: str) -> Any:
     Returns:
         Cached data or None if expired/not found
     """
-    if 'analytics_cache' not in st.session_state:
-        return None
-
-    if key not in st.session_state.analytics_cache:
+    expires_at = st.session_state.get('analytics_cache_expiry', {}).get(key)
+    if expires_at is None:
         return None
 
-    cache_entry = st.session_state.analytics_cache[key]
-    age_seconds = (datetime.now() - cache_entry['timestamp']).total_seconds()
-
-    if age_seconds > cache_entry['ttl']:
-        # Cache expired
-        del st.session_state.analytics_cache[key]
+    # Expired at the deadline itself, the same as in _reap_analytics
+    if expires_at <= _monotonic():
+        _reap_analytics()
         return None
 
-    return cache_entry['data']
+    return st.session_state.analytics_cache_data[key]
 
 def add_uploaded_file(file_info: Dict[str, Any]):
     """Add file to uploaded files list."""
-    if 'uploaded_files' not in st.session_state:
-        st.session_state.uploaded_files = []
+    add_uploaded_files([file_info])
 
-    st.session_state.uploaded_files.append({
-        **file_info,
-        'timestamp': datetime.now()
-    })
+def add_uploaded_files(file_infos: List[Dict[str, Any]]):
+    """
+    Add a batch of files to the uploaded files list.
+
+    Args:
+        file_infos: File information dictionaries, all stamped with the same timestamp
+    """
+    uploaded_files = st.session_state.setdefault('uploaded_files', deque(maxlen=MAX_UPLOADED_FILES))
+
+    # The oldest uploads drop out once MAX_UPLOADED_FILES is reached
+    timestamp = _now()
+    uploaded_files.extend(
+        {**file_info, 'timestamp': timestamp} for file_info in file_infos
+    )
 
 def get_uploaded_files():
     """Get list of uploaded files."""
-    return st.session_state.get('uploaded_files', [])
+    return list(st.session_state.get('uploaded_files', []))
 
 def clear_uploaded_files():
     """Clear uploaded files list."""
-    st.session_state.uploaded_files = []
+    st.session_state.uploaded_files = deque(maxlen=MAX_UPLOADED_FILES)
 
 def update_processing_status(file_id: str, status: str, details: Dict = None):
     """
@@ -214,18 +321,29 @@ def update_processing_status(file_id: str, status: str, details: Dict = None):
         status: Processing status
         details: Additional status details
     """
-    if 'processing_status' not in st.session_state:
-        st.session_state.processing_status = {}
-
-    st.session_state.processing_status[file_id] = {
-        'status': status,
-        'details': details or {},
-        'updated_at': datetime.now()
-    }
-
-def get_processing_status(file_id: str) -> Dict:
-    """Get processing status for a file."""
-    if 'processing_status' not in st.session_state:
-        return None
+    statuses = st.session_state.setdefault('processing_status', {})
+    now = _monotonic()
+
+    # Drop finished statuses that have outlived their TTL
+    expired = [
+        fid for fid, entry in statuses.items()
+        if entry.expires_at is not None and entry.expires_at < now
+    ]
+    for fid in expired:
+        del statuses[fid]
+
+    statuses[file_id] = StatusEntry(
+        status=status,
+        details=details or {},
+        updated_at=_now(),
+        expires_at=now + PROCESSING_STATUS_TTL_SECONDS if status in ('completed', 'failed') else None
+    )
+
+def get_processing_status(file_id: str) -> StatusEntry:
+    """
+    Get processing status for a file.
 
-    return st.session_state.processing_status.get(file_id)
\ No newline at end of file
+    Files without a status get the shared read-only _EMPTY_STATUS entry
+    (status 'unknown'), so callers can read .status without a None check.
+    """
+    return st.session_state.get('processing_status', {}).get(file_id, _EMPTY_STATUS)
\ No newline at end of file